@@ -13,6 +13,9 @@ from ._mm_server import MastermindServerUDP
 from ._mm_server import MastermindServerCallbacksEcho
 from ._mm_server import MastermindServerCallbacksDebug
 
+from ._mm_reliable import MastermindClientReliableUDP
+from ._mm_reliable import MastermindServerReliableUDP
+
 from ._mm_errors import MastermindError
 from ._mm_errors import MastermindErrorClient
 from ._mm_errors import MastermindErrorServer
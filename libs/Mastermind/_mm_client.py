@@ -1,5 +1,6 @@
 import socket
 import select
+import zlib
 
 from libs.Mastermind import _mm_netutil as netutil
 from ._mm_constants import *
@@ -97,10 +98,32 @@ class MastermindClientTCP(MastermindClientBase):
             self._mm_socket.close()
             raise MastermindErrorSocket(
                 "A TCP connection to \"" + ip + "\" on port " + str(port) + " could not be established.")
+        self._mm_reader = netutil.FrameReader()
 
     def _mm_receive_func(self):
-        data, status = netutil.packet_recv_tcp(self._mm_socket)
-        return data, status
+        # Reads until a packet is complete, the payload is a view into the buffer of the reader and is valid until
+        # the next call of .receive()
+        try:
+            data = self._mm_reader.next_frame()
+            while data is None:
+                if self._mm_reader.read(self._mm_socket) == 0:
+                    return None, False
+                data = self._mm_reader.next_frame()
+        except (OSError, ValueError, zlib.error):
+            return None, False
+        return data, True
+
+    def receive(self, blocking=True):
+        # a previous read may have completed more than one packet already
+        if self._mm_connected:
+            try:
+                data = self._mm_reader.next_frame()
+            except (ValueError, zlib.error):
+                raise MastermindErrorClient(
+                    "Client receiving has failed!  Call .disconnect() and then .connect() to try to reestablish the connection.")
+            if data is not None:
+                return data
+        return super(MastermindClientTCP, self).receive(blocking)
 
 
 class MastermindClientUDP(MastermindClientBase):
@@ -1,13 +1,17 @@
-try:
-    import cPickle as pickle  # Only present in Python 2.*; Python 3 automatically imports the
-except:
-    import pickle as pickle  # new equivalent of cPickle, if it's available.
+import struct
 import zlib
 
 from libs.Mastermind._mm_constants import *
 
+# Every packet starts with the compression level, the kind of payload and its length.  The payload itself is sent as
+# it is, nothing received from the network gets unpickled.
+HEADER = struct.Struct("!BBI")
+KIND_BYTES = 0
+KIND_TEXT = 1
+MAX_PACKET_SIZE = 64 * 1024 * 1024
 
-def packet_send(socket, protocol_and_udpaddress, data, compression):  # E.g.: =(MM_TCP,None)
+
+def packet_encode(data, compression):
     if compression == False:
         compression = 0
     elif compression == None:
@@ -17,16 +21,90 @@ def packet_send(socket, protocol_and_udpaddress, data, compression):  # E.g.: =(
     elif compression == MM_MAX:
         compression = 9
 
-    data_to_send = str(compression).encode()  # length is now 1
+    if isinstance(data, str):
+        kind, data_str = KIND_TEXT, data.encode("utf-8")
+    elif isinstance(data, (bytes, bytearray, memoryview)):
+        kind, data_str = KIND_BYTES, bytes(data)
+    else:
+        raise TypeError("Mastermind only sends bytes or str, encode %s first!" % type(data).__name__)
 
-    data_str = pickle.dumps(data)
     if compression != 0:
         data_str = zlib.compress(data_str, compression)
 
-    length_str = str(len(data_str)).encode()
-    data_to_send += (16 - len(length_str)) * b" "
-    data_to_send += length_str  # length is now 17
-    data_to_send += data_str  # length is now 17+len(data_str)
+    return HEADER.pack(compression, kind, len(data_str)) + data_str
+
+
+def payload_decode(compression, kind, data_str):
+    if compression != 0:
+        data_str = zlib.decompress(data_str)
+
+    if kind == KIND_TEXT:
+        return str(data_str, "utf-8")
+    return data_str
+
+
+def packet_decode(info, data_str):
+    compression, kind, length = HEADER.unpack(info)
+    return payload_decode(compression, kind, data_str)
+
+
+class FrameReader(object):
+    # Reads the packets of a stream socket into one buffer that is reused.  recv_into fills the free space behind
+    # what is there already, one read can complete several packets and every payload is handed out as a view into
+    # the buffer, nothing is copied unless it was compressed or is text.  A view is only valid until the next read().
+    def __init__(self, size=65536, max_packet_size=MAX_PACKET_SIZE):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+        self.max_packet_size = max_packet_size
+
+    def read(self, socket):
+        # Receives what the socket has, returns the number of bytes, 0 if the other side closed the connection
+        self._make_room()
+        received = socket.recv_into(self.view[self.end:])
+        self.end += received
+        return received
+
+    def next_frame(self):
+        # The payload of the next complete packet or None
+        if self.end - self.start < HEADER.size:
+            return None
+        compression, kind, length = HEADER.unpack_from(self.buffer, self.start)
+        if length > self.max_packet_size:
+            raise ValueError("packet of " + str(length) + " bytes is too large")
+        frame_end = self.start + HEADER.size + length
+        if frame_end > self.end:
+            return None
+        data_str = self.view[self.start + HEADER.size:frame_end]
+        self.start = frame_end
+        return payload_decode(compression, kind, data_str)
+
+    def _make_room(self):
+        pending = self.end - self.start
+        if pending == 0:
+            self.start = self.end = 0
+        needed = HEADER.size
+        if pending >= HEADER.size:
+            needed += HEADER.unpack_from(self.buffer, self.start)[2]
+        if self.end < len(self.buffer) and self.start + needed <= len(self.buffer):
+            return
+
+        if needed <= len(self.buffer):
+            # move the unfinished packet to the front
+            self.buffer[:pending] = self.buffer[self.start:self.end]
+        else:
+            # a packet larger than the buffer gets a buffer of its own size, it is received in one piece
+            buffer = bytearray(max(needed, 2 * len(self.buffer)))
+            buffer[:pending] = self.view[self.start:self.end]
+            self.buffer = buffer
+            self.view = memoryview(buffer)
+        self.start = 0
+        self.end = pending
+
+
+def packet_send(socket, protocol_and_udpaddress, data, compression):  # E.g.: =(MM_TCP,None)
+    data_to_send = packet_encode(data, compression)
 
     try:
         if protocol_and_udpaddress[0] == MM_TCP:
@@ -35,54 +113,17 @@ def packet_send(socket, protocol_and_udpaddress, data, compression):  # E.g.: =(
             if protocol_and_udpaddress[1] == None:
                 socket.sendall(data_to_send)
             else:
-                socket.sendto(data_to_send, protocol_and_udpaddress[1])
+                try:
+                    socket.sendto(data_to_send, protocol_and_udpaddress[1])
+                except (BlockingIOError, InterruptedError):
+                    pass  # a full send buffer drops the datagram like the network would, nobody waits for it
         return True
     except:
         return False
 
 
-def packet_recv_tcp(socket):
-    # TODO: In all this, if recv returns 0, then shutdown *nicely*
-    info = b""
-    try:
-        while len(info) < 17:
-            got = socket.recv(17)
-            if got == b"": return (None, False)
-            info += got
-    except:
-        return (None, False)
-    if info == b"": return (None, False)
-
-    compression = int(info[0:1])
-    length = int(info[1:])
-
-    data_str = b""
-    try:
-        while len(data_str) < length:
-            got = socket.recv(length)
-            if got == b"": return (None, False)
-            data_str += got
-    except:
-        return (None, False)
-    if compression != 0:
-        data_str = zlib.decompress(data_str)
-
-    data = pickle.loads(data_str)
-
-    return data, True
-
-
 def packet_recv_udp(socket, max_packet_size):
     data_str, address = socket.recvfrom(max_packet_size)
-    info = data_str[0:17]
-    data_str = data_str[17:]
-
-    compression = int(info[0:1])
-    length = int(info[1:])
-
-    if compression != 0:
-        data_str = zlib.decompress(data_str)
-
-    data = pickle.loads(data_str)
+    view = memoryview(data_str)
 
-    return data, address
+    return packet_decode(view[:HEADER.size], view[HEADER.size:]), address
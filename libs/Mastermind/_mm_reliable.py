@@ -0,0 +1,284 @@
+import select
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+from libs.Mastermind import _mm_netutil as netutil
+from ._mm_client import MastermindClientUDP
+from ._mm_server import MastermindServerUDP, MastermindConnectionThreadUDP
+from ._mm_constants import *
+from ._mm_errors import *
+
+# Every datagram starts with its sequence number, the newest sequence number received from the other side, a bit
+# field telling which of the 32 sequence numbers before that one were received, the id of the reliable message it
+# carries and some flags.  Reliable messages are resent until a packet carrying them is acknowledged and handed to
+# the application in the order they were sent.  All other messages are sequenced: they are dropped if a newer one
+# arrived first.
+RELIABLE_HEADER = struct.Struct("!HHIHB")
+FLAG_RELIABLE = 1
+FLAG_ACK = 2
+FLAG_CLOSE = 4
+SEQUENCE_LIMIT = 0x10000
+ACK_WINDOW = 32
+MAX_PACKET_SIZE = 65507
+
+
+def sequence_newer(a, b):
+    # Whether sequence number a was sent after b, the numbers wrap around
+    return a != b and (a - b) % SEQUENCE_LIMIT < SEQUENCE_LIMIT // 2
+
+
+def payload_bytes(data):
+    if isinstance(data, str):
+        return data.encode("utf-8")
+    return bytes(data)
+
+
+class MastermindReliableChannel(object):
+    def __init__(self, resend_time=0.1):
+        self.lock = threading.Lock()
+        self.resend_time = resend_time
+        # an empty packet is sent to acknowledge received messages if there was nothing else to send for this long
+        self.ack_time = resend_time / 2
+
+        self.local_sequence = 0
+        self.remote_sequence = None
+        self.received_bits = 0
+        self.ack_pending = False
+        self.last_sent = 0.0
+
+        self.next_reliable_id = 0
+        self.sent_reliable = {}  # sequence number -> id of the reliable message the packet carried
+        self.unacked = {}  # reliable message id -> [payload, time it was sent the last time]
+
+        self.next_delivery = 0
+        self.held_back = {}  # reliable message id -> payload that arrived before the ones sent earlier
+        self.newest_sequenced = None
+
+    def wrap(self, payload, reliable=False):
+        with self.lock:
+            reliable_id = None
+            if reliable:
+                reliable_id = self.next_reliable_id
+                self.next_reliable_id = (reliable_id + 1) % SEQUENCE_LIMIT
+                self.unacked[reliable_id] = [payload, 0.0]
+            return self._mm_packet(payload, reliable_id)
+
+    def close_packet(self):
+        with self.lock:
+            return self._mm_packet(b"", None, FLAG_CLOSE)
+
+    def due(self, now):
+        # Resends all reliable messages that weren't acknowledged in time, acknowledges if nothing else went out
+        with self.lock:
+            packets = [self._mm_packet(entry[0], reliable_id) for reliable_id, entry in list(self.unacked.items())
+                       if now - entry[1] >= self.resend_time]
+            if not packets and self.ack_pending and now - self.last_sent >= self.ack_time:
+                packets.append(self._mm_packet(b"", None))
+            return packets
+
+    def unwrap(self, packet):
+        # Returns the payloads for the application and whether the other side closed the connection
+        sequence, ack, ack_bits, reliable_id, flags = RELIABLE_HEADER.unpack_from(packet)
+        payload = bytes(packet[RELIABLE_HEADER.size:])
+
+        with self.lock:
+            if flags & FLAG_ACK:
+                self._mm_acknowledged(ack, ack_bits)
+            if not self._mm_received(sequence):
+                return [], False
+            if flags & FLAG_RELIABLE or payload:
+                self.ack_pending = True
+
+            if flags & FLAG_RELIABLE:
+                if reliable_id != self.next_delivery and not sequence_newer(reliable_id, self.next_delivery):
+                    return [], False  # delivered already
+                self.held_back[reliable_id] = payload
+                payloads = []
+                while self.next_delivery in self.held_back:
+                    payloads.append(self.held_back.pop(self.next_delivery))
+                    self.next_delivery = (self.next_delivery + 1) % SEQUENCE_LIMIT
+                return [delivered for delivered in payloads if delivered], bool(flags & FLAG_CLOSE)
+
+            if payload:
+                if self.newest_sequenced is not None and not sequence_newer(sequence, self.newest_sequenced):
+                    return [], bool(flags & FLAG_CLOSE)  # a newer one arrived first
+                self.newest_sequenced = sequence
+                return [payload], bool(flags & FLAG_CLOSE)
+            return [], bool(flags & FLAG_CLOSE)
+
+    def _mm_packet(self, payload, reliable_id, flags=0):
+        sequence = self.local_sequence
+        self.local_sequence = (sequence + 1) % SEQUENCE_LIMIT
+        # packets that far back can't be acknowledged anymore, their reliable messages get resent anyway
+        self.sent_reliable.pop((sequence - ACK_WINDOW - 1) % SEQUENCE_LIMIT, None)
+
+        if reliable_id is not None:
+            flags |= FLAG_RELIABLE
+            self.sent_reliable[sequence] = reliable_id
+            self.unacked[reliable_id][1] = time.time()
+        if self.remote_sequence is not None:
+            flags |= FLAG_ACK
+
+        self.ack_pending = False
+        self.last_sent = time.time()
+        return RELIABLE_HEADER.pack(sequence, self.remote_sequence or 0, self.received_bits, reliable_id or 0,
+                                    flags) + payload
+
+    def _mm_received(self, sequence):
+        # Marks a sequence number as received, False if it was received before or is too old to tell
+        if self.remote_sequence is None:
+            self.remote_sequence = sequence
+            return True
+
+        if sequence_newer(sequence, self.remote_sequence):
+            shift = (sequence - self.remote_sequence) % SEQUENCE_LIMIT
+            if shift <= ACK_WINDOW:
+                self.received_bits = ((self.received_bits << shift) | (1 << (shift - 1))) & 0xFFFFFFFF
+            else:
+                self.received_bits = 0
+            self.remote_sequence = sequence
+            return True
+
+        behind = (self.remote_sequence - sequence) % SEQUENCE_LIMIT
+        if behind == 0 or behind > ACK_WINDOW or self.received_bits & (1 << (behind - 1)):
+            return False
+        self.received_bits |= 1 << (behind - 1)
+        return True
+
+    def _mm_acknowledged(self, ack, ack_bits):
+        for sequence in list(self.sent_reliable):
+            behind = (ack - sequence) % SEQUENCE_LIMIT
+            if behind == 0 or (behind <= ACK_WINDOW and ack_bits & (1 << (behind - 1))):
+                self.unacked.pop(self.sent_reliable.pop(sequence), None)
+
+
+class MastermindConnectionThreadReliableUDP(MastermindConnectionThreadUDP):
+    def __init__(self, server, address):
+        MastermindConnectionThreadUDP.__init__(self, server, address)
+        self.channel = MastermindReliableChannel(server._mm_resend_time)
+
+    def receive_packet(self, packet):
+        payloads, closed = self.channel.unwrap(packet)
+
+        self.mutex.acquire()
+        self.amount_waiting = 0.0
+        self.mutex.release()
+
+        for payload in payloads:
+            self.handle(payload)
+        if closed:
+            self.terminate()
+
+
+class MastermindServerReliableUDP(MastermindServerUDP):
+    def __init__(self, time_server_refresh=0.5, time_connection_refresh=0.5, time_connection_timeout=5.0,
+                 resend_time=0.1):
+        MastermindServerUDP.__init__(self, time_server_refresh, time_connection_refresh, time_connection_timeout,
+                                     MAX_PACKET_SIZE)
+        self._mm_resend_time = resend_time
+
+    def callback_client_send(self, connection_object, data, compression=None, reliable=False):
+        packet = connection_object.channel.wrap(payload_bytes(data), reliable)
+        return MastermindServerUDP.callback_client_send(self, connection_object, packet, compression)
+
+    def disconnect_clients(self):
+        for address, connection in list(self._mm_connections.items()):
+            netutil.packet_send(self._mm_server_socket, (MM_UDP, address), connection.channel.close_packet(), None)
+        MastermindServerUDP.disconnect_clients(self)
+
+    def accepting_allow_wait_forever(self):
+        while self._mm_should_run:
+            input_ready, output_ready, except_ready = select.select([self._mm_server_socket], [], [],
+                                                                    self._mm_resend_time / 2)
+            if input_ready != []:
+                try:
+                    packet, address = netutil.packet_recv_udp(self._mm_server_socket, self._mm_max_packet_size)
+                    RELIABLE_HEADER.unpack_from(packet)
+                except Exception:
+                    continue  # not one of ours
+
+                connection = self._mm_connections.get(address)
+                if connection is None or not connection.handling:
+                    connection = MastermindConnectionThreadReliableUDP(self, address)
+                    connection.thread = threading.Thread(target=connection.run_forever)
+                    connection.thread.start()
+                    connection.started.wait()
+                    self._mm_connections[address] = connection
+                connection.receive_packet(packet)
+
+            now = time.time()
+            for address, connection in list(self._mm_connections.items()):
+                if connection.handling:
+                    for packet in connection.channel.due(now):
+                        netutil.packet_send(self._mm_server_socket, (MM_UDP, address), packet, None)
+
+
+class MastermindClientReliableUDP(MastermindClientUDP):
+    def __init__(self, timeout_connect=None, timeout_receive=None, resend_time=0.1):
+        MastermindClientUDP.__init__(self, timeout_connect, timeout_receive)
+        self._mm_resend_time = resend_time
+        self._mm_channel = None
+        self._mm_received = deque()
+
+    def connect(self, ip, port):
+        if self._mm_connected:
+            MastermindWarningClient("Client is already connected!  Ignoring .connect(...).")
+            return
+        self._mm_channel = MastermindReliableChannel(self._mm_resend_time)
+        self._mm_received.clear()
+        MastermindClientUDP.connect(self, ip, port)
+        # The server only learns about a client from its packets, this one is resent until the server has it
+        self.send(b"", reliable=True)
+
+    def disconnect(self):
+        if self._mm_connected:
+            netutil.packet_send(self._mm_socket, (MM_UDP, None), self._mm_channel.close_packet(), None)
+        MastermindClientUDP.disconnect(self)
+
+    def send(self, data, compression=None, reliable=False):
+        if not self._mm_connected:
+            raise MastermindErrorClient("Client must be connected with .connect() to send data!")
+
+        packet = self._mm_channel.wrap(payload_bytes(data), reliable)
+        if not netutil.packet_send(self._mm_socket, (MM_UDP, None), packet, compression):
+            raise MastermindErrorClient(
+                "Client sending has failed!  Call .disconnect() and then .connect() to try to reestablish the connection.")
+
+    def receive(self, blocking=True, max_packet_size=MAX_PACKET_SIZE):
+        if not self._mm_connected:
+            raise MastermindErrorClient("Client must be connected with .connect() to receive data!")
+
+        waited = 0.0
+        while True:
+            self._mm_read_packets(self._mm_resend_time / 2 if blocking else 0.0, max_packet_size)
+            for packet in self._mm_channel.due(time.time()):
+                netutil.packet_send(self._mm_socket, (MM_UDP, None), packet, None)
+
+            if self._mm_received:
+                return self._mm_received.popleft()
+            if not blocking:
+                return None
+
+            waited += self._mm_resend_time / 2
+            if self._mm_timeout_receive != None and waited > self._mm_timeout_receive:
+                raise MastermindErrorClient(
+                    "Client receiving has timed out!  Call .disconnect() and then .connect() to try to reestablish the connection.")
+
+    def _mm_read_packets(self, timeout, max_packet_size):
+        input_ready, output_ready, except_ready = select.select([self._mm_socket], [], [], timeout)
+        while input_ready != []:
+            try:
+                packet, address = netutil.packet_recv_udp(self._mm_socket, max_packet_size)
+                payloads, closed = self._mm_channel.unwrap(packet)
+            except socket.error:
+                raise MastermindErrorClient(
+                    "Client receiving has failed!  Call .disconnect() and then .connect() to try to reestablish the connection.")
+            except Exception:
+                payloads, closed = [], False  # not one of ours
+            if closed:
+                raise MastermindErrorClient("The server closed the connection.")
+            self._mm_received.extend(payloads)
+            input_ready, output_ready, except_ready = select.select([self._mm_socket], [], [], 0)
@@ -1,7 +1,9 @@
 import select
+import selectors
 import socket
 import time
 import threading
+import traceback
 
 from libs.Mastermind import _mm_netutil as netutil
 from ._mm_constants import *
@@ -148,9 +150,9 @@ class MastermindServerBase(object):
 
     def accepting_allow(self):
         # Start a thread with the server.  That thread will then start a new thread for each new request
+        self._mm_should_run = True
         self._mm_server_thread = threading.Thread(target=self.accepting_allow_wait_forever)
         self._mm_server_thread.start()
-        while not self._mm_should_run: pass
         self._mm_accepting_new_connections = True
 
     def accepting_disallow(self):
@@ -159,16 +161,86 @@ class MastermindServerBase(object):
         self._mm_accepting_new_connections = False
 
 
+class MastermindConnectionTCP(object):
+    def __init__(self, server, socket, address):
+        self.server = server
+        self.socket = socket
+        self.address = address
+
+        self.amount_waiting = 0.0
+        self.last_receive = time.time()
+
+        self.handling = True
+        self.events = 0
+        self.reader = netutil.FrameReader()
+        self.send_buffer = bytearray()
+        self.send_lock = threading.Lock()
+
+    def terminate(self):
+        self.handling = False
+        self.server._mm_wake()
+
+    def queue_send(self, data_to_send):
+        # Sends right away while nothing is waiting, the rest is sent by the server loop when the socket is ready
+        with self.send_lock:
+            if not self.handling:
+                return False
+            if len(self.send_buffer) + len(data_to_send) > self.server._mm_send_buffer_limit:
+                # the client doesn't read what it gets, waiting for it would stall everyone else
+                self.handling = False
+                self.server._mm_wake()
+                return False
+            if not self.send_buffer:
+                try:
+                    sent = self.socket.send(data_to_send)
+                except (BlockingIOError, InterruptedError):
+                    sent = 0
+                except OSError:
+                    self.handling = False
+                    self.server._mm_wake()
+                    return False
+                data_to_send = data_to_send[sent:]
+                if not data_to_send:
+                    return True
+            self.send_buffer += data_to_send
+        self.server._mm_wake()
+        return True
+
+    def flush(self):
+        # Called by the server loop when the socket can take more data, False if the connection broke
+        with self.send_lock:
+            try:
+                sent = self.socket.send(self.send_buffer)
+            except (BlockingIOError, InterruptedError):
+                return True
+            except OSError:
+                return False
+            del self.send_buffer[:sent]
+            return True
+
+
 class MastermindServerTCP(MastermindServerBase):
-    def __init__(self, time_server_refresh=0.5, time_connection_refresh=0.5, time_connection_timeout=5.0):
+    # All clients are served by one thread: the listening socket and every connection are registered with a
+    # selector, nothing polls.  Data for a client that can't take it right away is kept in its send buffer; while
+    # that buffer is above send_buffer_pause nothing more is read from the client, above send_buffer_limit it gets
+    # disconnected.
+    def __init__(self, time_server_refresh=0.5, time_connection_refresh=0.5, time_connection_timeout=5.0,
+                 send_buffer_pause=256 * 1024, send_buffer_limit=4 * 1024 * 1024):
         MastermindServerBase.__init__(self, MM_TCP, time_server_refresh, time_connection_refresh,
                                       time_connection_timeout)
+        self._mm_send_buffer_pause = send_buffer_pause
+        self._mm_send_buffer_limit = send_buffer_limit
+        self._mm_selector = None
+        self._mm_wake_sockets = None
+        self._mm_wake_lock = threading.Lock()
+        self._mm_server_thread = None
 
     def _mm_make_connection(self, ip, port):
         self._mm_unconnected_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
             self._mm_unconnected_socket.bind((ip, port))
-            self._mm_unconnected_socket.listen(5)  # 5 is the maximum backlog allowed
+            self._mm_unconnected_socket.listen(128)
+            self._mm_unconnected_socket.setblocking(False)
         except:
             self._mm_unconnected_socket.close()
             raise MastermindErrorSocket(
@@ -178,24 +250,164 @@ class MastermindServerTCP(MastermindServerBase):
         self._mm_unconnected_socket.close()
 
     def callback_client_receive(self, connection_object):
-        return netutil.packet_recv_tcp(connection_object.socket)
+        pass  # The server loop reads whatever is there and hands complete packets to callback_client_handle
+
+    def callback_client_send(self, connection_object, data, compression=None):
+        return connection_object.queue_send(netutil.packet_encode(data, compression))
+
+    def accepting_allow(self):
+        self._mm_selector = selectors.DefaultSelector()
+        self._mm_wake_sockets = socket.socketpair()
+        for wake_socket in self._mm_wake_sockets:
+            wake_socket.setblocking(False)
+        self._mm_selector.register(self._mm_wake_sockets[0], selectors.EVENT_READ)
+        self._mm_selector.register(self._mm_unconnected_socket, selectors.EVENT_READ)
 
-    def accepting_allow_wait_forever(self):
         self._mm_should_run = True
-        while self._mm_should_run:
-            input_ready, output_ready, except_ready = select.select([self._mm_unconnected_socket], [], [],
-                                                                    self._mm_time_server_refresh)
-            if input_ready == []: continue
+        self._mm_accepting_new_connections = True
+        self._mm_server_thread = threading.Thread(target=self.accepting_allow_wait_forever)
+        self._mm_server_thread.start()
 
+    def accepting_disallow(self):
+        # Existing clients are still served until they are disconnected
+        self._mm_accepting_new_connections = False
+        self._mm_wake()
+
+    def disconnect_clients(self):
+        for connection in list(self._mm_connections.values()):
+            connection.terminate()
+        self._mm_should_run = False
+        self._mm_wake()
+        if self._mm_server_thread is not None and self._mm_server_thread is not threading.current_thread():
+            self._mm_server_thread.join()
+        for connection in list(self._mm_connections.values()):
+            self._mm_close_client(connection)
+
+    def _mm_wake(self):
+        with self._mm_wake_lock:
+            if self._mm_wake_sockets is not None:
+                try:
+                    self._mm_wake_sockets[1].send(b"\0")
+                except (BlockingIOError, OSError):
+                    pass  # there's a wake up pending already
+
+    def _mm_close_client(self, connection):
+        if self._mm_connections.pop(connection.address, None) is None:
+            return
+        connection.handling = False
+        if connection.events:
+            self._mm_selector.unregister(connection.socket)
+            connection.events = 0
+        connection.socket.close()
+        self.callback_disconnect_client(connection)
+
+    def _mm_update_interest(self, connection):
+        # Wait for the socket to take data while there is some to send, stop reading while too much is waiting
+        events = 0
+        if len(connection.send_buffer) <= self._mm_send_buffer_pause:
+            events |= selectors.EVENT_READ
+        if connection.send_buffer:
+            events |= selectors.EVENT_WRITE
+        if events == connection.events:
+            return
+        if not connection.events:
+            self._mm_selector.register(connection.socket, events, connection)
+        elif not events:
+            self._mm_selector.unregister(connection.socket)
+        else:
+            self._mm_selector.modify(connection.socket, events, connection)
+        connection.events = events
+
+    def _mm_accept(self):
+        try:
             connected_socket, address = self._mm_unconnected_socket.accept()
-            connection = MastermindConnectionThreadTCP(self, connected_socket, address)
-            connection.thread = threading.Thread(target=connection.run_forever)
-            connection.thread.start()
-            while not connection.handling: pass
-            self._mm_connections[address] = connection
+        except (BlockingIOError, InterruptedError):
+            return
+        connected_socket.setblocking(False)
+        connection = MastermindConnectionTCP(self, connected_socket, address)
+        self._mm_connections[address] = connection
+        self._mm_update_interest(connection)
+        self.callback_connect_client(connection)
+
+    def _mm_read(self, connection):
+        try:
+            got = connection.reader.read(connection.socket)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            got = 0
+        if got == 0:
+            self._mm_close_client(connection)
+            return
+
+        connection.last_receive = time.time()
+        connection.amount_waiting = 0.0
+        try:
+            # the payloads are views into the buffer of the reader, they are valid until its next read
+            data = connection.reader.next_frame()
+            while data is not None and connection.handling:
+                self.callback_client_handle(connection, data)
+                data = connection.reader.next_frame()
+        except Exception:
+            # one broken client must not take the loop of all the others with it
+            traceback.print_exc()
+            self._mm_close_client(connection)
+
+    def accepting_allow_wait_forever(self):
+        while self._mm_should_run:
+            listening = self._mm_accepting_new_connections
+            if not listening:
+                try:
+                    self._mm_selector.unregister(self._mm_unconnected_socket)
+                except (KeyError, ValueError):
+                    pass
+
+            # sleep until something happens or the next client times out
+            timeout = None
+            if self._mm_connections:
+                now = time.time()
+                next_timeout = min(connection.last_receive for connection in self._mm_connections.values())
+                timeout = max(0.0, next_timeout + self._mm_time_connection_timeout - now)
+
+            for key, events in self._mm_selector.select(timeout):
+                if key.fileobj is self._mm_wake_sockets[0]:
+                    try:
+                        while self._mm_wake_sockets[0].recv(4096): pass
+                    except (BlockingIOError, InterruptedError):
+                        pass
+                elif key.fileobj is self._mm_unconnected_socket:
+                    if listening:
+                        self._mm_accept()
+                else:
+                    connection = key.data
+                    if connection.address not in self._mm_connections:
+                        continue
+                    if events & selectors.EVENT_WRITE and not connection.flush():
+                        connection.handling = False
+                    if events & selectors.EVENT_READ and connection.handling:
+                        self._mm_read(connection)
+
+            now = time.time()
+            for connection in list(self._mm_connections.values()):
+                connection.amount_waiting = now - connection.last_receive
+                if not connection.handling or connection.amount_waiting > self._mm_time_connection_timeout:
+                    self._mm_close_client(connection)
+                else:
+                    self._mm_update_interest(connection)
+
+        self._mm_selector.close()
+        for wake_socket in self._mm_wake_sockets:
+            wake_socket.close()
+        self._mm_wake_sockets = None
 
 
 class MastermindServerUDP(MastermindServerBase):
+    # Stays with the threaded base implementation, even if it is combined with a subclass of MastermindServerTCP
+    callback_client_send = MastermindServerBase.callback_client_send
+    accepting_allow = MastermindServerBase.accepting_allow
+    accepting_disallow = MastermindServerBase.accepting_disallow
+    disconnect_clients = MastermindServerBase.disconnect_clients
+
     def __init__(self, time_server_refresh=0.5, time_connection_refresh=0.5, time_connection_timeout=5.0,
                  max_packet_size=4096):
         MastermindServerBase.__init__(self, MM_UDP, time_server_refresh, time_connection_refresh,
@@ -210,6 +422,8 @@ class MastermindServerUDP(MastermindServerBase):
             self._mm_server_socket.close()
             raise MastermindErrorSocket(
                 "Server could not connect on port " + str(port) + "!  Perhaps another instance is already running?")
+        # sendto never waits for a full send buffer, one slow network path doesn't hold back the other clients
+        self._mm_server_socket.setblocking(False)
 
     def _mm_close_connection(self):
         self._mm_server_socket.close()
@@ -218,18 +432,20 @@ class MastermindServerUDP(MastermindServerBase):
         pass
 
     def accepting_allow_wait_forever(self):
-        self._mm_should_run = True
         while self._mm_should_run:
             input_ready, output_ready, except_ready = select.select([self._mm_server_socket], [], [],
                                                                     self._mm_time_server_refresh)
             if input_ready == []: continue
 
-            data, address = netutil.packet_recv_udp(self._mm_server_socket, self._mm_max_packet_size)
+            try:
+                data, address = netutil.packet_recv_udp(self._mm_server_socket, self._mm_max_packet_size)
+            except (BlockingIOError, InterruptedError):
+                continue
             if address not in self._mm_connections:
                 connection = MastermindConnectionThreadUDP(self, address)
                 connection.thread = threading.Thread(target=connection.run_forever)
                 connection.thread.start()
-                while not connection.handling: pass
+                connection.started.wait()
                 self._mm_connections[address] = connection
 
             self.callback_client_receive(self._mm_connections[address])
@@ -245,36 +461,12 @@ class MastermindConnectionThread(object):
         self.amount_waiting = 0.0
 
         self.handling = False
+        self.started = threading.Event()
 
     def terminate(self):
         self.handling = False
 
 
-class MastermindConnectionThreadTCP(MastermindConnectionThread):
-    def __init__(self, server, socket, address):
-        MastermindConnectionThread.__init__(self, server, socket, address)
-
-    def run_forever(self):
-        self.server.callback_connect_client(self)
-
-        self.handling = True
-        while self.handling:
-            input_ready, output_ready, except_ready = select.select([self.socket], [], [],
-                                                                    self.server._mm_time_connection_refresh)
-            if input_ready == []:
-                self.amount_waiting += self.server._mm_time_connection_refresh
-                if self.amount_waiting > self.server._mm_time_connection_timeout: break
-                continue
-
-            data, status = self.server.callback_client_receive(self)
-            if status == False: break
-
-            self.server.callback_client_handle(self, data)
-
-            self.amount_waiting = 0.0
-        self.server.callback_disconnect_client(self)
-
-
 class MastermindConnectionThreadUDP(MastermindConnectionThread):
     def __init__(self, server, address):
         MastermindConnectionThread.__init__(self, server, server._mm_server_socket, address)
@@ -284,6 +476,7 @@ class MastermindConnectionThreadUDP(MastermindConnectionThread):
         self.server.callback_connect_client(self)
 
         self.handling = True
+        self.started.set()
         while self.handling:
             time.sleep(self.server._mm_time_connection_refresh)
 
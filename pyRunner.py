@@ -14,6 +14,34 @@ from pyrunner_classes import *
 parser = argparse.ArgumentParser(description='Testing')
 parser.add_argument('--log',
                     help='pass the log level desired (info, debug,...)', type=str)
+parser.add_argument('--precompute-paths', action='store_true',
+                    help='precompute and cache a path table for each level, levels with more than 65535 tiles, '
+                         '4096 walkable tiles or paths longer than 65534 steps search the graph instead')
+parser.add_argument('--full-update-ratio', type=float, default=0.5,
+                    help='update the whole screen if the changed areas cover more than this share of it')
+parser.add_argument('--dirty-rendering', action='store_true',
+                    help='only blit the changed parts of the level surface to the screen')
+parser.add_argument('--render-fps', type=int,
+                    help='frames per second to draw, the game itself always runs at the configured fps')
+parser.add_argument('--headless', action='store_true',
+                    help='run a dedicated network server without display and audio')
+parser.add_argument('--port', type=int,
+                    help='port of the headless server, further matches use the following ports')
+parser.add_argument('--matches', type=int, default=1,
+                    help='number of matches the headless server runs at once')
+parser.add_argument('--processes', type=int, default=1,
+                    help='number of processes the matches of the headless server are spread over')
+parser.add_argument('--protocol', choices=sorted(CODECS), default=BinaryCodec.name,
+                    help='network message encoding, json is easier to debug, all players need the same one')
+parser.add_argument('--transport', choices=['tcp', 'udp'], default='tcp',
+                    help='udp resends only the events and drops outdated positions, all players need the same one')
+parser.add_argument('--outbox-limit', type=int, default=Server.OUTBOX_LIMIT,
+                    help='messages the server queues for a slow client before the outbox policy applies')
+parser.add_argument('--outbox-policy', choices=[Server.POLICY_DISCONNECT, Server.POLICY_DROP_OLDEST],
+                    default=Server.OUTBOX_POLICY, help='what the server does with a client that falls too far behind')
+parser.add_argument('--lockstep', action='store_true',
+                    help='the players only exchange their keys and simulate the game themselves, '
+                         'all of them need the same screen resolution')
 args = parser.parse_args()
 
 # set log level
@@ -24,12 +52,22 @@ if args.log is not None:
         raise ValueError('Invalid log level: %s' % args.log)
     logging.basicConfig(level=numeric_level)
 
+log = logging.getLogger("PyRunner")
+# every network game of this process uses the same message encoding
+NetworkConnector.codec = CODECS[args.protocol]()
+NetworkConnector.transport = args.transport
+Server.OUTBOX_LIMIT = args.outbox_limit
+Server.OUTBOX_POLICY = args.outbox_policy
+Server.LOCKSTEP = args.lockstep
+
 
 class PyRunner(object):
     """main PyRunner Class"""
 
     START_LEVEL = "./resources/levels/level1.tmx"
     THEME_MUSIC = "thememusic.ogg"
+    '''simulation steps to run at most before drawing a frame, slower machines drop the rest'''
+    MAX_CATCH_UP_STEPS = 5
 
     def __init__(self):
         """initialize the game"""
@@ -38,13 +76,21 @@ class PyRunner(object):
         # initialize the settings
         self.config = MainConfig()
         self.fps = self.config.fps
+        self.render_fps = args.render_fps or self.fps
+        self.precompute_paths = args.precompute_paths
+        self.dirty_rendering = args.dirty_rendering
+        '''pixels copied from the level surface to the screen in the last frame'''
+        self.blitted_pixels = 0
+        '''the score numbers are drawn to the level surface too, they are replaced by it in the next frame'''
+        self.score_rects = []
         '''init the audio subsystem prior to anything else'''
         self.music_thread = MusicMixer(self.config.play_music, self.config.vol_music,
                                        self.config.play_sfx, self.config.vol_sfx, self.fps)
         self.music_thread.start()
         '''init the main screen'''
-        self.render_thread = RenderThread(self.config.name, self.config.screen_x, self.config.screen_y, self.fps,
-                                          self.config.fullscreen, self.config.switch_resolution)
+        self.render_thread = RenderThread(self.config.name, self.config.screen_x, self.config.screen_y, self.render_fps,
+                                          self.config.fullscreen, self.config.switch_resolution,
+                                          full_update_ratio=args.full_update_ratio)
         self.render_thread.fill_screen(BACKGROUND)
         self.bg_surface = pygame.Surface((self.config.screen_x, self.config.screen_y))
         self.render_thread.bg_surface = self.bg_surface
@@ -57,6 +103,7 @@ class PyRunner(object):
         self.menu = None
         self.level = None
         self.current_level_path = None
+        self.preloader = None
         self.physics = None
         self.controller = None
         self.load_level(self.START_LEVEL)
@@ -65,7 +112,7 @@ class PyRunner(object):
         self.loading_level = False
         self.game_over = False
         """sound variables"""
-        self.sfx_portal_sound = pygame.mixer.Sound(self.music_thread.get_full_path_sfx('portal_sound.ogg'))
+        self.sfx_portal_sound = self.music_thread.load_sound('portal_sound.ogg')
 
     def switch_music(self, main_theme=False):
         """switch the music according to each level"""
@@ -88,8 +135,15 @@ class PyRunner(object):
             self.level.prepare_level_change()
             self.level_exit = False
             # don't remove the GoldScore.scores as they should stay for a level switch
-        '''load the new level'''
-        self.level = Level(self.bg_surface, path, self.music_thread, self.network_connector, self.fps)
+        '''load the new level, use the preloaded data if the preloader already prepared it'''
+        atlas = self.preloader.take(path, self.bg_surface.get_size()) if self.preloader else None
+        self.level = Level(self.bg_surface, path, self.music_thread, self.network_connector, self.fps,
+                           self.precompute_paths, atlas)
+        '''prepare the next level in the background while this one is played'''
+        self.preloader = None
+        if self.level.next_level:
+            self.preloader = LevelPreloader(self.level.next_level, self.bg_surface.get_size())
+            self.preloader.start()
         '''switch the music after loading the new level but not on game startup'''
         if self.level and self.menu:
             "new music for level change"
@@ -144,6 +198,10 @@ class PyRunner(object):
         """main game loop"""
         # Main loop relevant vars
         clock = pygame.time.Clock()
+        '''the simulation runs in fixed steps, independent of the time it takes to draw a frame'''
+        step_time = 1000 / self.fps
+        lag = 0
+        frame_time = 0
 
         while self.game_is_running:
             for event in pygame.event.get():
@@ -209,8 +267,25 @@ class PyRunner(object):
 
             # save cpu resources
             if not self.menu.in_menu and not self.loading_level:
-                self.render_thread.add_rect_to_update(self.render_game())
-                self.network_connector.update()
+                lag += frame_time
+                steps = 0
+                while lag >= step_time and steps < self.MAX_CATCH_UP_STEPS:
+                    if not self.network_connector.begin_step():
+                        '''a lockstep game waits for the keys of the other players'''
+                        break
+                    self.update_game()
+                    self.network_connector.update()
+                    lag -= step_time
+                    steps += 1
+                    if self.menu.in_menu or self.loading_level:
+                        break
+                '''don't try to catch up forever if the machine is too slow'''
+                lag = min(lag, step_time)
+
+                if not self.menu.in_menu and not self.loading_level:
+                    '''only interpolate if there are more frames drawn than simulated'''
+                    alpha = lag / step_time if self.render_fps > self.fps else 1
+                    self.render_thread.add_rect_to_update(self.render_game(alpha))
 
                 if self.game_over:
                     self.menu.set_current_menu(self.menu.game_over)
@@ -222,22 +297,16 @@ class PyRunner(object):
                 else:
                     self.network_connector.client.send_keep_alive()
 
-            clock.tick(self.fps)
+            frame_time = clock.tick(self.render_fps)
 
-    def render_game(self):
-        """render all game related content"""
+    def update_game(self):
+        """run one simulation step of all game related content"""
         '''update all sprite groups'''
+        Player.store_positions()
         GoldScore.scores.update()
         Player.group.update()
-        '''store all screen changes, draw & update the level'''
-        rects = self.level.update()
-        '''blit the level surface to the main screen'''
-        self.render_thread.blit(self.level.surface, None, True)
-        '''draw the player and scores'''
-        rects.append(Player.group.draw(self.surface))
-        rects.append(GoldScore.scores.draw(self.surface))
-        '''clean up the dirty background'''
-        self.level.clear(self.surface)
+        '''update the level and check the collisions'''
+        self.level.update()
 
         '''check if all gold got collected and spawn a exit gate if there's none left'''
         if not self.level_exit and not any(sprite.collectible for sprite in WorldObject.group):
@@ -263,8 +332,50 @@ class PyRunner(object):
                 else:
                     self.game_over_menu()
 
+    def render_game(self, alpha=1):
+        """render all game related content
+
+        Args:
+            alpha (float): progress between the last and the current simulation step to draw the players at
+
+        Returns: list of changed rects
+        """
+        '''store all screen changes and draw the level'''
+        rects = self.level.draw()
+        '''blit the level surface to the main screen'''
+        if self.dirty_rendering:
+            self.blitted_pixels = self.blit_level_rects(rects + self.score_rects)
+        else:
+            self.render_thread.blit(self.level.surface, None, True)
+            self.blitted_pixels = self.level.surface.get_width() * self.level.surface.get_height()
+        log.debug("blitted %s pixels of the level" % self.blitted_pixels)
+        '''draw the player and scores'''
+        rects.append(Player.draw_interpolated(self.surface, alpha))
+        self.score_rects = GoldScore.scores.draw(self.surface)
+        rects.append(self.score_rects)
+        '''clean up the dirty background'''
+        self.level.clear(self.surface)
+
         return rects
 
+    def blit_level_rects(self, rects):
+        """copy only the changed parts of the level surface to the screen
+
+        the whole level gets blitted on level changes and when the menu is closed,
+        players and scores are drawn on top and erase themselves with the level surface
+
+        Returns: the number of blitted pixels
+        """
+        fps_rect = self.render_thread.fps_rect
+        '''the frame rate is drawn to the level surface'''
+        if fps_rect:
+            rects = rects + [fps_rect]
+        pixels = 0
+        for rect in rects:
+            self.surface.blit(self.level.surface, rect, rect)
+            pixels += rect.width * rect.height
+        return pixels
+
     def game_over_menu(self):
         """create the game over menu"""
         self.game_over = True
@@ -287,6 +398,16 @@ class PyRunner(object):
 
 
 if __name__ == "__main__":
-    pyrunner = PyRunner()
-    # start the pyrunner game
-    pyrunner.start_game()
+    if args.headless and args.processes > 1:
+        # every process runs its share of the matches
+        MatchServer.start_pool(args.matches, args.processes, args.port, precompute_paths=args.precompute_paths)
+    else:
+        if args.headless and args.matches > 1:
+            pyrunner = MatchServer(args.matches, args.port, precompute_paths=args.precompute_paths)
+        elif args.headless:
+            # serve network games without a window
+            pyrunner = HeadlessServer(args.port, precompute_paths=args.precompute_paths)
+        else:
+            pyrunner = PyRunner()
+        # start the pyrunner game
+        pyrunner.start_game()
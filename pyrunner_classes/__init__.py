@@ -8,6 +8,7 @@ import logging
 from datetime import datetime
 # basic game structure
 from .constants import *
+from .game_clock import GameClock
 from .main_config import MainConfig
 from .menu import Menu, MenuItem
 from .main_menu import MainMenu
@@ -15,6 +16,7 @@ from .render_thread import RenderThread
 from .sound_thread import MusicMixer
 # World
 from .level import Level
+from .level_preloader import LevelPreloader
 from .level_objecs import WorldObject, Rope, Ladder, Collectible, ExitGate
 from .game_physics import Physics
 # Players
@@ -23,25 +25,34 @@ from .player import Player
 from .player_objects import GoldScore
 from .non_player_characters import Bots
 from .dijkstra import Graph
+from .path_table import PathTable
+from .flow_field import FlowField, FlowFields
+from .level_atlas import LevelAtlas
+from .tile_map import TileMap
 from .npc_state_machine import StateMachine
 from .npc_states import Exploring, Hunting, ShortestPath
 # Network
 from .controller import Controller
 from .network_connector import NetworkConnector
-from .network_client import Client
-from .network_server import Server
-from .network_shared import Action, Message, COMPRESSION
+from .network_client import Client, UdpClient
+from .network_server import Server, UdpServer
+from .network_shared import Action, Message, Snapshot, COMPRESSION, CODECS, JsonCodec, BinaryCodec, ProtocolError
 from .zeroconf_bonjour import ZeroConfAdvertiser, ZeroConfListener
+from .headless import HeadlessImage, SilentMixer
+from .headless_server import HeadlessServer
+from .match import Match, MatchServer
 
 
 __all__ = ['pygame', 'datetime', 'logging',
            'BLUE', 'YELLOW', 'RED', 'BLACK', 'BACKGROUND', 'GRAY', 'WHITE', 'MENU_FONT',
-           'MainConfig', 'Menu', 'MenuItem', 'MainMenu', 'RenderThread', 'MusicMixer',
-           'NetworkConnector', 'Client', 'Server', 'Controller', 'Action', 'Message',
-           'COMPRESSION', 'ZeroConfAdvertiser', 'ZeroConfListener',
+           'GameClock', 'MainConfig', 'Menu', 'MenuItem', 'MainMenu', 'RenderThread', 'MusicMixer',
+           'NetworkConnector', 'Client', 'UdpClient', 'Server', 'UdpServer', 'Controller', 'Action', 'Message', 'Snapshot',
+           'COMPRESSION', 'CODECS', 'JsonCodec', 'BinaryCodec', 'ProtocolError', 'ZeroConfAdvertiser', 'ZeroConfListener',
+           'HeadlessImage', 'SilentMixer', 'HeadlessServer', 'Match', 'MatchServer',
            'SpriteSheet', 'Player', 'GoldScore',
-           'Bots', 'Graph', 'StateMachine', 'Exploring', 'ShortestPath', 'Hunting',
-           'Level', 'Physics', 'WorldObject', 'ExitGate', 'Ladder', 'Rope', 'Collectible']
+           'Bots', 'Graph', 'PathTable', 'FlowField', 'FlowFields', 'TileMap', 'LevelAtlas',
+           'StateMachine', 'Exploring', 'ShortestPath', 'Hunting',
+           'Level', 'LevelPreloader', 'Physics', 'WorldObject', 'ExitGate', 'Ladder', 'Rope', 'Collectible']
 
 __version__ = '0.1.5'
 __author__ = 'Team pyBerries'
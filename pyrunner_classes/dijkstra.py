@@ -1,86 +1,272 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 """Dijkstra Graph Algorithm"""
-from collections import defaultdict, deque
+from array import array
+from heapq import heappush, heappop
+
+INFINITY = 0x7fffffff
 
 
 class Graph(object):
     """
-        slightly modified version from mdsrosa @ https://gist.github.com/mdsrosa/c71339cb23bc51e711d8
+        Graph of all walkable tiles in a level
+
+        every tile (x, y) is stored as the dense integer index y * cols + x,
+        the edges are packed into compact adjacency arrays (offsets, targets, weights)
+        and paths are searched with a binary heap A* using the manhattan distance on the tile grid,
+        flow runs one dijkstra along the reversed edges to get the distances of all nodes to one target
 
-        originally created by econchick @ https://gist.github.com/econchick/4666413
+        tiles can be closed while the level runs (e.g. dug blocks), the searches skip every edge that
+        passes a closed tile until it gets opened again, the graph itself stays the same
 
+        based on the dijkstra graph by mdsrosa @ https://gist.github.com/mdsrosa/c71339cb23bc51e711d8
+        and econchick @ https://gist.github.com/econchick/4666413
     """
-    def __init__(self):
-        self.nodes = set()
-        self.edges = defaultdict(list)
-        self.distances = {}
+    def __init__(self, cols, rows):
+        self.cols = cols
+        self.rows = rows
+        self.size = cols * rows
+        '''1 for every tile index that is a node of the graph'''
+        self.nodes = bytearray(self.size)
+        '''edges while building the graph, get packed into arrays on the first search'''
+        self._edges = {}
+        self._offsets = None
+        self._targets = None
+        self._weights = None
+        '''1 for every closed tile index and their number'''
+        self.closed = bytearray(self.size)
+        self.closed_count = 0
+        '''number of closed tiles every packed edge passes and tile index -> positions of the edges that pass it'''
+        self._blocked = None
+        self._passing = None
+        '''the packed edges by their target node: offsets, edge positions and the node every edge starts in'''
+        self._incoming_offsets = None
+        self._incoming = None
+        self._sources = None
+
+    def index(self, value):
+        """convert a tile id (x, y) to its integer index, raises a KeyError for invalid tiles"""
+        try:
+            x, y = value
+        except (TypeError, ValueError):
+            raise KeyError(value)
+        if not (0 <= x < self.cols and 0 <= y < self.rows):
+            raise KeyError(value)
+        return y * self.cols + x
+
+    def tile(self, index):
+        """convert an integer index back to its tile id (x, y)"""
+        return index % self.cols, index // self.cols
 
     def add_node(self, value):
         """adds a node to the graph"""
-        if not isinstance(value, str):
-            value = str(value)
-        self.nodes.add(value)
+        self.nodes[self.index(value)] = 1
 
     def add_edge(self, from_node, to_node, distance):
         """adds a path from node a to node b"""
-        if not isinstance(from_node, str):
-            from_node = str(from_node)
-        if not isinstance(to_node, str):
-            to_node = str(to_node)
-        self.edges[from_node].append(to_node)
-        self.edges[to_node].append(from_node)
-        self.distances[(from_node, to_node)] = distance
-
-    @staticmethod
-    def dijkstra(graph, initial):
-        """finds a dijkstra path on the graph"""
-        visited = {initial: 0}
-        path = {}
-
-        nodes = set(graph.nodes)
-
-        while nodes:
-            min_node = None
-            for node in nodes:
-                if node in visited:
-                    if min_node is None:
-                        min_node = node
-                    elif visited[node] < visited[min_node]:
-                        min_node = node
-            if min_node is None:
-                break
+        from_index = self.index(from_node)
+        to_index = self.index(to_node)
+        self.nodes[from_index] = 1
+        self.nodes[to_index] = 1
+        self._edges.setdefault(from_index, {})[to_index] = distance
+        '''the packed arrays have to be rebuilt'''
+        self._offsets = None
+
+    def _pack(self):
+        """pack all edges into the compact adjacency arrays"""
+        offsets = array('l', [0]) * (self.size + 1)
+        targets = array('l')
+        weights = array('l')
+        for index in range(self.size):
+            offsets[index] = len(targets)
+            for target, weight in sorted(self._edges.get(index, {}).items()):
+                targets.append(target)
+                weights.append(weight)
+        offsets[self.size] = len(targets)
+
+        incoming_offsets = array('l', [0]) * (self.size + 1)
+        for target in targets:
+            incoming_offsets[target + 1] += 1
+        for index in range(self.size):
+            incoming_offsets[index + 1] += incoming_offsets[index]
+        incoming = array('l', [0]) * len(targets)
+        sources = array('l', [0]) * len(targets)
+        filled = array('l', incoming_offsets)
+        for index in range(self.size):
+            for position in range(offsets[index], offsets[index + 1]):
+                incoming[filled[targets[position]]] = position
+                filled[targets[position]] += 1
+                sources[position] = index
+
+        blocked = array('l', [0]) * len(targets)
+        passing = {}
+        for index in range(self.size):
+            for position in range(offsets[index], offsets[index + 1]):
+                for tile in self.passed(index, targets[position]):
+                    passing.setdefault(tile, []).append(position)
+                    blocked[position] += self.closed[tile]
+        self._offsets, self._targets, self._weights = offsets, targets, weights
+        self._blocked, self._passing = blocked, passing
+        self._incoming_offsets, self._incoming, self._sources = incoming_offsets, incoming, sources
+
+    def packed(self):
+        """returns the compact adjacency arrays (offsets, targets, weights)"""
+        if self._offsets is None:
+            self._pack()
+        return self._offsets, self._targets, self._weights
+
+    def passed(self, origin, destination):
+        """the tile indices an edge passes, the edges along a row or column pass all tiles in between"""
+        cols = self.cols
+        if origin // cols == destination // cols:
+            step = 1
+        elif origin % cols == destination % cols:
+            step = cols
+        else:
+            return [origin, destination]
+        if destination < origin:
+            step = -step
+        return range(origin, destination + step, step)
+
+    def path_tiles(self, tiles):
+        """all tile indices a path of tile ids (x, y) passes, its nodes included"""
+        indices = [self.index(tile) for tile in tiles if tile]
+        passed = set(indices)
+        for origin, destination in zip(indices, indices[1:]):
+            passed.update(self.passed(origin, destination))
+        return passed
+
+    def is_open(self, tiles):
+        """True if a path of tile ids (x, y) passes no closed tile"""
+        return not self.closed_count or not any(self.closed[index] for index in self.path_tiles(tiles))
+
+    def close_tile(self, index):
+        """the searches avoid the tile from now on, returns False if it was closed already"""
+        return self._set_closed(index, 1)
 
-            nodes.remove(min_node)
-            current_weight = visited[min_node]
+    def open_tile(self, index):
+        """the searches may pass the tile again, returns False if it wasn't closed"""
+        return self._set_closed(index, 0)
 
-            for edge in graph.edges[min_node]:
-                try:
-                    weight = current_weight + graph.distances[(min_node, edge)]
-                except KeyError:
+    def _set_closed(self, index, closed):
+        """close or open a tile and update the edges that pass it"""
+        if self.closed[index] == closed:
+            return False
+        self.closed[index] = closed
+        change = 1 if closed else -1
+        self.closed_count += change
+        if self._offsets is not None:
+            '''the packed arrays count the closed tiles themselves when they get rebuilt'''
+            for position in self._passing.get(index, ()):
+                self._blocked[position] += change
+        return True
+
+    def switched_edges(self, index):
+        """the (source, target, weight) of the packed edges that closing or opening a tile just blocked or freed"""
+        if self._offsets is None:
+            return []
+        blocked = 1 if self.closed[index] else 0
+        return [(self._sources[position], self._targets[position], self._weights[position])
+                for position in self._passing.get(index, ()) if self._blocked[position] == blocked]
+
+    def neighbours(self, index):
+        """returns all (target index, weight) pairs of a node"""
+        if self._offsets is None:
+            self._pack()
+        start, stop = self._offsets[index], self._offsets[index + 1]
+        return zip(self._targets[start:stop], self._weights[start:stop])
+
+    def search(self, origin, destination):
+        """finds the shortest path between two node indices with A*
+
+        Returns: (distance, [index, ...]) or raises a KeyError if there's no path
+        """
+        if not self.nodes[origin] or not self.nodes[destination] or self.closed[destination]:
+            raise KeyError(destination)
+        if origin == destination:
+            return 0, [origin]
+        if self._offsets is None:
+            self._pack()
+
+        offsets, targets, weights, blocked = self._offsets, self._targets, self._weights, self._blocked
+        cols = self.cols
+        dest_x, dest_y = destination % cols, destination // cols
+        distance = array('l', [INFINITY]) * self.size
+        parent = array('l', [-1]) * self.size
+        distance[origin] = 0
+        heap = [(0, 0, origin)]
+
+        while heap:
+            estimate, weight, node = heappop(heap)
+            if node == destination:
+                break
+            if weight > distance[node]:
+                '''outdated heap entry'''
+                continue
+            for i in range(offsets[node], offsets[node + 1]):
+                if blocked[i]:
                     continue
-                if edge not in visited or weight < visited[edge]:
-                    visited[edge] = weight
-                    path[edge] = min_node
+                target = targets[i]
+                new_weight = weight + weights[i]
+                if new_weight < distance[target]:
+                    distance[target] = new_weight
+                    parent[target] = node
+                    x, y = target % cols, target // cols
+                    estimate = new_weight + abs(x - dest_x) + abs(y - dest_y)
+                    heappush(heap, (estimate, new_weight, target))
+        else:
+            raise KeyError(destination)
 
-        return visited, path
+        full_path = [destination]
+        node = destination
+        while node != origin:
+            node = parent[node]
+            full_path.append(node)
+        full_path.reverse()
 
-    def shortest_path(self, origin, destination):
-        """finds the shortest path from a to b"""
-        if not isinstance(origin, str):
-            origin = str(origin)
-        if not isinstance(destination, str):
-            destination = str(destination)
+        return distance[destination], full_path
+
+    def flow(self, destination):
+        """distances from all nodes to one node index with a dijkstra run along the reversed open edges
+
+        Returns: (distance, next_hop) arrays by node index, INFINITY and -1 for the nodes that can't reach it
+        """
+        distance = array('l', [INFINITY]) * self.size
+        next_hop = array('l', [-1]) * self.size
+        if not self.nodes[destination] or self.closed[destination]:
+            return distance, next_hop
+        if self._offsets is None:
+            self._pack()
 
-        visited, paths = self.dijkstra(self, origin)
-        full_path = deque()
-        _destination = paths[destination]
+        weights, blocked, sources = self._weights, self._blocked, self._sources
+        incoming_offsets, incoming = self._incoming_offsets, self._incoming
+        distance[destination] = 0
+        next_hop[destination] = destination
+        heap = [(0, destination)]
 
-        while _destination != origin:
-            full_path.appendleft(_destination)
-            _destination = paths[_destination]
+        while heap:
+            weight, node = heappop(heap)
+            if weight > distance[node]:
+                '''outdated heap entry'''
+                continue
+            for i in range(incoming_offsets[node], incoming_offsets[node + 1]):
+                position = incoming[i]
+                if blocked[position]:
+                    continue
+                source = sources[position]
+                new_weight = weight + weights[position]
+                if new_weight < distance[source]:
+                    distance[source] = new_weight
+                    '''the first step on the way from source to the destination'''
+                    next_hop[source] = node
+                    heappush(heap, (new_weight, source))
+
+        return distance, next_hop
 
-        full_path.appendleft(origin)
-        full_path.append(destination)
+    def shortest_path(self, origin, destination):
+        """finds the shortest path from a to b
 
-        return visited[destination], list(full_path)
+        Returns: (distance, [(x, y), ...]) or raises a KeyError if one of the tiles is no node or unreachable
+        """
+        length, indices = self.search(self.index(origin), self.index(destination))
+        return length, [self.tile(index) for index in indices]
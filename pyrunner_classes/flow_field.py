@@ -0,0 +1,130 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""distance map from every walkable tile to one target tile"""
+from pyrunner_classes.dijkstra import INFINITY
+
+
+class FlowField(object):
+    """
+        the distance and the next hop from every graph node to one target tile
+
+        one dijkstra run along the reversed edges serves all bots that hunt the player standing on the target,
+        every bot reads its next tile in O(1) instead of searching its own path
+    """
+
+    def __init__(self, graph, target):
+        self.graph = graph
+        index = graph.index(target)
+        self.target = graph.tile(index)
+        '''tile index -> distance to the target and the next node on the way, INFINITY / -1 if it can't reach it'''
+        self.distance, self.next_hop = graph.flow(index)
+
+    def length(self, tile):
+        """the walking distance from a tile id (x, y) to the target or None if it can't reach it"""
+        try:
+            distance = self.distance[self.graph.index(tile)]
+        except KeyError:
+            return None
+        return distance if distance != INFINITY else None
+
+    def next_tile(self, tile):
+        """the next tile id (x, y) on the way from a tile to the target, the target itself once it's reached"""
+        try:
+            hop = self.next_hop[self.graph.index(tile)]
+        except KeyError:
+            return None
+        return self.graph.tile(hop) if hop >= 0 else None
+
+    def changed_by(self, edges, closed):
+        """True if closing or opening the (source, target, weight) edges changes a distance of the field
+
+        the field stays exact if none of the closed edges is a next hop and none of the opened edges is a shortcut
+        """
+        distance, next_hop = self.distance, self.next_hop
+        for source, target, weight in edges:
+            if distance[target] == INFINITY:
+                continue
+            if closed:
+                if next_hop[source] == target and distance[source] == distance[target] + weight:
+                    return True
+            elif distance[target] + weight < distance[source]:
+                return True
+        return False
+
+    def shortest_path(self, tile):
+        """follow the next hops from a tile to the target
+
+        Returns: (distance, [(x, y), ...]) or raises a KeyError if the tile is no node or can't reach the target
+        """
+        length = self.length(tile)
+        if length is None:
+            raise KeyError(tile)
+
+        full_path = [tile]
+        while full_path[-1] != self.target:
+            full_path.append(self.next_tile(full_path[-1]))
+
+        return length, full_path
+
+
+class FlowFields(object):
+    """
+        the next tiles of all bots hunting players, the flow fields are shared by target tile index
+
+        a path table answers first as long as its precomputed path passes no closed tile,
+        a flow field is only built for the targets it can't serve
+    """
+
+    def __init__(self, graph, path_table=None):
+        self.graph = graph
+        self.path_table = path_table
+        '''target tile index -> flow field'''
+        self.fields = {}
+
+    def field(self, target):
+        """the flow field to a target tile id (x, y), built once and shared or None if the tile is no node"""
+        try:
+            index = self.graph.index(target)
+        except KeyError:
+            return None
+        field = self.fields.get(index)
+        if not field:
+            field = self.fields[index] = FlowField(self.graph, target)
+        return field
+
+    def next_tile(self, origin, target):
+        """the next tile id (x, y) on the shortest open way from origin to target or None if there's none"""
+        if self.path_table:
+            if not self.graph.closed_count:
+                return self.path_table.next_tile(origin, target)
+            try:
+                length, path = self.path_table.shortest_path(origin, target)
+            except KeyError:
+                '''closed tiles only take edges away, a tile the table can't reach stays unreachable'''
+                return None
+            if self.graph.is_open(path):
+                return path[1] if len(path) > 1 else target
+            '''the precomputed path crosses a dug block, the flow field goes around it'''
+        field = self.field(target)
+        return field.next_tile(origin) if field else None
+
+    def tile_changed(self, index, closed):
+        """drop the flow fields a tile index closed or opened in the graph changes, the others stay shared"""
+        if self.fields:
+            edges = self.graph.switched_edges(index)
+            for target in [target for target, field in self.fields.items()
+                           if target == index or field.changed_by(edges, closed)]:
+                del self.fields[target]
+
+    def prune(self, targets):
+        """drop the flow fields of all tiles except the target tile ids (x, y) players stand on"""
+        if self.fields:
+            keep = set()
+            for target in targets:
+                try:
+                    keep.add(self.graph.index(target))
+                except KeyError:
+                    '''no tile or one of the exit gate, which has no tile id'''
+                    pass
+            for index in [index for index in self.fields if index not in keep]:
+                del self.fields[index]
@@ -0,0 +1,56 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""the time and the random numbers the simulation runs on"""
+
+import random
+from datetime import datetime, timedelta
+
+
+class GameClock(object):
+    """
+        the clock all timers of the simulation read
+
+        usually it's the wall clock. in a lockstep game every client runs the same steps with the same inputs,
+        the time is counted in steps and the random numbers come from a seed all clients share,
+        so the timers of the bots and the removed blocks run out in the same step everywhere
+    """
+
+    '''steps between pressing a key and the step all clients apply it in'''
+    INPUT_DELAY = 3
+    '''the time of step 0 of a lockstep game'''
+    EPOCH = datetime(2000, 1, 1)
+
+    deterministic = False
+    tick = 0
+    fps = 25
+    random = random.Random()
+
+    @classmethod
+    def start(cls, seed, tick=0, fps=25):
+        """count the time in steps from now on"""
+        cls.deterministic = True
+        cls.tick = tick
+        cls.fps = fps
+        cls.random.seed(seed)
+
+    @classmethod
+    def stop(cls):
+        """go back to the wall clock"""
+        cls.deterministic = False
+
+    @classmethod
+    def step(cls):
+        """one simulation step passed"""
+        cls.tick += 1
+
+    @classmethod
+    def now(cls):
+        """the current time of the simulation"""
+        if cls.deterministic:
+            return cls.EPOCH + timedelta(milliseconds=cls.tick * 1000 // cls.fps)
+        return datetime.now()
+
+    @staticmethod
+    def ordered(sprites):
+        """the bots and the players by their ids, the order doesn't depend on when they got added to a group"""
+        return sorted(sprites, key=lambda sprite: (sprite.is_human, sprite.pid))
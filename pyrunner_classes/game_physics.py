@@ -1,6 +1,7 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 """class that handles all sprite collisions"""
+import numpy
 from pyrunner_classes import logging, pygame
 from pyrunner_classes.player import Player
 from pyrunner_classes.level_objecs import WorldObject
@@ -14,11 +15,11 @@ class Physics(object):
     def __init__(self, level):
         self.level = level
         '''sounds'''
-        self.sfx_coin_collected = pygame.mixer.Sound(self.level.sound_thread.get_full_path_sfx('player_collect.wav'))
-        self.sfx_coin_robbed = pygame.mixer.Sound(self.level.sound_thread.get_full_path_sfx('Robbed_Point_01.wav'))
-        self.sfx_player_portal = pygame.mixer.Sound(self.level.sound_thread.get_full_path_sfx('portal_exit.wav'))
-        self.sfx_player_killed = pygame.mixer.Sound(self.level.sound_thread.get_full_path_sfx('player_kill.ogg'))
-        self.sfx_player_dig = pygame.mixer.Sound(self.level.sound_thread.get_full_path_sfx('sfx_sounds_interaction24.wav'))
+        self.sfx_coin_collected = self.level.sound_thread.load_sound('player_collect.wav')
+        self.sfx_coin_robbed = self.level.sound_thread.load_sound('Robbed_Point_01.wav')
+        self.sfx_player_portal = self.level.sound_thread.load_sound('portal_exit.wav')
+        self.sfx_player_killed = self.level.sound_thread.load_sound('player_kill.ogg')
+        self.sfx_player_dig = self.level.sound_thread.load_sound('sfx_sounds_interaction24.wav')
 
     def register_callback(self, network):
         """creates a link to the network connector, this is needed to notify the network of canged blocks"""
@@ -46,6 +47,11 @@ class Physics(object):
     @staticmethod
     def find_collision(x, y, group=WorldObject.group):
         """find a sprite that has no direct collision with the player sprite"""
+        '''world objects are looked up in their tile of the spatial grid'''
+        if group is WorldObject.group:
+            return WorldObject.grid.sprite_at(x, y)
+        elif group is WorldObject.removed:
+            return WorldObject.removed_grid.sprite_at(x, y)
         for sprite in group:
             if sprite.rect.collidepoint(x, y):
                 return sprite
@@ -59,12 +65,104 @@ class Physics(object):
             if sprite.tile_id in sprite_ids:
                 sprite.kill()
     
-    def check_collisions(self):
-        """calculates collision for players and sprites using the rectangles of the sprites"""
-        for player in Player.group:
-            # check if the player is still on the screen
+    @staticmethod
+    def shrink_rects(rects, ratio):
+        """scale rects (x, y, w, h) around their center like pygame.sprite.collide_rect_ratio"""
+        change_w = (rects[:, 2] * ratio - rects[:, 2]).astype(numpy.int64)
+        change_h = (rects[:, 3] * ratio - rects[:, 3]).astype(numpy.int64)
+        shrunk = rects.copy()
+        shrunk[:, 0] -= (change_w / 2).astype(numpy.int64)
+        shrunk[:, 1] -= (change_h / 2).astype(numpy.int64)
+        shrunk[:, 2] += change_w
+        shrunk[:, 3] += change_h
+        return shrunk
+
+    @staticmethod
+    def rect_overlaps(rects):
+        """(N, N) matrix which is True if rect i overlaps rect j, same rules as pygame.Rect.colliderect"""
+        x, y, w, h = rects[:, 0], rects[:, 1], rects[:, 2], rects[:, 3]
+        right, bottom = x + w, y + h
+        filled = (w > 0) & (h > 0)
+        return (filled[:, None] & filled[None, :] &
+                (x[:, None] < right[None, :]) & (x[None, :] < right[:, None]) &
+                (y[:, None] < bottom[None, :]) & (y[None, :] < bottom[:, None]))
+
+    @staticmethod
+    def points_in_rects(points_x, points_y, rects):
+        """(N, N) matrix which is True if point i is inside of rect j, same rules as pygame.Rect.collidepoint"""
+        x, y, w, h = rects[:, 0], rects[:, 1], rects[:, 2], rects[:, 3]
+        return ((x[None, :] <= points_x[:, None]) & (points_x[:, None] < (x + w)[None, :]) &
+                (y[None, :] <= points_y[:, None]) & (points_y[:, None] < (y + h)[None, :]))
+
+    @staticmethod
+    def find_pairs(matrix):
+        """returns the indices of all True columns for every row of a matrix"""
+        pairs = [[] for _ in range(len(matrix))]
+        for row, column in numpy.argwhere(matrix).tolist():
+            pairs[row].append(column)
+        return pairs
+
+    @staticmethod
+    def merge_moved(found, moved, players, check):
+        """replace batched results of players that moved earlier in this frame with a check of their current rect"""
+        if not moved:
+            return found
+        merged = [index for index in found if index not in moved]
+        merged.extend(index for index in moved if check(players[index]))
+        return sorted(merged)
+
+    @staticmethod
+    def find_neighbours(players, rects):
+        """calculate the probe points around all players and their grid cells at once
+
+        Returns: a list with (cell, x, y) of the removed block, right tile, right bottom,
+                 left tile, left bottom and bottom sprite probes for every player
+        """
+        grid = WorldObject.grid
+        half = numpy.array([player.size // 2 for player in players])
+        x, y, w, h = rects[:, 0], rects[:, 1], rects[:, 2], rects[:, 3]
+        center_x, center_y = x + w // 2, y + h // 2
+        right, left, bottom = x + w + half, x - half, y + h + half
+
+        points_x = numpy.stack((center_x, right, right, left, left, center_x), axis=1)
+        points_y = numpy.stack((y, center_y, bottom, center_y, bottom, bottom), axis=1)
+        cells_x = ((points_x - grid.offset_x) // grid.cell_width).astype(numpy.int64)
+        cells_y = ((points_y - grid.offset_y) // grid.cell_height).astype(numpy.int64)
+
+        return [list(zip(zip(cell_x, cell_y), point_x, point_y)) for cell_x, cell_y, point_x, point_y
+                in zip(cells_x.tolist(), cells_y.tolist(), points_x.tolist(), points_y.tolist())]
+
+    def check_collisions(self, players=None, replay=False):
+        """calculates collision for players and sprites using the rectangles of the sprites
+
+        Args:
+            players (list): the players to check, all players if None
+            replay (bool): only move the players, nothing gets collected, dug or killed
+        """
+        players = Player.group.sprites() if players is None else players
+        if not players:
+            return
+
+        # check if the players are still on the screen
+        for player in players:
             self.check_world_boundaries(player)
-            half_size = player.size / 2
+
+        '''gather all player rects once per frame and calculate the neighbour probes of all players in one batch'''
+        start_rects = [tuple(player.rect) for player in players]
+        rects = numpy.array(start_rects, dtype=numpy.int64)
+        probes = self.find_neighbours(players, rects)
+        grid, removed_grid = WorldObject.grid, WorldObject.removed_grid
+
+        '''player vs player collisions of the whole frame, players that moved get checked again on their new rect'''
+        humans = numpy.array([Player.humans.has(player) for player in players], dtype=bool)
+        victims = self.find_pairs(self.rect_overlaps(self.shrink_rects(rects, 0.5)) & humans[None, :])
+        standing_on = self.find_pairs(self.points_in_rects(rects[:, 0] + rects[:, 2] // 2,
+                                                           rects[:, 1] + rects[:, 3], rects))
+        collide_half = pygame.sprite.collide_rect_ratio(0.5)
+        moved = set()
+
+        for number, player in enumerate(players):
+            half_size = player.size // 2
 
             # assume he's flying in the air
             on_rope = False
@@ -74,16 +172,18 @@ class Physics(object):
 
             '''kill players touched by bots'''
             if not player.is_human and not player.direction == "Trapped":
-                human_victims = pygame.sprite.spritecollide(player, Player.humans, False,
-                                                            collided=pygame.sprite.collide_rect_ratio(0.5))
+                human_victims = self.merge_moved(victims[number], moved, players,
+                                                 lambda other: Player.humans.has(other) and collide_half(player, other))
                 if human_victims:
-                    for p in human_victims:
+                    for p in (players[victim] for victim in human_victims):
                         if not p.killed:
                             self.level.sound_thread.play_sound(self.sfx_player_killed)
                             p.kill()
 
+            removed_probe, right_probe, right_bottom_probe, left_probe, left_bottom_probe, bottom_probe = probes[number]
+
             '''find collisions with removed blocks'''
-            removed_collision = self.find_collision(player.rect.centerx, player.rect.top, WorldObject.removed)
+            removed_collision = removed_grid.sprite_in_cell(*removed_probe)
             if removed_collision:
                 if not removed_collision.trapped:
                     '''only trap bots'''
@@ -93,11 +193,11 @@ class Physics(object):
                         on_ground = True
 
             '''add sprites left and right of the bot for collision detection'''
-            right_tile = self.find_collision(player.rect.right + half_size, player.rect.centery, WorldObject.group)
-            right_bottom = self.find_collision(player.rect.right + half_size, player.rect.bottom + half_size)
+            right_tile = grid.sprite_in_cell(*right_probe)
+            right_bottom = grid.sprite_in_cell(*right_bottom_probe)
             '''find sprites to the left'''
-            left_tile = self.find_collision(player.rect.left - half_size, player.rect.centery, WorldObject.group)
-            left_bottom = self.find_collision(player.rect.left - half_size, player.rect.bottom + half_size)
+            left_tile = grid.sprite_in_cell(*left_probe)
+            left_bottom = grid.sprite_in_cell(*left_bottom_probe)
 
             if not player.is_human:
                 if right_tile and not right_tile.collectible and not right_tile.climbable:
@@ -115,7 +215,7 @@ class Physics(object):
                 player.left_bottom = left_bottom if left_bottom else None
 
             '''important sprites for the bot'''
-            bottom_sprite = self.find_collision(player.rect.centerx, player.rect.bottom + half_size)
+            bottom_sprite = grid.sprite_in_cell(*bottom_probe)
             can_jump_off = True if not bottom_sprite or bottom_sprite.climbable else False
 
             '''check if there's a ladder below the feet'''
@@ -125,12 +225,12 @@ class Physics(object):
             '''find collisions according to certain actions outside of the direct sprite collision'''
             if player.direction is "DR":
                 '''remove the bottom sprite to the right'''
-                if right_bottom and right_bottom.removable and not right_tile:
+                if right_bottom and right_bottom.removable and not right_tile and not replay:
                     right_bottom.kill()
                     self.level.sound_thread.play_sound(self.sfx_player_dig)
             elif player.direction is "DL":
                 '''remove the bottom sprite to the left'''
-                if left_bottom and left_bottom.removable and not left_tile:
+                if left_bottom and left_bottom.removable and not left_tile and not replay:
                     left_bottom.kill()
                     self.level.sound_thread.play_sound(self.sfx_player_dig)
             elif player.direction is "UD" and not player.on_ladder:
@@ -149,16 +249,26 @@ class Physics(object):
                     player.stop_on_ground = True
 
             '''if a removed block contains another player we can walk over it'''
-            top_collision = self.find_collision(player.rect.centerx, player.rect.bottom, Player.group)
+            if tuple(player.rect) != start_rects[number]:
+                '''the player moved down a ladder, the batched result is outdated'''
+                top_collision = self.find_collision(player.rect.centerx, player.rect.bottom, Player.group)
+            else:
+                bottom_point = player.rect.midbottom
+                found = self.merge_moved(standing_on[number], moved, players,
+                                         lambda other: other.rect.collidepoint(bottom_point))
+                top_collision = players[found[0]] if found else None
             if top_collision and top_collision.direction == "Trapped":
                 on_ground = True
                 '''if a bot hits a player from below the player should die'''
                 self.hit_top(player, top_collision)
 
             '''handle all other direct collisions'''
-            collisions = pygame.sprite.spritecollide(player, WorldObject.group, False, False)
+            collisions = WorldObject.grid.sprites_in_rect(player.rect)
             for sprite in collisions:
                 # sprite.dirty = 1
+                if replay and (sprite.collectible and not sprite.killed or sprite.exit or sprite.restoring):
+                    '''the real step already collected, left or died here'''
+                    continue
                 # collect gold and remove the sprite
                 if sprite.collectible and not sprite.killed:
                     if player.is_human:
@@ -166,8 +276,9 @@ class Physics(object):
                         player.add_gold()
                         "Collect gold SFX"
                         self.level.sound_thread.play_sound(self.sfx_coin_collected)
-                        '''notify the server'''
-                        self.level.network_connector.client.gold_removed(sprite.tile_id)
+                        '''notify the server, a headless server has no client of its own'''
+                        if self.level.network_connector.client:
+                            self.level.network_connector.client.gold_removed(sprite.tile_id)
                         # remove it
                         sprite.kill()
                     elif not player.robbed_gold:
@@ -216,6 +327,16 @@ class Physics(object):
             player.on_ground = on_ground
             player.can_go_down = can_go_down if player.is_human else bot_go_down
 
+            if tuple(player.rect) != start_rects[number]:
+                moved.add(number)
+
+    def replay_step(self, player):
+        """simulate one step of a single player again, the world stays as it is"""
+        player.replaying = True
+        player.update()
+        player.replaying = False
+        self.check_collisions([player], True)
+
     @staticmethod
     def hit_inner_bottom(player, sprite):
         """player hits the inner ground of a sprite"""
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""stand-ins for surfaces and sounds on a server without display and audio"""
+from pyrunner_classes import pygame
+
+
+class HeadlessImage(object):
+    """
+        takes the place of a pygame.Surface on a headless server
+
+        it only knows its size so all sprites still get correct rects for the physics,
+        drawing to it does nothing and no pixel data is ever allocated
+    """
+    __slots__ = ('size',)
+
+    '''set by the headless server before the first level gets loaded'''
+    enabled = False
+
+    def __init__(self, size):
+        self.size = int(size[0]), int(size[1])
+
+    @staticmethod
+    def create_surface(size, flags=0):
+        """returns a placeholder on the headless server and a new pygame.Surface otherwise"""
+        if HeadlessImage.enabled:
+            return HeadlessImage(size)
+        return pygame.Surface(size, flags)
+
+    def get_size(self):
+        """width and height of the image"""
+        return self.size
+
+    def get_width(self):
+        """width of the image"""
+        return self.size[0]
+
+    def get_height(self):
+        """height of the image"""
+        return self.size[1]
+
+    def get_rect(self, **kwargs):
+        """a new rect with the size of the image, keywords are set as rect attributes like pygame does"""
+        rect = pygame.Rect((0, 0), self.size)
+        for name, value in kwargs.items():
+            setattr(rect, name, value)
+        return rect
+
+    def subsurface(self, rect):
+        """a placeholder with the size of the rect"""
+        return HeadlessImage(pygame.Rect(rect).size)
+
+    def blit(self, source, dest, area=None, special_flags=0):
+        """nothing to draw, returns the affected rect"""
+        return pygame.Rect(dest[0], dest[1], *source.get_size())
+
+    def fill(self, color, rect=None, special_flags=0):
+        """nothing to fill"""
+        return self.get_rect()
+
+    def copy(self):
+        """placeholders have no content so they can be shared"""
+        return self
+
+    def convert(self, *args):
+        """there's no display format to convert to"""
+        return self
+
+    def convert_alpha(self, *args):
+        """there's no display format to convert to"""
+        return self
+
+    def set_colorkey(self, *args):
+        """transparency is irrelevant without a display"""
+        pass
+
+
+class SilentMixer(object):
+    """takes the place of the MusicMixer thread on a headless server, no audio device is opened"""
+
+    def __init__(self):
+        self.background_music = None
+
+    @staticmethod
+    def load_sound(file):
+        """there are no sounds without a mixer"""
+        return None
+
+    def play_sound(self, file, loop=False):
+        """nothing to play"""
+        pass
+
+    def clear_background_music(self):
+        """nothing to clear"""
+        self.background_music = None
+
+    @staticmethod
+    def clear_sounds():
+        """nothing to clear"""
+        pass
+
+    def stop_thread(self):
+        """there's no thread to stop"""
+        pass
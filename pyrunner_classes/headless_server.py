@@ -0,0 +1,91 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""dedicated network server that runs the game without display and audio"""
+
+from pyrunner_classes import logging, pygame, Level, Player, WorldObject, ExitGate, NetworkConnector, Server
+from pyrunner_classes.headless import HeadlessImage, SilentMixer
+
+log = logging.getLogger("Headless Server")
+
+
+class HeadlessServer(object):
+    """
+        runs the levels, physics and bots of a network game for the connected clients
+
+        neither the display nor the mixer get initialized, the sprites only keep their rects
+        and the level its tile grids, the clients draw and play everything themselves
+    """
+
+    START_LEVEL = "./resources/levels/level1.tmx"
+    '''the resolution the positions are calculated in, the clients normalize them to their own'''
+    SCREEN_SIZE = 1280, 720
+
+    def __init__(self, port, fps=25, precompute_paths=False):
+        HeadlessImage.enabled = True
+        self.game_is_running = True
+        self.fps = fps
+        self.precompute_paths = precompute_paths
+        self.music_thread = SilentMixer()
+        self.bg_surface = HeadlessImage(self.SCREEN_SIZE)
+        self.network_connector = None
+        self.level = None
+        self.current_level_path = None
+        self.level_exit = False
+        self.load_level(self.START_LEVEL)
+        '''serve the level without joining it'''
+        self.network_connector = NetworkConnector(self)
+        self.network_connector.start_server_prompt(port, headless=True)
+
+    def load_level(self, path=None):
+        """load another level and let the clients know"""
+        if not path:
+            path = self.current_level_path if self.current_level_path else self.START_LEVEL
+        else:
+            self.current_level_path = path
+        if self.level:
+            self.level.prepare_level_change()
+            self.level_exit = False
+        self.level = Level(self.bg_surface, path, self.music_thread, self.network_connector, self.fps,
+                           self.precompute_paths)
+        log.info("loaded %s" % path)
+
+        if self.network_connector and self.network_connector.server:
+            self.network_connector.server.sprites_removed.clear()
+            self.network_connector.server.notify_level_changed(self.level.path)
+
+    def update_game(self):
+        """run one simulation step"""
+        Player.group.update()
+        self.level.update()
+
+        '''spawn the exit gate if all gold got collected'''
+        if not self.level_exit and not any(sprite.collectible for sprite in WorldObject.group):
+            try:
+                self.level_exit = ExitGate(self.level.next_level_pos, self.level.PLAYERS[0], 32,
+                                           self.level.pixel_diff, self.fps)
+            except AttributeError:
+                '''the last level has no exit, the clients show their game over menu'''
+                self.level_exit = True
+
+        '''switch to the next level as soon as all players left the current one'''
+        if not len(Player.humans) and self.level.reached_next_level and self.level.next_level:
+            self.load_level(self.level.next_level)
+
+    def step(self):
+        """simulate one step and handle the client events, the clients of a lockstep game simulate it themselves"""
+        if not Server.LOCKSTEP:
+            self.update_game()
+        self.network_connector.update()
+
+    def start_game(self):
+        """main server loop"""
+        clock = pygame.time.Clock()
+
+        while self.game_is_running:
+            self.step()
+            clock.tick(self.fps)
+
+    def quit_game(self):
+        """stop the server"""
+        self.game_is_running = False
+        self.network_connector.quit()
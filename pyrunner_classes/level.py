@@ -4,13 +4,19 @@
 # Python 2 related fixes
 from __future__ import division
 
+import zlib
 import pytmx
-from pytmx.util_pygame import load_pygame
 from operator import itemgetter
 from pyrunner_classes.player import Player
 from pyrunner_classes.player_objects import GoldScore
 from pyrunner_classes.non_player_characters import Bots
 from pyrunner_classes.dijkstra import Graph
+from pyrunner_classes.path_table import PathTable
+from pyrunner_classes.flow_field import FlowFields
+from pyrunner_classes.level_atlas import LevelAtlas
+from pyrunner_classes.tile_map import sprite_flags, WALKABLE
+from pyrunner_classes.headless import HeadlessImage
+from pyrunner_classes.game_clock import GameClock
 from pyrunner_classes.level_objecs import *
 from pyrunner_classes.game_physics import Physics
 
@@ -43,7 +49,7 @@ class Level(object):
     players = []
     bots = []
 
-    def __init__(self, surface, path, sound_thread, network_connector, fps=25):
+    def __init__(self, surface, path, sound_thread, network_connector, fps=25, precompute_paths=False, atlas=None):
         self.surface = surface
         self.background = self.surface.copy()
         self.path = path
@@ -53,13 +59,29 @@ class Level(object):
         self.fps = fps
         self.physics = Physics(self)
         self.reached_next_level = False
+        self.next_level = None
         self.graph = None
+        self.precompute_paths = precompute_paths
+        self.path_table = None
+        '''the next tiles of the hunting bots from the path table or the flow fields they share'''
+        self.flow_fields = None
         self.climbable_list = []
         self.walkable_list = []
         self.bots_respawn = []
         self.bot_count = 0
         self.fps_counter = 0
-        self.tm = load_pygame(self.path, pixelalpha=True)
+        self.atlas = None
+        if HeadlessImage.enabled:
+            '''the headless server only needs the map data, no tileset images'''
+            self.tm = pytmx.TiledMap(self.path)
+        else:
+            '''the cached tile atlas of this resolution replaces loading and scaling the tileset images'''
+            if atlas and atlas.level_path == path and atlas.screen_size == surface.get_size():
+                '''already loaded by the level preloader'''
+                self.atlas = atlas
+            else:
+                self.atlas = LevelAtlas(self.path, surface.get_size())
+            self.tm = self.atlas.load_map()
         self.tile_width, self.tile_height = self.tm.tilewidth, self.tm.tileheight
         '''
             we have 32x32 pixel tiles and 40x23 pixels resulting in a resolution of 1280x736
@@ -135,6 +157,13 @@ class Level(object):
         self.spawn_enemies_1_pos = bot1_pos
         self.spawn_enemies_2_pos = bot2_pos
 
+        '''index the world objects by tile for fast collision lookups'''
+        WorldObject.grid.configure(self.tile_width, self.tile_height, self.margin_left, self.margin_top)
+        WorldObject.removed_grid.configure(self.tile_width, self.tile_height, self.margin_left, self.margin_top)
+        '''flags of all tiles, kept up to date by the world objects'''
+        self.tile_map = WorldObject.tile_map
+        self.tile_map.configure(self.cols, self.rows)
+
         '''draw the complete level'''
         self.render()
 
@@ -146,21 +175,23 @@ class Level(object):
         self.add_network_players()
 
     def update(self):
-        """update level related things"""
+        """update level related things, runs once per simulation step"""
         '''update all world sprites'''
         WorldObject.group.update()
         WorldObject.removed.update()
 
-        '''draw the level'''
-        rects = WorldObject.group.draw(self.surface)
-
         '''check for sprite collisions'''
         self.physics.check_collisions()
 
         '''check if there are bots to respawn'''
         self.check_respawn_bot()
 
-        return rects
+        '''forget the flow fields of the tiles the players left'''
+        self.prune_flow_fields()
+
+    def draw(self):
+        """draw the changed world sprites to the level surface and return their rects"""
+        return WorldObject.group.draw(self.surface)
 
     def clear(self, screen):
         """clear the sprite backgrounds, call this after blitting the level surface to the screen"""
@@ -179,7 +210,7 @@ class Level(object):
             '''only check once per second if there are bots to respawn'''
             if self.bots_respawn:
                 for bid, time in self.bots_respawn:
-                    if (datetime.now() - time).seconds >= 10:
+                    if (GameClock.now() - time).seconds >= 10:
                         self.bots_respawn.remove((bid, time))
                         pos = self.spawn_enemies_1_pos if bid & 1 else self.spawn_enemies_2_pos
                         self.create_bot(bid, pos, True)
@@ -202,7 +233,7 @@ class Level(object):
 
     def kill_bot(self, bot):
         """remove a specific bot an death and add it to the respawn list"""
-        self.bots_respawn.append((bot.pid, datetime.now()))
+        self.bots_respawn.append((bot.pid, GameClock.now()))
 
     def prepare_level_change(self):
         """call this function before switching to a new level"""
@@ -213,6 +244,9 @@ class Level(object):
         Player.bots.empty()
         WorldObject.group.empty()
         WorldObject.removed.empty()
+        WorldObject.grid.clear()
+        WorldObject.removed_grid.clear()
+        WorldObject.frames.clear()
         self.physics = None
         self.network_connector = None
         self.sound_thread = None
@@ -249,19 +283,35 @@ class Level(object):
             except KeyError:
                 return False
 
-        def resize_tile_to_fit(tile, target_size):
+        def layer_tiles(current_layer):
+            """yields x, y, gid of all tiles in a layer"""
+            for tile in current_layer.iter_data():
+                if tile[2]:
+                    yield tile
+
+        def resize_tile_to_fit(tile, target_size, scaled_tiles):
             """resize tile to fit the screen size and position"""
-            pos_x, pos_y, image = tile
+            pos_x, pos_y, gid = tile
             pos_id = (pos_x, pos_y)
 
             pos_x = self.margin_left + (width * pos_x)
             pos_y = self.margin_top + (height * pos_y)
-
-            image = pygame.transform.scale(image, target_size)
-
-            '''chop off the bottom half in the last row to fit 720p'''
-            if pos_y == self.last_row:
-                image = self.squeeze_half_image(image)
+            last_row = pos_y == self.last_row
+
+            '''all tiles with the same image share one resized copy'''
+            key = gid, last_row
+            if key not in scaled_tiles:
+                if HeadlessImage.enabled:
+                    '''without a display only the size of the tiles matters'''
+                    tile_w, tile_h = target_size
+                    scaled = HeadlessImage((tile_w, round(tile_h / 2)) if last_row else target_size)
+                else:
+                    scaled = pygame.transform.scale(self.tm.images[gid], target_size)
+                    '''chop off the bottom half in the last row to fit 720p'''
+                    if last_row:
+                        scaled = self.squeeze_half_image(scaled)
+                scaled_tiles[key] = scaled
+            image = scaled_tiles[key]
 
             tile = pos_x, pos_y, image
 
@@ -269,6 +319,20 @@ class Level(object):
 
         width, height = self.tile_width, self.tile_height
         size = width, height
+        '''the atlas stores the sprite tiles, the background tiles are only needed for the baked background'''
+        sprite_tiles = self.atlas.tiles if self.atlas else {}
+        background_tiles = {}
+        '''the headless server doesn't need the background at all'''
+        skip_background = not self.atlas or self.atlas.loaded
+        if not self.atlas:
+            baked_background = None
+        elif self.atlas.loaded:
+            '''the background layer is already baked into one image'''
+            self.render_tile(self.background, (self.margin_left, self.margin_top, self.atlas.background))
+            self.render_tile(self.surface, (self.margin_left, self.margin_top, self.atlas.background))
+            baked_background = None
+        else:
+            baked_background = pygame.Surface((self.cols * width, self.rows * height), SRCALPHA)
 
         for layer in self.tm.visible_layers:
             if isinstance(layer, pytmx.TiledTileLayer):
@@ -279,12 +343,17 @@ class Level(object):
                     except AttributeError:
                         pass
 
-                    for a in layer.tiles():
-                        a, tile_id = resize_tile_to_fit(a, size)
+                    if skip_background:
+                        continue
+
+                    for a in layer_tiles(layer):
+                        a, tile_id = resize_tile_to_fit(a, size, background_tiles)
 
                         '''create a blank copy of the background layer'''
                         self.render_tile(self.background, a)
                         self.render_tile(self.surface, a)
+                        x, y, image = a
+                        self.render_tile(baked_background, (x - self.margin_left, y - self.margin_top, image))
                 else:
                     '''first check all layer properties'''
                     ladder = check_property(layer, 'climbable')
@@ -296,19 +365,24 @@ class Level(object):
                     width, height = self.tile_width, self.tile_height
                     fps = self.fps
                     '''create the sprites'''
-                    for a in layer.tiles():
-                        a, tile_id = resize_tile_to_fit(a, size)
+                    for a in layer_tiles(layer):
+                        a, tile_id = resize_tile_to_fit(a, size, sprite_tiles)
 
                         if ladder:
-                            Ladder(a, size, tile_id, fps, solid)
+                            sprite = Ladder(a, size, tile_id, fps, solid)
                         elif rope:
-                            Rope(a, size, tile_id, fps)
+                            sprite = Rope(a, size, tile_id, fps)
                         elif gold:
-                            Collectible(a, size, tile_id, fps)
+                            sprite = Collectible(a, size, tile_id, fps)
                         elif removable:
-                            WorldObject(a, size, tile_id, fps, solid, removable)
+                            sprite = WorldObject(a, size, tile_id, fps, solid, removable)
                         elif solid or wall:
-                            WorldObject(a, size, tile_id, fps, solid)
+                            sprite = WorldObject(a, size, tile_id, fps, solid)
+                        else:
+                            sprite = None
+
+                        if sprite:
+                            self.tile_map.add(tile_id, sprite_flags(sprite))
 
                         if not gold and not wall:
                             '''
@@ -323,11 +397,15 @@ class Level(object):
                                     '''add ladders separately'''
                                     self.climbable_list.append(tile_id)
                                 self.walkable_list.append(tile_id)
+                                self.tile_map.add(tile_id, WALKABLE)
+
+        if baked_background is not None:
+            self.atlas.save(sprite_tiles, baked_background)
 
     def generate_paths(self):
         """create paths by id for bots"""
         # graph to use with dijkstra's shortest path algorithm
-        self.graph = Graph()
+        self.graph = Graph(self.cols, self.rows)
         # remove duplicate entries (e.g. ropes that count one row deeper)
         self.walkable_list = list(set(self.walkable_list))
         # sort list by x, then by y
@@ -360,30 +438,36 @@ class Level(object):
 
         self.add_paths(ladders, False)
 
-        # '''initialize the graph'''
-        # for tile_a in self.walkable_list:
-        #     for tile_b in self.walkable_list:
-        #         if tile_a is not tile_b:
-        #             try:
-        #                 self.graph.shortest_path(tile_a, tile_b)
-        #                 # log.info("Success: %s and %s" % (tile_a, tile_b))
-        #             except KeyError:
-        #                 # log.info("Error %s and %s" % (tile_a, tile_b))
-        #                 pass
-        #
-        # intersections = [tile_id for tile_id in horizontals if tile_id in ladders]
-        # intersections.sort()
-        #
-        # '''partially initialize the graph'''
-        # for tile in self.walkable_list:
-        #     for ladder in intersections:
-        #         if tile is not ladder:
-        #             try:
-        #                 self.graph.shortest_path(tile, ladder)
-        #                 log.info("Success: %s and %s" % (tile, ladder))
-        #             except KeyError:
-        #                 # log.info("Error %s and %s" % (tile, ladder))
-        #                 pass
+        if self.precompute_paths:
+            '''next hop table for all tile pairs, cached next to the tmx file'''
+            self.path_table = PathTable.load_or_build(self.graph, self.path)
+        self.flow_fields = FlowFields(self.graph, self.path_table)
+
+        '''dug blocks can't be walked on until they are restored'''
+        self.tile_map.subscribe(self.tile_changed)
+
+    def tile_changed(self, tile_id, removed):
+        """close a dug block in the graph or open it again, only the flow fields it changes get rebuilt"""
+        try:
+            index = self.graph.index(tile_id)
+        except KeyError:
+            return
+        if not (self.graph.close_tile(index) if removed else self.graph.open_tile(index)):
+            return
+        self.flow_fields.tile_changed(index, removed)
+        if removed:
+            '''a bot may already be on its way to a next tile across the block'''
+            for bot in Level.bots:
+                if bot.brain.active_state:
+                    bot.brain.active_state.forget_path(index)
+
+    def next_tile(self, origin, target):
+        """the next tile id (x, y) a bot walks to on its way from origin to target or None if there's no way"""
+        return self.flow_fields.next_tile(origin, target)
+
+    def prune_flow_fields(self):
+        """drop the flow fields no player stands on anymore"""
+        self.flow_fields.prune(player.on_tile for player in Player.humans)
 
     def get_is_path(self, a, b):
         """returns if a target is reachable"""
@@ -578,6 +662,15 @@ class Level(object):
             bot_pos[bot.bid] = self.get_normalized_pos_and_data(bot, True)
         return bot_pos
 
+    def get_world_hash(self):
+        """checksum of the players, bots, removed blocks and the gold left, the clients of a lockstep game compare it"""
+        world = [self.get_normalized_pos_and_data(player, False) for player in Level.players]
+        world.extend(self.get_normalized_pos_and_data(bot, True) for bot in Level.bots)
+        world.append(sorted(tuple(tile_id) for tile_id, removed in WorldObject.get_removed_block_ids()))
+        world.append(sorted((sprite.tile_id, sprite.killed, sprite.rect.x - self.margin_left,
+                             sprite.rect.y - self.margin_top) for sprite in WorldObject.group if sprite.collectible))
+        return zlib.crc32(repr(world).encode("utf-8"))
+
     @staticmethod
     def set_player_states(player, info):
         """set the state vars for a specific player"""
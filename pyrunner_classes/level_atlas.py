@@ -0,0 +1,141 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""pre-scaled tile atlas and baked background of a level for one screen resolution"""
+import os
+import json
+import hashlib
+import pytmx
+from pytmx.util_pygame import load_pygame
+from pyrunner_classes import logging, pygame
+
+log = logging.getLogger("Level Atlas")
+ATLAS_VERSION = 1
+ATLAS_EXT = ".atlas.rgba"
+INDEX_EXT = ".atlas.json"
+BACKGROUND_EXT = ".background.rgba"
+ATLAS_COLUMNS = 16
+
+
+class LevelAtlas(object):
+    """
+        all resized tile images of a level in one image, cached next to the tmx file per screen size
+
+        the first load of a level scales the tileset images and stores them together with the baked
+        background layer, every later load only parses the map data and cuts the tiles out of the atlas.
+        the images are stored as raw RGBA pixels because decoding a png takes longer than scaling the tiles
+    """
+
+    def __init__(self, level_path, screen_size):
+        self.level_path = level_path
+        self.screen_size = screen_size
+        width, height = screen_size
+        self.cache_path = "%s.%sx%s" % (os.path.splitext(level_path)[0], width, height)
+        '''the map without tileset images, the tiles come from the atlas'''
+        self.tiled_map = pytmx.TiledMap(level_path)
+        self.digest = self.map_digest()
+        '''(gid, last_row) -> scaled tile'''
+        self.tiles = {}
+        self.background = None
+        self.loaded = False
+        self.tm = None
+        '''index, atlas and background pixels of the cache, read() fills it and load() turns it into surfaces'''
+        self.cache = None
+
+    def map_digest(self):
+        """hash the tmx file, its tileset images and the screen size"""
+        digest = hashlib.sha1()
+        digest.update(("%s %s %s %s" % (ATLAS_VERSION, pytmx.__version__, self.screen_size, self.tiled_map.maxgid))
+                      .encode("utf-8"))
+        sources = sorted(set(image[0] for image in self.tiled_map.images if image))
+        for path in [self.level_path] + sources:
+            with open(path, "rb") as source:
+                digest.update(source.read())
+        return digest.hexdigest()
+
+    def load_map(self):
+        """returns the parsed map, it only contains the tileset images if there's no cached atlas"""
+        if self.tm is None:
+            self.tm = self.tiled_map if self.load() else load_pygame(self.level_path, pixelalpha=True)
+        return self.tm
+
+    def read(self):
+        """read the cached atlas files without creating surfaces, returns False if there's none or it's outdated
+
+        this is safe in a background thread, converting surfaces against the display is not
+        """
+        if self.cache is None:
+            try:
+                with open(self.cache_path + INDEX_EXT) as index_file:
+                    index = json.load(index_file)
+                if index.get("version") != ATLAS_VERSION or index.get("digest") != self.digest:
+                    log.info("outdated tile atlas %s" % self.cache_path)
+                    return False
+                self.cache = (index, self.read_pixels(self.cache_path + ATLAS_EXT),
+                              self.read_pixels(self.cache_path + BACKGROUND_EXT))
+            except (OSError, ValueError):
+                return False
+        return True
+
+    def load(self):
+        """load the cached atlas, returns False if there's none or it belongs to another map or resolution"""
+        if not self.read():
+            return False
+        index, atlas_pixels, background_pixels = self.cache
+        '''the surfaces keep the pixels from now on'''
+        self.cache = None
+        try:
+            atlas = self.to_surface(atlas_pixels, index["atlas_size"])
+            self.background = self.to_surface(background_pixels, index["background_size"])
+        except (ValueError, KeyError, pygame.error):
+            return False
+
+        for key, rect in index["tiles"].items():
+            gid, last_row = key.split(",")
+            self.tiles[int(gid), last_row == "1"] = atlas.subsurface(rect)
+
+        self.loaded = True
+        log.info("loaded tile atlas %s" % self.cache_path)
+        return True
+
+    def save(self, tiles, background):
+        """store all scaled tiles and the baked background next to the level file"""
+        tile_width = max(image.get_width() for image in tiles.values()) if tiles else 1
+        tile_height = max(image.get_height() for image in tiles.values()) if tiles else 1
+        rows = (len(tiles) + ATLAS_COLUMNS - 1) // ATLAS_COLUMNS or 1
+        atlas = pygame.Surface((tile_width * ATLAS_COLUMNS, tile_height * rows), pygame.SRCALPHA)
+        index = {}
+
+        for number, key in enumerate(sorted(tiles)):
+            image = tiles[key]
+            x = (number % ATLAS_COLUMNS) * tile_width
+            y = (number // ATLAS_COLUMNS) * tile_height
+            atlas.blit(image, (x, y))
+            gid, last_row = key
+            index["%s,%s" % (gid, 1 if last_row else 0)] = [x, y, image.get_width(), image.get_height()]
+
+        try:
+            self.save_image(atlas, self.cache_path + ATLAS_EXT)
+            self.save_image(background, self.cache_path + BACKGROUND_EXT)
+            '''the index is written last, it marks the atlas as complete'''
+            with open(self.cache_path + INDEX_EXT, "w") as index_file:
+                json.dump({"version": ATLAS_VERSION, "digest": self.digest, "tiles": index,
+                           "atlas_size": atlas.get_size(), "background_size": background.get_size()}, index_file)
+        except (OSError, pygame.error):
+            log.info("could not write the tile atlas %s" % self.cache_path)
+
+    @staticmethod
+    def read_pixels(path):
+        """read the raw RGBA pixels of an image"""
+        with open(path, "rb") as image_file:
+            return image_file.read()
+
+    @staticmethod
+    def to_surface(pixels, size):
+        """turn raw RGBA pixels into a surface, only on the main thread"""
+        return pygame.image.fromstring(pixels, tuple(size), "RGBA").convert_alpha()
+
+    @staticmethod
+    def save_image(surface, path):
+        """write the raw RGBA pixels of a surface"""
+        with open(path, "wb") as image_file:
+            image_file.write(pygame.image.tostring(surface, "RGBA"))
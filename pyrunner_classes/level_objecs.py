@@ -3,9 +3,13 @@
 """Collection of classes that are used as Level Sprites (Blocks, Ropes, Ladders, Gold etc)"""
 
 from pygame.locals import *
-from pyrunner_classes import logging, pygame, datetime
+from pyrunner_classes import logging, pygame
 import dateutil.parser
 from pyrunner_classes.spritesheet_handling import SpriteSheet
+from pyrunner_classes.spatial_grid import SpatialGrid
+from pyrunner_classes.tile_map import TileMap, COLLECTIBLE, EXIT
+from pyrunner_classes.headless import HeadlessImage
+from pyrunner_classes.game_clock import GameClock
 
 log = logging.getLogger("World Objects")
 
@@ -15,6 +19,13 @@ class WorldObject(pygame.sprite.DirtySprite):
 
     group = pygame.sprite.LayeredDirty(default_layer=0)
     removed = pygame.sprite.LayeredDirty(default_layer=0)
+    '''tile indexed lookups for the sprites of both groups'''
+    grid = SpatialGrid()
+    removed_grid = SpatialGrid()
+    '''flags of all tiles in the level'''
+    tile_map = TileMap()
+    '''scaled images of the dig, restore and collect animations, shared by all tiles with the same image'''
+    frames = {}
     network_kill_list = []
 
     def __init__(self, tile, size, tile_id, fps=25, solid=True, removable=False, restoring=False):
@@ -44,12 +55,14 @@ class WorldObject(pygame.sprite.DirtySprite):
         self.exit = False
 
         if restoring:
-            self.image = pygame.Surface((self.width, self.height), SRCALPHA)
+            self.image = HeadlessImage.create_surface((self.width, self.height), SRCALPHA)
             self.rect.y += self.height
             self.rect.height = 0
         else:
             self.image = self.image_backup
 
+        WorldObject.grid.add(self)
+
     def update(self):
         """update world objects"""
         if self.killed or self.restoring:
@@ -74,13 +87,26 @@ class WorldObject(pygame.sprite.DirtySprite):
                 self.rect.x = self.pos_x
                 self.rect.y = self.pos_y
                 self.restoring = False
+                WorldObject.grid.move(self)
             else:
                 rect = pygame.Rect(x, y, w, h)
-                self.image = pygame.transform.scale(self.image_backup, (w, h)).convert_alpha()
+                self.image = self.scaled_frame(self.image_backup, (w, h))
                 self.rect = rect
+                WorldObject.grid.move(self)
 
             self.dirty = 1
 
+    @staticmethod
+    def scaled_frame(image, size):
+        """returns a scaled copy of the image which is created only once for every size"""
+        key = image, size
+        if HeadlessImage.enabled:
+            return HeadlessImage(size)
+        frame = WorldObject.frames.get(key)
+        if frame is None:
+            frame = WorldObject.frames[key] = pygame.transform.scale(image, size).convert_alpha()
+        return frame
+
     def update_indices(self):
         """update all group indexes for all objects that follow this one in the list"""
         for index, world_object in enumerate(WorldObject.group, self.index - 1):
@@ -114,22 +140,27 @@ class WorldObject(pygame.sprite.DirtySprite):
         """remove this sprite"""
         if self.removable or self.collectible:
             if not self.killed and self.removable:
+                WorldObject.tile_map.remove(self.tile_id)
                 if timer:
                     RemovedBlock(self.tile, self.rect.size, self.tile_id, self.fps, 10, timer)
                 else:
                     RemovedBlock(self.tile, self.rect.size, self.tile_id, self.fps, 10)
+            elif not self.killed:
+                WorldObject.tile_map.clear(self.cell, COLLECTIBLE)
             self.killed = True
         else:
             '''let the network server know which sprite got killed'''
             WorldObject.network_kill_list.append(self.index)
             '''always update the indices'''
             self.update_indices()
+            WorldObject.tile_map.remove(self.tile_id)
             '''remove the tile from all groups'''
             self.super_kill()
         
     def super_kill(self):
         """call the parent class kill function"""
         self.dirty = 1
+        WorldObject.grid.remove(self)
         pygame.sprite.DirtySprite.kill(self)
 
 
@@ -158,13 +189,24 @@ class Collectible(WorldObject):
         self.got_dropped = True
         self.frame_counter = 0
         self.ground = None
+        '''the tile the gold is in right now'''
+        self.cell = tile_id
+
+    def update_cell(self):
+        """move the gold flag in the tile map to the current position"""
+        cell = WorldObject.grid.cell_at(*self.rect.center)
+        if cell != self.cell:
+            WorldObject.tile_map.clear(self.cell, COLLECTIBLE)
+            WorldObject.tile_map.set(cell, COLLECTIBLE)
+            self.cell = cell
 
     def update(self):
         """fall down to the ground"""
         if self.got_dropped:
             on_ground = False
 
-            for tile in WorldObject.group:
+            '''only sprites in the tiles below the gold can be the ground'''
+            for tile in WorldObject.grid.candidates(self.rect.move(0, self.change_coll_h)):
                 if tile != self and not tile.collectible:
                     if self.rect.collidepoint(tile.rect.centerx, tile.rect.top - self.change_coll_h):
                         on_ground = True
@@ -196,6 +238,9 @@ class Collectible(WorldObject):
                     self.frame_counter += 1
                     log.debug(str(self.rect.bottom) + " vs " + str(self.ground.rect.top))
 
+            WorldObject.grid.move(self)
+            self.update_cell()
+
         super(Collectible, self).update()
 
 
@@ -209,28 +254,35 @@ class RemovedBlock(pygame.sprite.DirtySprite):
         self.fps = fps
         self.time_out = time_out
         if timer == None:
-            self.timer = datetime.now()
+            self.timer = GameClock.now()
         else:
             self.timer = timer
         self.width, self.height = self.size
         self.pos_x, self.pos_y, self.restore_image = self.tile
-        self.image = pygame.Surface(size, SRCALPHA)
+        self.image = HeadlessImage.create_surface(size, SRCALPHA)
         self.rect = self.image.get_rect()
         self.rect.x = self.pos_x
         self.rect.y = self.pos_y
         self.counter = 0
         self.trapped = False
+        WorldObject.removed_grid.add(self)
 
     def update(self):
         """countdown on each update until the object get's restored"""
-        if (datetime.now() - self.timer).seconds >= self.time_out:
+        if (GameClock.now() - self.timer).seconds >= self.time_out:
             self.restore()
             self.kill()
 
     def restore(self):
         """recreate a sprite with the same values"""
+        WorldObject.tile_map.restore(self.tile_id)
         return WorldObject(self.tile, self.size, self.tile_id, self.fps, True, True, True)
 
+    def kill(self):
+        """remove the block from the removed group"""
+        WorldObject.removed_grid.remove(self)
+        pygame.sprite.DirtySprite.kill(self)
+
 
 class ExitGate(WorldObject):
     """let's the player return to the next level"""
@@ -245,6 +297,7 @@ class ExitGate(WorldObject):
         tile = self.rect.x, self.rect.y, self.image
         WorldObject.__init__(self, tile, (size, size), True)
         self.exit = True
+        WorldObject.tile_map.set(WorldObject.grid.cell_at(*self.rect.center), EXIT)
         self.spawned = False
         self.killed = False
         self.count_fps = 0
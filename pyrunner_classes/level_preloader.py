@@ -0,0 +1,67 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""thread that prepares the next level while the current one is played"""
+
+# universal imports
+import threading
+from pyrunner_classes import logging, pygame
+from pyrunner_classes.level_atlas import LevelAtlas
+
+log = logging.getLogger("Level Preloader")
+
+
+class LevelPreloader(threading.Thread):
+    """Parses the tmx file and reads the cached tile atlas of a level in the background
+
+    The sprites can't be created here because they are stored in the global sprite groups of the
+    current level, so the main thread only has to create the sprites when it switches the level.
+    Neither can the surfaces: converting them against the display isn't thread safe while the
+    render thread draws, so take() turns the read pixels into surfaces on the main thread.
+
+    Args:
+        path (str): path of the tmx file to preload
+        screen_size ((int, int)): size of the level surface
+        daemon (Optional[bool]): quit this thread if main program quits
+
+    Attributes:
+        atlas (LevelAtlas): the prepared level data or None if loading failed
+    """
+
+    def __init__(self, path, screen_size, daemon=True):
+        threading.Thread.__init__(self)
+        self.path = path
+        self.screen_size = screen_size
+        self.daemon = daemon
+        self.atlas = None
+
+    def run(self):
+        """load the level data"""
+        try:
+            atlas = LevelAtlas(self.path, self.screen_size)
+            atlas.read()
+            self.atlas = atlas
+            log.info("preloaded %s" % self.path)
+        except (OSError, ValueError, SyntaxError) as error:
+            log.info("could not preload %s: %s" % (self.path, error))
+
+    def take(self, path, screen_size):
+        """hand the preloaded data over to the main thread and create its surfaces there
+
+        Args:
+            path (str): path of the level that is about to be loaded
+            screen_size ((int, int)): size of the level surface
+
+        Returns:
+            LevelAtlas: the prepared level or None if it belongs to another level or failed
+        """
+        if path != self.path or screen_size != self.screen_size:
+            return None
+        '''wait for the rest, it's never slower than loading the level right now'''
+        self.join()
+        if self.atlas:
+            try:
+                self.atlas.load_map()
+            except (OSError, ValueError, SyntaxError, pygame.error) as error:
+                log.info("could not preload %s: %s" % (self.path, error))
+                return None
+        return self.atlas
@@ -323,7 +323,11 @@ class MainMenu(object):
 
     def reload_level(self, restart=False):
         """retry/reload the current level"""
-        if restart:
+        server = self.main.network_connector.server
+        if server and server.LOCKSTEP:
+            '''all clients start over in the same step, the own one too'''
+            server.start_lockstep(self.main.START_LEVEL if restart else self.main.level.path)
+        elif restart:
             self.main.load_level(self.main.START_LEVEL)
         else:
             self.main.load_level()
@@ -0,0 +1,105 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""several headless matches in one dedicated server process"""
+
+import multiprocessing
+from pyrunner_classes import logging, pygame, Level, Player, GoldScore, WorldObject
+from pyrunner_classes.headless_server import HeadlessServer
+from pyrunner_classes.network_connector import START_PORT
+from pyrunner_classes.spatial_grid import SpatialGrid
+from pyrunner_classes.tile_map import TileMap
+
+log = logging.getLogger("Match Server")
+
+
+class Match(HeadlessServer):
+    """
+        one headless game with its own level, sprite groups, bots, network server and clients
+
+        the game classes keep their sprites in class attributes, every match owns a set of them
+        and swaps it in before it runs, so several matches can share one process
+    """
+
+    def __init__(self, port, fps=25, precompute_paths=False):
+        self.state = self.new_state()
+        self.activate()
+        HeadlessServer.__init__(self, port, fps, precompute_paths)
+
+    @staticmethod
+    def new_state():
+        """empty groups, lists and grids for all class attributes a match needs for itself"""
+        return {
+            (Level, 'players'): [],
+            (Level, 'bots'): [],
+            (Player, 'group'): pygame.sprite.LayeredDirty(default_layer=1),
+            (Player, 'humans'): pygame.sprite.Group(),
+            (Player, 'bots'): pygame.sprite.Group(),
+            (GoldScore, 'scores'): pygame.sprite.LayeredDirty(default_layer=1),
+            (WorldObject, 'group'): pygame.sprite.LayeredDirty(default_layer=0),
+            (WorldObject, 'removed'): pygame.sprite.LayeredDirty(default_layer=0),
+            (WorldObject, 'grid'): SpatialGrid(),
+            (WorldObject, 'removed_grid'): SpatialGrid(),
+            (WorldObject, 'tile_map'): TileMap(),
+            (WorldObject, 'network_kill_list'): [],
+        }
+
+    def activate(self):
+        """make the groups of this match the ones all game classes work with"""
+        for (cls, name), value in self.state.items():
+            setattr(cls, name, value)
+
+    def step(self):
+        """simulate one step of this match"""
+        self.activate()
+        HeadlessServer.step(self)
+
+
+class MatchServer(object):
+    """
+        runs several matches round robin in one process, every tick each match simulates one step
+
+        the matches listen on consecutive ports starting with port
+    """
+
+    def __init__(self, matches, port=None, fps=25, precompute_paths=False):
+        port = port if port else START_PORT
+        self.fps = fps
+        self.game_is_running = True
+        self.matches = [Match(port + number, fps, precompute_paths) for number in range(matches)]
+        log.info("running %s matches" % len(self.matches))
+
+    def start_game(self):
+        """main server loop"""
+        clock = pygame.time.Clock()
+
+        while self.game_is_running:
+            for match in self.matches:
+                match.step()
+            clock.tick(self.fps)
+
+    def quit_game(self):
+        """stop all matches"""
+        self.game_is_running = False
+        for match in self.matches:
+            match.quit_game()
+
+    @staticmethod
+    def start_pool(matches, processes, port=None, fps=25, precompute_paths=False):
+        """spread the matches over several processes which run their share round robin, blocks until they quit"""
+        port = port if port else START_PORT
+        per_process = -(-matches // processes)
+        workers = []
+
+        for first in range(0, matches, per_process):
+            count = min(per_process, matches - first)
+            worker = multiprocessing.Process(target=run_matches, args=(count, port + first, fps, precompute_paths))
+            worker.start()
+            workers.append(worker)
+
+        for worker in workers:
+            worker.join()
+
+
+def run_matches(matches, port, fps=25, precompute_paths=False):
+    """entry point of the worker processes of MatchServer.start_pool"""
+    MatchServer(matches, port, fps, precompute_paths).start_game()
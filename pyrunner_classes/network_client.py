@@ -5,10 +5,12 @@
 from __future__ import division
 
 import pdb
+import time
+import select
 import threading
-import json
+from collections import deque
 
-from pyrunner_classes import logging, datetime, Controller, WorldObject
+from pyrunner_classes import logging, datetime, Controller, WorldObject, GameClock
 from pyrunner_classes.network_shared import *
 
 net_log = logging.getLogger("Network")
@@ -16,24 +18,78 @@ client_log = net_log.getChild("Client")
 
 
 class Client(threading.Thread, MastermindClientTCP):
-    """the network client"""
-
-    def __init__(self, ip, port, main, master):
+    """
+        the network client
+
+        the own player is moved by its inputs right away and corrected when the server simulated them differently,
+        the other players and the bots are shown a few ticks in the past between two snapshots of the server
+
+        in a lockstep game the client simulates everything itself and only the keys of the players get exchanged,
+        the keys of each step get applied by all clients before they run it
+    """
+
+    '''simulation steps the own inputs are kept for to replay them'''
+    PREDICTION_HISTORY = 64
+    '''tiles the own player may be off before the client rewinds to the position of the server'''
+    PREDICTION_TOLERANCE = 0.1
+    '''ticks the other actors are shown in the past, lost or late snapshots in between get interpolated'''
+    INTERPOLATION_TICKS = 2
+    '''seconds the receive thread waits for data before it checks if the client is still connected'''
+    RECEIVE_WAIT = 0.1
+
+    def __init__(self, ip, port, main, master, codec=None):
         self.port = port
         self.target_ip = ip
         self.main = main
         self.master = master
+        self.codec = codec if codec else BinaryCodec()
         threading.Thread.__init__(self, daemon=True)
-        MastermindClientTCP.__init__(self)
+        self.init_transport()
         self.timer = datetime.now()  # timer for the keep Alive
         self.player_id = None
         self.connected = False
+        self.input_seq = 0
+        '''(time of arrival, message type, message data) queued by the receive thread for update()'''
+        self.inbox = deque()
+        '''messages that waited at the last update, how long the oldest one waited and how many got dropped'''
+        self.queue_depth = 0
+        self.queue_age = 0.0
+        self.superseded = 0
+        '''lockstep: step -> [(key, player id)], the keys pressed since the last step and the last step sent for'''
+        self.lockstep_inputs = {}
+        self.lockstep_keys = []
+        self.lockstep_sent = 0
+        self.desyncs = 0
+        self.reset_snapshots()
+
+    def init_transport(self):
+        """set up the mastermind client"""
+        MastermindClientTCP.__init__(self)
+
+    def send_encoded(self, message_type, encoded):
+        """send an encoded message of the given type to the server"""
+        self.send(encoded, compression=COMPRESSION)
+
+    def receive_encoded(self):
+        """the next message of the server, waits RECEIVE_WAIT seconds for one and returns None if there's none"""
+        raw_data = self.receive(False)
+        if raw_data is None:
+            select.select([self._mm_socket], [], [], self.RECEIVE_WAIT)
+        return raw_data
 
     def send_key(self, key):
-        """send the current pressed key action"""
+        """predict the current pressed key action and send it"""
         client_log.info("Sending key Action %s to server" % key)
-        data = json.dumps({'type': Message.type_key_update, 'data': str(key)})
-        self.send(data, compression=COMPRESSION)
+        if GameClock.deterministic:
+            '''sent with the next step, see send_lockstep_input'''
+            self.lockstep_keys.append(str(key))
+            return
+        self.input_seq += 1
+        if self.player_id is not None:
+            Controller.do_action(key, self.player_id)
+            self.step_inputs.append((self.input_seq, str(key)))
+        self.send_data_to_server(Message.type_key_update,
+                                 {'key': str(key), 'player_id': self.player_id, 'seq': self.input_seq})
 
     def run(self):
         """keep the server running"""
@@ -43,7 +99,8 @@ class Client(threading.Thread, MastermindClientTCP):
             client_log.info("Client connecting, waiting for initData")
             self.connected = True
             self.wait_for_init_data()
-        except (OSError, MastermindErrorSocket, MastermindErrorClient):
+            self.receive_messages()
+        except (OSError, MastermindErrorSocket, MastermindErrorClient, ProtocolError):
             error = "An error occurred connecting to the server."
             error += " %s:%s Please try again later." % (self.target_ip, self.port)
             self.main.menu.network.print_error(error)
@@ -51,9 +108,9 @@ class Client(threading.Thread, MastermindClientTCP):
 
     def wait_for_init_data(self):
         """start the server and wait for players to connect"""
-        init_data_raw = self.receive(True)
-        data = json.loads(init_data_raw)
-        if data['type'] == 'init':
+        message_type, message_data = self.codec.decode(self.receive(True))
+        data = {'type': message_type, 'data': message_data}
+        if data['type'] == Message.type_init_data:
             client_log.info("Client got init Data, creating new Player")
             contents = data['data']
             self.player_id = int(contents['player_id'])
@@ -106,10 +163,9 @@ class Client(threading.Thread, MastermindClientTCP):
         data = {'player_id': self.player_id}
         self.send_data_to_server(Message.type_init, data)
 
-    def send_data_to_server(self, message_type, py_data):
+    def send_data_to_server(self, message_type, py_data=None):
         """send data from the client back to the server"""
-        data = json.dumps({'type': message_type, 'data': py_data})
-        self.send(data, compression=COMPRESSION)
+        self.send_encoded(message_type, self.codec.encode(message_type, py_data))
 
     def kill(self):
         """stop the client"""
@@ -118,93 +174,319 @@ class Client(threading.Thread, MastermindClientTCP):
         except AttributeError:
             pass
         self.connected = False
+        GameClock.stop()
+
+    def receive_messages(self):
+        """receive thread, decodes everything the server sends and queues it until the next update"""
+        while self.connected:
+            try:
+                raw_data = self.receive_encoded()
+            except (OSError, ValueError, MastermindErrorClient):
+                '''the connection got closed'''
+                break
+            if raw_data is None:
+                continue
+            try:
+                '''the received data is only valid until the next receive, the decoded message stays'''
+                message_type, message_data = self.codec.decode(raw_data)
+            except ProtocolError as error:
+                client_log.warning("dropped message from server: %s" % error)
+                continue
+            self.inbox.append((time.time(), message_type, message_data))
+
+    def take_messages(self):
+        """all queued messages in order, of the superseded types only the newest since the last level change"""
+        messages = [self.inbox.popleft() for _ in range(len(self.inbox))]
+        self.queue_depth = len(messages)
+        self.queue_age = time.time() - messages[0][0] if messages else 0.0
+        if messages:
+            client_log.debug("%s messages waited, the oldest %.3f seconds" % (self.queue_depth, self.queue_age))
+
+        newest = []
+        seen = set()
+        for received, message_type, message_data in reversed(messages):
+            if message_type == Message.type_level_changed:
+                '''snapshots of the old level don't replace the ones of the new level'''
+                seen.clear()
+            elif message_type in Message.SUPERSEDED:
+                if message_type in seen:
+                    self.superseded += 1
+                    continue
+                seen.add(message_type)
+            newest.append((message_type, message_data))
+        newest.reverse()
+        return newest
 
     def update(self):
-        """run the client"""
+        """run the client, this gets called once per simulation step and handles all messages that arrived"""
         self.send_keep_alive()
-        raw_data = self.receive(False)
-
-        if raw_data:
-            data = json.loads(raw_data)
-            client_log.info("Got data from server: {}".format(str(data)))
-            if data['type'] == Message.type_key_update:
-                client_log.info("got key_update from server")
+        if GameClock.deterministic:
+            self.send_lockstep_input()
+        else:
+            self.store_prediction()
+        for message_type, message_data in self.take_messages():
+            self.handle_data(message_type, message_data)
+        if not GameClock.deterministic:
+            self.interpolate_actors()
+
+    def begin_step(self):
+        """apply the keys of all players for the next step of a lockstep game, False if they didn't arrive yet"""
+        if not GameClock.deterministic:
+            return True
+        for message_type, message_data in self.take_messages():
+            self.handle_data(message_type, message_data)
+        inputs = self.lockstep_inputs.pop(GameClock.tick + 1, None)
+        if inputs is None:
+            return False
+        GameClock.step()
+        for key, player_id in inputs:
+            Controller.do_action(key, player_id)
+        return True
+
+    def send_lockstep_input(self):
+        """send the keys pressed in the last step for the step INPUT_DELAY steps later with the world hash after it"""
+        if GameClock.tick <= self.lockstep_sent:
+            return
+        self.lockstep_sent = GameClock.tick
+        self.send_data_to_server(Message.type_lockstep_input,
+                                 {'tick': GameClock.tick + GameClock.INPUT_DELAY, 'player_id': self.player_id,
+                                  'keys': self.lockstep_keys, 'hash': self.main.level.get_world_hash()})
+        self.lockstep_keys = []
+
+    def start_lockstep(self, data):
+        """load the level with the players of all clients, all of them start it in the same step with the same seed"""
+        client_log.info("Starting lockstep game at step {}".format(data['tick']))
+        start = data['tick']
+        world_hash = self.main.network_connector.load_lockstep_level(data['level'], data['players'], data['seed'],
+                                                                     start)
+        '''nobody pressed keys for the first steps'''
+        self.lockstep_inputs = dict((tick, []) for tick in range(start + 1, start + GameClock.INPUT_DELAY + 1))
+        self.lockstep_keys = []
+        self.lockstep_sent = start
+        self.reset_snapshots()
+        if world_hash != data['hash']:
+            '''every step would desync, a client that can't start from the same world can't play along'''
+            self.desyncs += 1
+            client_log.warning("The world differs from the server's at step {}, leaving the game".format(start))
+            self.kill()
+            self.main.menu.network.print_error("Your level differs from the one of the server.")
+            return
+        self.main.menu.show_menu(False)
+
+    def handle_data(self, message_type, message_data):
+        """handle a message of the server"""
+        data = {'type': message_type, 'data': message_data}
+        client_log.info("Got data from server: {}".format(str(data)))
+        if data['type'] == Message.type_key_update:
+            client_log.info("got key_update from server")
+            if data['data']['player_id'] != self.player_id:
+                '''the own keys got predicted when they were pressed'''
                 Controller.do_action(data['data']['key'], data['data']['player_id'])
-                return
+            return
 
-            if data['type'] == Message.type_bot_update:
-                client_log.info("got bot_update from server")
-                Controller.bot_action(data['data']['key'], data['data']['bot_id'])
-                return
+        if data['type'] == Message.type_bot_update:
+            client_log.info("got bot_update from server")
+            Controller.bot_action(data['data']['key'], data['data']['bot_id'])
+            return
 
-            if data['type'] == Message.type_init:
-                client_log.info("got init succ")
-                try:
-                    self.main.level.players[int(data['data']['player_id'])]
-                except IndexError:
-                    pid = len(self.main.level.players)
-                    self.main.level.add_player(pid)
-                self.main.menu.show_menu(False)
-                return
-
-            if data['type'] == Message.type_client_dc:
-                client_log.info("A client disconnected, removing from game")
-                pid = data['data']['client_id']
-                if not self.main.level.remove_player(pid):
-                    client_log.error("Could not remove player form player list!")
-                else:
-                    client_log.info("removed player form playerlist")
-                return
-
-            if data['type'] == Message.type_comp_update:
-                client_log.info("Sending own Pos to Server")
-                self.send_current_pos_and_data()
-                return
-
-            if data['type'] == Message.type_comp_update_states:
-                client_log.info("Sending own states to Server")
-                player = self.main.level.players[self.player_id]
-                player_info = self.main.level.get_normalized_pos_and_data(player, False, False)
-                self.send_data_to_server(Message.type_comp_update, player_info)
-                return
-
-            if data['type'] == Message.type_level_changed:
-                client_log.info("Got change level from Server")
-                level_name = data['data'][Message.field_level_name]
-                self.main.load_level(level_name)
-                return
-
-            if data['type'] == Message.type_comp_update_set:
-                '''don't set the positions on the server'''
-                #pdb.set_trace()
-                player_id, normalized_pos, is_bot, info = data['data']['player_info']
-                removed_blocks = data['data']['block_info']
-                player_id = int(player_id)
-                is_bot = bool(is_bot)
-
-                if is_bot or player_id != self.player_id:
-                    client_log.debug("received player data: ", data['data'])
-                    client_log.info("Got pos setter from server")
-                    client_log.debug("setting player data: ", data['data'])
-                    self.main.level.set_player_data(player_id, normalized_pos, is_bot, info)
-
-                    client_log.info("removing blocks if there are still in the World")
-                    if removed_blocks:
-                        WorldObject.remove_blocks_by_ids(removed_blocks)
-                return
-
-            if data['type'] == Message.type_gold_removed:
-                # Todo maybe remove gold if the sync is not working
-                client_log.info("Gold removed received from server, killing gold")
-                WorldObject.kill_world_object(data['data'])
-                return
-
-            if data['type'] == Message.type_player_killed:
-                client_log.info("Got player killed from Server")
-                pdb.set_trace()
-                for player in self.main.level.players:
-                    if player.player_id == data['data']:
-                        player.kill()
+        if data['type'] == Message.type_init:
+            client_log.info("got init succ")
+            try:
+                self.main.level.players[int(data['data']['player_id'])]
+            except IndexError:
+                pid = len(self.main.level.players)
+                self.main.level.add_player(pid)
+            self.main.menu.show_menu(False)
+            return
+
+        if data['type'] == Message.type_client_dc:
+            client_log.info("A client disconnected, removing from game")
+            pid = data['data']['client_id']
+            if not self.main.level.remove_player(pid):
+                client_log.error("Could not remove player form player list!")
+            else:
+                client_log.info("removed player form playerlist")
+            return
+
+        if data['type'] == Message.type_comp_update:
+            client_log.info("Sending own Pos to Server")
+            self.send_current_pos_and_data()
+            return
+
+        if data['type'] == Message.type_comp_update_states:
+            client_log.info("Sending own states to Server")
+            player = self.main.level.players[self.player_id]
+            player_info = self.main.level.get_normalized_pos_and_data(player, False, False)
+            self.send_data_to_server(Message.type_comp_update, {'player_info': player_info, 'block_info': []})
+            return
+
+        if data['type'] == Message.type_level_changed:
+            client_log.info("Got change level from Server")
+            level_name = data['data'][Message.field_level_name]
+            self.reset_snapshots()
+            self.main.load_level(level_name)
+            return
+
+        if data['type'] == Message.type_snapshot:
+            client_log.info("Got snapshot {} from server".format(data['data']['tick']))
+            self.apply_snapshot(data['data'])
+            return
+
+        if data['type'] == Message.type_lockstep_tick:
+            self.lockstep_inputs[data['data']['tick']] = data['data']['inputs']
+            return
+
+        if data['type'] == Message.type_lockstep_start:
+            self.start_lockstep(data['data'])
+            return
+
+        if data['type'] == Message.type_lockstep_desync:
+            self.desyncs += 1
+            client_log.warning("Desynced from the other clients in step {}, starting over".format(data['data']))
+            return
+
+        if data['type'] == Message.type_gold_removed:
+            # Todo maybe remove gold if the sync is not working
+            client_log.info("Gold removed received from server, killing gold")
+            WorldObject.kill_world_object(data['data'])
+            return
+
+        if data['type'] == Message.type_player_killed:
+            client_log.info("Got player killed from Server")
+            pdb.set_trace()
+            for player in self.main.level.players:
+                if player.player_id == data['data']:
+                    player.kill()
+
+    def reset_snapshots(self):
+        """forget all snapshots and predictions, the next snapshot from the server is a full one"""
+        '''tick -> Snapshot, the empty snapshot 0 is the baseline of full snapshots'''
+        self.snapshots = {0: Snapshot()}
+        self.snapshot = self.snapshots[0]
+        '''the latest snapshots in order of their ticks, the other actors are interpolated between them'''
+        self.timeline = deque(maxlen=4 * self.INTERPOLATION_TICKS)
+        self.render_tick = 0
+        '''one entry per simulation step with the inputs predicted in it and the state of the own player after it'''
+        self.history = deque(maxlen=self.PREDICTION_HISTORY)
+        self.step_inputs = []
+
+    def apply_snapshot(self, delta):
+        """set everything that changed since the last snapshot and acknowledge it"""
+        base = self.snapshots.get(delta['base'])
+        if not base:
+            '''the baseline is gone, ask for a full snapshot'''
+            self.send_data_to_server(Message.type_snapshot_ack, 0)
+            return
+
+        snapshot = base.apply(delta)
+        changes = snapshot.delta(self.snapshot)
+        if not self.timeline or snapshot.tick > self.timeline[-1].tick:
+            self.timeline.append(snapshot)
+        self.reconcile(snapshot)
+        if changes['blocks']:
+            WorldObject.remove_blocks_by_ids(changes['blocks'])
+        if changes['gold']:
+            self.main.level.physics.remove_sprites_by_id(changes['gold'])
+
+        '''the server never uses an older baseline than the one it just used'''
+        for tick in [tick for tick in self.snapshots if 0 < tick < base.tick]:
+            del self.snapshots[tick]
+        self.snapshots[snapshot.tick] = snapshot
+        self.snapshot = snapshot
+        self.send_data_to_server(Message.type_snapshot_ack, snapshot.tick)
+
+    def own_player(self):
+        """the player of this client or None"""
+        try:
+            return self.main.level.players[self.player_id] if self.player_id is not None else None
+        except (IndexError, TypeError):
+            return None
+
+    def store_prediction(self):
+        """remember the inputs of the last simulation step and where they brought the own player"""
+        player = self.own_player()
+        if player:
+            state = self.main.level.get_normalized_pos_and_data(player, False)
+            self.history.append({'inputs': self.step_inputs, 'state': state})
+        self.step_inputs = []
+
+    @staticmethod
+    def mispredicted(predicted, record):
+        """True if two positions of the own player are too far apart, they get compared in tiles"""
+        (x, y, diff), (server_x, server_y, server_diff) = predicted, record
+        tile_size, server_tile_size = 32 + diff, 32 + server_diff
+        return abs(x / tile_size - server_x / server_tile_size) > Client.PREDICTION_TOLERANCE or \
+            abs(y / tile_size - server_y / server_tile_size) > Client.PREDICTION_TOLERANCE
+
+    def reconcile(self, snapshot):
+        """compare the own player with the server and replay the inputs the server didn't simulate on a mismatch"""
+        player = self.own_player()
+        record = snapshot.actors.get((False, self.player_id))
+        applied = snapshot.inputs.get(self.player_id)
+        if not player or not record or not record[1] or not applied or player.spawning or player.killed:
+            return
+        seq, tick = applied
+
+        '''find the step the input got predicted in, the server simulated it for snapshot.tick - tick steps'''
+        for index, entry in enumerate(self.history):
+            if any(input_seq == seq for input_seq, key in entry['inputs']):
+                break
+        else:
+            return
+        index += snapshot.tick - tick - 1
+        if not 0 <= index < len(self.history):
+            return
+        if not self.mispredicted(self.history[index]['state'][1], record[1]) or record[3][3]:
+            return
+
+        client_log.info("Misprediction of input {} at tick {}, replaying".format(seq, snapshot.tick))
+        self.main.level.set_player_data(self.player_id, record[1], False, record[3])
+        self.history[index]['state'] = self.main.level.get_normalized_pos_and_data(player, False)
+        '''inputs the server didn't get yet, the ones of the rewound steps are applied with the first replayed step'''
+        pending = [(input_seq, key) for number, entry in enumerate(self.history) if number <= index
+                   for input_seq, key in entry['inputs'] if input_seq > seq]
+        for entry in list(self.history)[index + 1:]:
+            for input_seq, key in pending + entry['inputs']:
+                if input_seq > seq:
+                    Controller.do_action(key, self.player_id)
+            pending = []
+            self.main.level.physics.replay_step(player)
+            entry['state'] = self.main.level.get_normalized_pos_and_data(player, False)
+
+    def interpolate_actors(self):
+        """move the other players and the bots between the two snapshots around the render tick"""
+        if not self.timeline:
+            return
+        latest = self.timeline[-1].tick
+        target = latest - self.INTERPOLATION_TICKS
+        '''run a little faster or slower until the delay is back at INTERPOLATION_TICKS, never past the latest'''
+        render_tick = self.render_tick + 1
+        speed = 0.25 if render_tick < target else -0.25 if render_tick > target else 0
+        self.render_tick = min(render_tick + speed, latest)
+        if self.render_tick < latest - 2 * self.INTERPOLATION_TICKS:
+            '''the server got too far ahead, jump to the usual delay'''
+            self.render_tick = target
+
+        older, newer = self.timeline[0], None
+        for snapshot in self.timeline:
+            if snapshot.tick <= self.render_tick:
+                older = snapshot
+            else:
+                newer = snapshot
+                break
+        alpha = (self.render_tick - older.tick) / (newer.tick - older.tick) if newer and older is not newer else 0
+
+        for key, (player_id, normalized_pos, is_bot, info) in older.actors.items():
+            if key == (False, self.player_id):
+                continue
+            other = newer.actors.get(key) if newer else None
+            if normalized_pos and other and other[1] and 0 < alpha:
+                x, y, diff = normalized_pos
+                new_x, new_y, new_diff = other[1]
+                '''don't interpolate jumps like respawns'''
+                if abs(new_x - x) <= 32 + diff and abs(new_y - y) <= 32 + diff:
+                    normalized_pos = round(x + (new_x - x) * alpha), round(y + (new_y - y) * alpha), diff
+            self.main.level.set_player_data(player_id, normalized_pos, is_bot, info)
 
     def send_current_pos_and_data(self):
         """send the current position and state vars to the server"""
@@ -220,11 +502,30 @@ class Client(threading.Thread, MastermindClientTCP):
     def send_keep_alive(self):
         """send keep alive if last was x seconds ago"""
         if (datetime.now() - self.timer).seconds > 4 and self.connected:
-            data = json.dumps({'type': Message.type_keep_alive})
             try:
-                self.send(data, compression=COMPRESSION)
+                self.send_data_to_server(Message.type_keep_alive)
                 self.timer = datetime.now()
             except MastermindErrorClient:
                 self.main.menu.network.print_error("An error occurred while trying to send data to the server.")
                 self.disconnect()
                 self.connected = False
+
+
+class UdpClient(MastermindClientReliableUDP, Client):
+    """network client that talks to the server over udp, see UdpServer"""
+
+    def __init__(self, ip, port, main, master, codec=None):
+        '''the mastermind udp classes come first so their sockets are used, the game client stays the same'''
+        Client.__init__(self, ip, port, main, master, codec)
+
+    def init_transport(self):
+        """set up the mastermind udp client"""
+        MastermindClientReliableUDP.__init__(self)
+
+    def send_encoded(self, message_type, encoded):
+        """send an encoded message of the given type to the server"""
+        self.send(encoded, compression=COMPRESSION, reliable=message_type in Message.RELIABLE)
+
+    def receive_encoded(self):
+        """the next message of the server, waiting for it keeps resending the reliable messages"""
+        return self.receive(True)
@@ -7,19 +7,25 @@ from __future__ import division
 import socket
 
 from time import sleep
-from pyrunner_classes import logging, Player
-from pyrunner_classes.network_server import Server
-from pyrunner_classes.network_client import Client
+from pyrunner_classes import logging, Player, GameClock
+from pyrunner_classes.network_server import Server, UdpServer
+from pyrunner_classes.network_client import Client, UdpClient
 from pyrunner_classes.zeroconf_bonjour import ZeroConfAdvertiser, ZeroConfListener
 from pyrunner_classes.network_shared import *
 
 START_PORT = 6799
+TRANSPORTS = {'tcp': (Server, Client), 'udp': (UdpServer, UdpClient)}
 net_log = logging.getLogger("Network")
 
 
 class NetworkConnector(object):
     """the main network class"""
 
+    '''how the messages get encoded, all clients and the server have to use the same one'''
+    codec = BinaryCodec()
+    '''key of TRANSPORTS, all clients and the server have to use the same one'''
+    transport = 'tcp'
+
     def __init__(self, main):
         self.ip = "0.0.0.0"
         self.socket_ip = socket.gethostbyname(socket.gethostname())
@@ -33,6 +39,7 @@ class NetworkConnector(object):
         self.browser = None
         self.advertiser = None
         self.local_game = False
+        self.headless = False
         self.register_physics_callback()
 
         '''get IP'''
@@ -84,7 +91,8 @@ class NetworkConnector(object):
             self.server.kill()
             self.clear_level()
 
-        self.server = Server(self.ip, self.port, self.main, local_only)
+        server_class, client_class = TRANSPORTS[self.transport]
+        self.server = server_class(self.ip, self.port, self.main, local_only, self.headless, self.codec)
         self.master = True
         self.server.start()
 
@@ -96,11 +104,12 @@ class NetworkConnector(object):
         """run a single player game"""
         self.start_server_prompt(START_PORT - 10, True)
 
-    def start_server_prompt(self, port=START_PORT, local_only=False):
-        """starting a network server from the main menu"""
+    def start_server_prompt(self, port=START_PORT, local_only=False, headless=False):
+        """starting a network server from the main menu or a headless server without a client of its own"""
         self.ip = "0.0.0.0" if not local_only else "127.0.0.1"
         self.port = port if port else START_PORT
         self.local_game = local_only
+        self.headless = headless
 
         def start_server():
             """try to start a server"""
@@ -125,7 +134,8 @@ class NetworkConnector(object):
         start_server()
 
         if self.server and self.server.connected:
-            self.join_server_prompt((self.ip, self.port))
+            if not headless:
+                self.join_server_prompt((self.ip, self.port))
             '''give the bots their brain'''
             for bot in Player.bots:
                 bot.master = True
@@ -168,16 +178,38 @@ class NetworkConnector(object):
             self.client.kill()
             self.clear_level()
 
-        self.client = Client(self.ip, self.port, self.main, self.master)
+        server_class, client_class = TRANSPORTS[self.transport]
+        self.client = client_class(self.ip, self.port, self.main, self.master, self.codec)
         self.client.start()
 
         if self.client and self.client.connected:
             net_log.info("connected to %s" % self.ip)
 
+    def load_lockstep_level(self, level, players, seed, tick):
+        """load the level with its players the way every client of a lockstep game starts it
+
+        Returns: the world hash before the first step, all clients have to start from the same world
+        """
+        GameClock.start(seed, tick, self.main.fps)
+        self.main.level.flush_network_players()
+        for player_id in range(players):
+            self.main.level.add_player(player_id)
+        self.main.load_level(level)
+        return self.main.level.get_world_hash()
+
+    def begin_step(self):
+        """False if a lockstep game has to wait for the keys of the other players before the next step"""
+        try:
+            return self.client.begin_step() if self.client else True
+        except (MastermindErrorClient, AttributeError):
+            return True
+
     def update(self):
         """update function that get's called by the main class"""
         try:
-            self.client.update()
-            self.server.update()
+            if self.client:
+                self.client.update()
+            if self.server:
+                self.server.update()
         except (MastermindErrorClient, AttributeError):
             pass
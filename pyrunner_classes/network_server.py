@@ -2,38 +2,120 @@
 # -*- coding: utf-8 -*-
 """Network Server"""
 
+import random
 import threading
-import json
+from collections import deque
 
-from pyrunner_classes import logging, datetime
+from pyrunner_classes import logging, datetime, Controller, WorldObject, GameClock
 from pyrunner_classes.network_shared import *
 
 net_log = logging.getLogger("Network")
 srvlog = net_log.getChild("Server")
 
 
+class Outbox(object):
+    """the messages waiting for one client, the writer thread of the server sends them in order"""
+
+    def __init__(self, limit, policy):
+        self.limit = limit
+        self.policy = policy
+        '''(message type, encoded message)'''
+        self.messages = deque()
+        self.dropped = 0
+
+    def put(self, message_type, encoded):
+        """queue a message, returns False if the client can't keep up and should be disconnected"""
+        if message_type in Message.SUPERSEDED:
+            '''a waiting older message of the same type is outdated, the new one takes its place at the end'''
+            for index, (waiting_type, waiting) in enumerate(self.messages):
+                if waiting_type == message_type:
+                    del self.messages[index]
+                    self.dropped += 1
+                    break
+        self.messages.append((message_type, encoded))
+
+        if len(self.messages) > self.limit:
+            if self.policy == Server.POLICY_DISCONNECT:
+                return False
+            self.messages.popleft()
+            self.dropped += 1
+        return True
+
+
 class Server(threading.Thread, MastermindServerTCP):
     """main network server"""
 
-    def __init__(self, ip, port, main, local_only=False):
+    '''snapshots kept as baseline for the deltas, clients that acknowledged an older one get a full snapshot'''
+    SNAPSHOT_HISTORY = 32
+    '''what happens if more than OUTBOX_LIMIT messages wait for a client, see Outbox'''
+    POLICY_DISCONNECT = 'disconnect'
+    POLICY_DROP_OLDEST = 'drop-oldest'
+    OUTBOX_LIMIT = 256
+    OUTBOX_POLICY = POLICY_DISCONNECT
+    '''actors further away from the player of a client than this many tiles are only sent every FAR_INTERVAL ticks'''
+    RELEVANT_DISTANCE = 10
+    FAR_INTERVAL = 3
+    '''clients without a living player get a snapshot every SPECTATOR_INTERVAL ticks'''
+    SPECTATOR_INTERVAL = 5
+    '''the clients only exchange their keys and all of them simulate the game themselves, see start_lockstep'''
+    LOCKSTEP = False
+
+    def __init__(self, ip, port, main, local_only=False, headless=False, codec=None):
         self.ip = ip
         self.port = port
         self.main = main
         self.local_only = local_only
+        '''a headless server runs the game itself instead of a client of its own'''
+        self.headless = headless
+        '''client events that change the level, update() runs them in the main loop'''
+        self.main_tasks = deque()
+        self.codec = codec if codec else BinaryCodec()
         self.known_clients = []
         self.own_client = None
         self.connected = False
         self.sync_interval = 10  # seconds
         self.sync_time = datetime.now()
         self.sprites_removed = []
+        self.tick = 0
+        '''tick -> Snapshot'''
+        self.snapshots = {}
+        '''connection -> tick of the last snapshot the client acknowledged'''
+        self.acked = {}
+        '''player id -> (sequence number of the last applied input, tick of the first snapshot with it)'''
+        self.inputs = {}
+        '''connection -> {tick: Snapshot} with what the client got, the deltas of the client are based on them'''
+        self.views = {}
+        '''lockstep: the step the game last started over at, the last step the keys got sent for,
+        step -> {player id: keys} and step -> {player id: world hash after the step}'''
+        self.lockstep_start = 0
+        self.lockstep_tick = 0
+        self.lockstep_inputs = {}
+        self.lockstep_hashes = {}
+        self.desyncs = 0
+        '''connection -> Outbox, the writer thread waits on the condition for new messages'''
+        self.outboxes = {}
+        self.outbox_condition = threading.Condition()
+        self.writer = threading.Thread(target=self.write_messages, daemon=True)
         threading.Thread.__init__(self, daemon=True)
+        self.init_transport()
+
+    def init_transport(self):
+        """set up the mastermind server the clients connect to"""
         MastermindServerTCP.__init__(self, 1, 1, 5.0)
 
+    def send_encoded(self, client, message, encoded):
+        """send an encoded message of the given type to one client"""
+        return self.callback_client_send(client, encoded)
+
     def callback_client_handle(self, connection_object, data):
         """Initial point of data arrival. Data is received and passed on"""
-        srvlog.info("got: '%s'" % str(data))
-        json_data = json.loads(data)
-        self.interpret_client_data(json_data, connection_object)
+        try:
+            message_type, message_data = self.codec.decode(data)
+        except ProtocolError as error:
+            srvlog.warning("dropped message from %s: %s" % (str(connection_object.address), error))
+            return
+        srvlog.info("got: '%s' %s" % (message_type, str(message_data)))
+        self.defer(self.interpret_client_data, {'type': message_type, 'data': message_data}, connection_object)
 
     def interpret_client_data(self, data, con_obj):
         """interprets data send from the client to the server"""
@@ -44,19 +126,37 @@ class Server(threading.Thread, MastermindServerTCP):
 
         if data['type'] == Message.type_key_update:
             srvlog.debug("Got key Update from Client")
-            self.send_key(data['data'], self.known_clients.index(con_obj))
+            player_id = self.known_clients.index(con_obj)
+            seq = data['data'].get('seq', 0)
+            if self.headless:
+                Controller.do_action(data['data']['key'], player_id)
+            '''the snapshots tell the client which of its predicted inputs the server simulates already'''
+            self.inputs[player_id] = (seq, self.tick + 1)
+            self.send_key(data['data']['key'], player_id, seq)
             return
 
         if data['type'] == Message.type_comp_update:
-            # sending the pos of the player to all the clients
+            # the server moves the players by their inputs, only the removed blocks are taken over
             srvlog.debug(data['data'])
-            self.send_to_all_clients(Message.type_comp_update_set, data['data'])
+            if self.known_clients.index(con_obj) != self.own_client:
+                self.main_tasks.append((self.set_player_info, (data['data'],)))
+            return
+
+        if data['type'] == Message.type_snapshot_ack:
+            self.acked[con_obj] = data['data']
+            return
+
+        if data['type'] == Message.type_lockstep_input:
+            self.collect_lockstep_input(self.known_clients.index(con_obj), data['data'])
             return
 
         if data['type'] == Message.type_init:
             player_id = data['data']['player_id']
             srvlog.debug("Init succ for client {}".format(player_id))
             self.send_to_all_clients(Message.type_init, data['data'])
+            if self.LOCKSTEP:
+                '''everyone starts over with the new player'''
+                self.start_lockstep(self.main.level.path)
             return
 
         if data['type'] == Message.type_gold_removed:
@@ -72,6 +172,11 @@ class Server(threading.Thread, MastermindServerTCP):
     def callback_connect_client(self, connection_object):
         """this methods gets called on initial connect of a client"""
         srvlog.info("New Client Connected %s" % str(connection_object.address))
+        self.defer(self.welcome_client, connection_object)
+        return super(MastermindServerTCP, self).callback_connect_client(connection_object)
+
+    def welcome_client(self, connection_object):
+        """send the current state of the game to a new client"""
         # adding ip to client list to generate the playerId
         if connection_object not in self.known_clients:
             srvlog.debug("Added client to known clients")
@@ -79,76 +184,199 @@ class Server(threading.Thread, MastermindServerTCP):
         # sending initial Data, to all clients so everyone is on the same page. TODO:  add info about enemies
         level_info = self.main.level.get_level_info_json()
         # the clients id
-        misc_info = {'player_id': str(self.known_clients.index(connection_object)),
+        misc_info = {'player_id': self.known_clients.index(connection_object),
                      Message.field_removed_sprites: self.sprites_removed}
         # concat the data
         combined = {}
         for d in (level_info, misc_info):
             combined.update(d)
 
-        data = json.dumps({'type': 'init', 'data': combined})
+        data = self.codec.encode(Message.type_init_data, combined)
 
-        self.callback_client_send(connection_object, data)
+        self.queue_message(connection_object, Message.type_init_data, data)
+        if self.headless:
+            '''the headless server plays along with the same player ids as the clients'''
+            self.main.level.add_player(self.known_clients.index(connection_object))
 
         # let the others know that there is a new client
 
         for client in self.known_clients:
             if client != connection_object:
-                self.callback_client_send(client, data)
+                self.queue_message(client, Message.type_init_data, data)
 
-        '''get the up to date player positions'''
-        self.send_to_all_clients(Message.type_comp_update)
-
-        '''and up to date bot positions'''
-        for bot in self.main.level.bots:
-            '''update the bot positions only on the clients'''
-            player_info = self.main.level.get_normalized_pos_and_data(bot, True)
-            srvlog.debug("sending bot data: ", player_info)
-            data = {'player_info':player_info, 'block_info':[]}
-            self.send_to_all_clients_except_self(Message.type_comp_update_set, data)
-
-        return super(MastermindServerTCP, self).callback_connect_client(connection_object)
+        '''get the up to date player positions, the new client gets a full snapshot with the next tick'''
+        self.acked.pop(connection_object, None)
+        if not self.LOCKSTEP:
+            self.send_to_all_clients(Message.type_comp_update)
 
     def callback_disconnect_client(self, connection_object):
         """gets called if a client disconnects"""
+        self.defer(self.drop_client, connection_object)
+        return super(MastermindServerTCP, self).callback_disconnect_client(connection_object)
+
+    def drop_client(self, connection_object):
+        """remove a disconnected client from the game"""
         disconnected_client = self.known_clients.index(connection_object)
         srvlog.info("Client disconnected, sending to other clients %s" % disconnected_client)
 
         # kill the player of the disconnected client on all other clients
         self.send_to_all_clients(Message.type_client_dc, {'client_id': disconnected_client})
+        if self.headless:
+            self.main.level.remove_player(disconnected_client)
         self.known_clients.pop(disconnected_client)
-        super(MastermindServerTCP, self).callback_disconnect_client(connection_object)
-        return self.send_to_all_clients(Message.type_comp_update)
-
-    def send_key(self, key, player_id):
-        """puts a passed key inside a json object and sends it to all clients"""
+        self.acked.pop(connection_object, None)
+        self.views.pop(connection_object, None)
+        with self.outbox_condition:
+            self.outboxes.pop(connection_object, None)
+        '''the player ids behind the disconnected one move up'''
+        self.inputs.clear()
+        if self.LOCKSTEP:
+            self.start_lockstep(self.main.level.path)
+        else:
+            self.send_to_all_clients(Message.type_comp_update)
+
+    def send_key(self, key, player_id, seq=0):
+        """sends a pressed key of a player to all clients"""
         srvlog.info("Sending key {} to Client with id {}".format(str(key), str(player_id)))
-        self.send_to_all_clients(Message.type_key_update, {'key': str(key), 'player_id': str(player_id)})
+        self.send_to_all_clients(Message.type_key_update, {'key': str(key), 'player_id': int(player_id), 'seq': seq})
 
     def send_bot_movement(self, action, bot_id):
-        """puts a passed key inside a json object and sends it to all clients"""
+        """sends the action of a bot to all clients"""
         srvlog.info("Sending key {} to Client with id {}".format(str(action), str(bot_id)))
-        self.send_to_all_clients(Message.type_bot_update, {'key': str(action), 'bot_id': str(bot_id)})
+        if self.headless:
+            '''there's no own client that moves the bots, this is called by the bots in the main thread'''
+            Controller.bot_action(action, bot_id)
+        self.send_to_all_clients(Message.type_bot_update, {'key': str(action), 'bot_id': int(bot_id)})
+
+    def defer(self, task, *args):
+        """handle a client event right away or queue it on a headless server
+
+        the events arrive in the connection threads, a headless server only touches
+        its level in update() which is called by the main loop of its match
+        """
+        if self.headless:
+            self.main_tasks.append((task, args))
+        else:
+            task(*args)
+
+    def set_player_info(self, data):
+        """take over the blocks a client removed, the player itself is simulated from the inputs of the client"""
+        if data['block_info']:
+            WorldObject.remove_blocks_by_ids(data['block_info'])
 
     def notify_level_changed(self, level):
         """notify all clients when level sprites changed"""
-        self.send_to_all_clients_except_self(Message.type_level_changed, {Message.field_level_name: level})
+        '''snapshots of the old level are no baseline for the new one'''
+        self.snapshots.clear()
+        self.acked.clear()
+        self.views.clear()
+        if not self.LOCKSTEP:
+            '''the clients of a lockstep game reach the next level in the same step by themselves'''
+            self.send_to_all_clients_except_self(Message.type_level_changed, {Message.field_level_name: level})
+
+    def start_lockstep(self, level):
+        """let all clients load the level and start it over in the same step with the same random seed
+
+        the start is sent by update() in the main loop, the server loads the level itself before
+        """
+        self.main_tasks.append((self.send_lockstep_start, (level,)))
+
+    def send_lockstep_start(self, level):
+        """load the level and send the start with the world hash every client has to start from
+
+        the steps are counted on, the keys the clients sent for the steps before the new start get ignored
+        """
+        self.lockstep_start = self.lockstep_tick + GameClock.INPUT_DELAY
+        '''there are no keys for the first steps, the clients press them INPUT_DELAY steps later'''
+        self.lockstep_tick = self.lockstep_start + GameClock.INPUT_DELAY
+        self.lockstep_inputs.clear()
+        self.lockstep_hashes.clear()
+        srvlog.info("starting lockstep game at step %s" % self.lockstep_start)
+        seed, players = random.getrandbits(32), len(self.known_clients)
+        world_hash = self.main.network_connector.load_lockstep_level(level, players, seed, self.lockstep_start)
+        self.send_to_all_clients(Message.type_lockstep_start, {'tick': self.lockstep_start, 'level': level,
+                                                               'seed': seed, 'players': players,
+                                                               'hash': world_hash})
+
+    def collect_lockstep_input(self, player_id, data):
+        """keep the keys and the world hash of a client, the keys of a step get sent once all clients sent theirs"""
+        tick = data['tick']
+        if tick <= self.lockstep_start:
+            '''sent before the game started over'''
+            return
+        self.lockstep_inputs.setdefault(tick, {})[player_id] = data['keys']
+        self.lockstep_hashes.setdefault(tick - GameClock.INPUT_DELAY, {})[player_id] = data['hash']
+        self.check_lockstep_hashes(tick - GameClock.INPUT_DELAY)
+
+        while len(self.lockstep_inputs.get(self.lockstep_tick + 1, ())) >= len(self.known_clients):
+            self.lockstep_tick += 1
+            keys = self.lockstep_inputs.pop(self.lockstep_tick)
+            inputs = [(key, player) for player in sorted(keys) for key in keys[player]]
+            self.send_to_all_clients(Message.type_lockstep_tick, {'tick': self.lockstep_tick, 'inputs': inputs})
+
+    def check_lockstep_hashes(self, tick):
+        """compare the worlds of all clients after a step, they start over if one of them differs"""
+        hashes = self.lockstep_hashes.get(tick, {})
+        if len(hashes) < len(self.known_clients):
+            return
+        del self.lockstep_hashes[tick]
+        if len(set(hashes.values())) > 1:
+            self.desyncs += 1
+            srvlog.warning("the clients desynced in step %s: %s" % (tick, hashes))
+            self.send_to_all_clients(Message.type_lockstep_desync, tick)
+            self.start_lockstep(self.main.level.path)
 
     def send_to_all_clients(self, message, data=None):
         """send message to all clients"""
-        json_data = json.dumps({'type': message, 'data': data})
+        encoded = self.codec.encode(message, data)
         for client in self.known_clients:
-            self.callback_client_send(client, json_data)
+            self.queue_message(client, message, encoded)
 
     def send_to_all_clients_except_self(self, message, data=None):
         """send information to all clients except yourself"""
-        json_data = json.dumps({'type': message, 'data': data})
+        encoded = self.codec.encode(message, data)
         for index, client in enumerate(self.known_clients):
             if index != self.own_client:
-                self.callback_client_send(client, json_data)
+                self.queue_message(client, message, encoded)
+
+    def queue_message(self, client, message, encoded):
+        """queue an encoded message for the writer thread, nothing waits for a slow client"""
+        with self.outbox_condition:
+            outbox = self.outboxes.get(client)
+            if not outbox:
+                outbox = self.outboxes[client] = Outbox(self.OUTBOX_LIMIT, self.OUTBOX_POLICY)
+            if not outbox.put(message, encoded):
+                srvlog.info("Client %s can't keep up, disconnecting it" % str(client.address))
+                del self.outboxes[client]
+                client.terminate()
+                return
+            self.outbox_condition.notify()
+
+    def write_messages(self):
+        """writer thread, sends the queued messages of all clients
+
+        one thread is enough because no transport waits in a send: tcp buffers what the socket doesn't take
+        and the udp socket is non blocking, a datagram that doesn't fit is lost like on the network
+        """
+        while self.connected:
+            with self.outbox_condition:
+                while self.connected and not any(outbox.messages for outbox in self.outboxes.values()):
+                    self.outbox_condition.wait()
+                batches = [(client, list(outbox.messages)) for client, outbox in self.outboxes.items()
+                           if outbox.messages]
+                for outbox in self.outboxes.values():
+                    outbox.messages.clear()
+
+            for client, messages in batches:
+                for message, encoded in messages:
+                    if self.send_encoded(client, message, encoded) is False:
+                        break
 
     def kill(self):
         """kill this server thread"""
+        with self.outbox_condition:
+            self.connected = False
+            self.outbox_condition.notify()
         try:
             self.accepting_disallow()
         except AttributeError:
@@ -168,6 +396,7 @@ class Server(threading.Thread, MastermindServerTCP):
             self.connect(self.ip, self.port)
             self.accepting_allow()
             self.connected = True
+            self.writer.start()
         except (OSError, MastermindErrorSocket):
             srvlog.info(str(OSError))
             srvlog.info(str(MastermindErrorSocket))
@@ -182,7 +411,12 @@ class Server(threading.Thread, MastermindServerTCP):
 
     def update(self):
         """update all clients"""
-        pass
+        while self.main_tasks:
+            task, args = self.main_tasks.popleft()
+            task(*args)
+        self.tick += 1
+        if not self.LOCKSTEP:
+            self.send_snapshots()
         # if len(self.known_clients) > 1:
         #     if (datetime.now() - self.sync_time).seconds >= self.sync_interval:
         #         '''sync all players every x seconds'''
@@ -195,12 +429,79 @@ class Server(threading.Thread, MastermindServerTCP):
         #         self.send_to_all_clients(Message.type_comp_update)
         #         self.sync_time = datetime.now()
 
-    def send_bot_pos_and_data(self, bot):
-        """send updated bot movements to all clients"""
-        player_info = self.main.level.get_normalized_pos_and_data(bot, True)
-        srvlog.debug("sending bot data: ", player_info)
-        data = {'player_info':player_info, 'block_info':[]}
-        self.send_to_all_clients_except_self(Message.type_comp_update_set, data)
+    def get_snapshot(self):
+        """the current state of all players, bots, removed blocks and collected gold"""
+        level = self.main.level
+        snapshot = Snapshot(self.tick)
+        for player in level.players:
+            snapshot.add_actor(level.get_normalized_pos_and_data(player, False))
+        for bot in level.bots:
+            snapshot.add_actor(level.get_normalized_pos_and_data(bot, True))
+        for tile_id, removed in WorldObject.get_removed_block_ids():
+            snapshot.blocks[tuple(tile_id)] = removed
+        snapshot.gold.update(tuple(tile_id) for tile_id in self.sprites_removed)
+        snapshot.inputs.update(self.inputs)
+        return snapshot
+
+    def send_snapshots(self):
+        """send every client the changes since the last snapshot it acknowledged"""
+        clients = [(index, client) for index, client in enumerate(self.known_clients) if index != self.own_client]
+        if not clients:
+            return
+
+        snapshot = self.get_snapshot()
+        self.snapshots[snapshot.tick] = snapshot
+        while len(self.snapshots) > self.SNAPSHOT_HISTORY:
+            del self.snapshots[next(iter(self.snapshots))]
+
+        '''clients that got the whole snapshots and have the same baseline get the same packet'''
+        packets = {}
+        for player_id, client in clients:
+            views = self.views.setdefault(client, {})
+            view = self.relevant_view(snapshot, player_id, views)
+            if not view:
+                continue
+            views[view.tick] = view
+            while len(views) > self.SNAPSHOT_HISTORY:
+                del views[next(iter(views))]
+
+            base = views.get(self.acked.get(client), Snapshot())
+            shared = view is snapshot and base is self.snapshots.get(base.tick)
+            if shared and base.tick in packets:
+                packet = packets[base.tick]
+            else:
+                delta = view.delta(base)
+                packet = None if Snapshot.is_empty(delta) else self.codec.encode(Message.type_snapshot, delta)
+                if shared:
+                    packets[base.tick] = packet
+            if packet:
+                self.queue_message(client, Message.type_snapshot, packet)
+
+    def relevant_view(self, snapshot, player_id, views):
+        """the snapshot as one client gets it, far actors keep their last sent record between FAR_INTERVAL ticks
+
+        Returns: the snapshot itself if nothing got held back and None if the client gets no snapshot this tick
+        """
+        record = snapshot.actors.get((False, player_id))
+        if not record or not record[1] or record[3][3]:
+            '''a spectator sees everything, just less often'''
+            return snapshot if not snapshot.tick % self.SPECTATOR_INTERVAL else None
+        if not snapshot.tick % self.FAR_INTERVAL or not views:
+            return snapshot
+
+        x, y, diff = record[1]
+        last = views[next(reversed(views))]
+        actors = {}
+        for key, actor in snapshot.actors.items():
+            if actor[1] and key in last.actors:
+                actor_x, actor_y, actor_diff = actor[1]
+                if abs(actor_x / (32 + actor_diff) - x / (32 + diff)) > self.RELEVANT_DISTANCE or \
+                        abs(actor_y / (32 + actor_diff) - y / (32 + diff)) > self.RELEVANT_DISTANCE:
+                    actor = last.actors[key]
+            actors[key] = actor
+        if actors == snapshot.actors:
+            return snapshot
+        return Snapshot(snapshot.tick, actors, snapshot.blocks, snapshot.gold, snapshot.inputs)
 
     def get_collected_data(self):
         """gather collected data"""
@@ -219,3 +520,24 @@ class Server(threading.Thread, MastermindServerTCP):
         self._level = level
         for client_id in range(len(self.known_clients)):
             self.main.level.add_player(client_id)
+
+
+class UdpServer(MastermindServerReliableUDP, Server):
+    """
+        network server that talks to its clients over udp
+
+        positions and snapshots are sent unreliable, a lost one is replaced by the next one instead of holding
+        back everything behind it, the events in Message.RELIABLE are resent until the client acknowledges them
+    """
+
+    def __init__(self, ip, port, main, local_only=False, headless=False, codec=None):
+        '''the mastermind udp classes come first so their sockets are used, the game server stays the same'''
+        Server.__init__(self, ip, port, main, local_only, headless, codec)
+
+    def init_transport(self):
+        """set up the mastermind udp server, keep alives can get lost so the clients get more time"""
+        MastermindServerReliableUDP.__init__(self, 1, 1, 10.0)
+
+    def send_encoded(self, client, message, encoded):
+        """send an encoded message of the given type to one client"""
+        return self.callback_client_send(client, encoded, reliable=message in Message.RELIABLE)
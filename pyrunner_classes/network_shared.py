@@ -2,6 +2,11 @@
 # -*- coding: utf-8 -*-
 """Shared Network Objects/Constants"""
 
+import json
+import struct
+import dateutil.parser
+from datetime import datetime
+
 from libs.Mastermind import *
 
 COMPRESSION = None
@@ -17,6 +22,9 @@ class Action(object):
     DIG_LEFT = "dig_left"
     DIG_RIGHT = "dig_right"
 
+    '''wire ids of the actions, only append new ones'''
+    ALL = (LEFT, RIGHT, UP, DOWN, STOP, DIG_LEFT, DIG_RIGHT)
+
 
 class Message(object):
     """just a wrapper object to store messages in one place"""
@@ -26,6 +34,7 @@ class Message(object):
     type_key_update = "key_update"
     type_bot_update = "bot_update"
     type_init = 'init_succ'
+    type_init_data = 'init'
     type_comp_update = 'update_all'
     type_comp_update_states = 'update_states'
     type_comp_update_set = 'update_all_set'
@@ -33,8 +42,372 @@ class Message(object):
     type_level_changed = 'level_changed'
     type_gold_removed = 'gold_removed'
     type_player_killed = 'player_killed'
+    type_snapshot = 'snapshot'
+    type_snapshot_ack = 'snapshot_ack'
+    type_lockstep_start = 'lockstep_start'
+    type_lockstep_input = 'lockstep_input'
+    type_lockstep_tick = 'lockstep_tick'
+    type_lockstep_desync = 'lockstep_desync'
+
+    '''wire ids of the types, only append new ones'''
+    ALL = (type_client_dc, type_key_update, type_bot_update, type_init, type_init_data, type_comp_update,
+           type_comp_update_states, type_comp_update_set, type_keep_alive, type_level_changed, type_gold_removed,
+           type_player_killed, type_snapshot, type_snapshot_ack, type_lockstep_start, type_lockstep_input,
+           type_lockstep_tick, type_lockstep_desync)
+
+    '''events that have to arrive, the udp transport resends them, positions and states are replaced by newer ones'''
+    RELIABLE = (type_client_dc, type_key_update, type_bot_update, type_init, type_init_data, type_level_changed,
+                type_gold_removed, type_player_killed, type_lockstep_start, type_lockstep_input, type_lockstep_tick,
+                type_lockstep_desync)
+
+    '''messages a newer one of the same type replaces, only the newest of them that waited for the client counts'''
+    SUPERSEDED = (type_snapshot, type_comp_update, type_comp_update_states)
 
     '''data fields'''
     field_player_locations = "player_locations"
     field_level_name = "level_name"
     field_removed_sprites = "removed_sprites"
+
+
+class Snapshot(object):
+    """
+        the world state of one server tick: players, bots, removed blocks and collected gold
+
+        the server sends each client only the difference to the last snapshot the client acknowledged,
+        the client adds that difference to its copy of the acknowledged snapshot. actors that left the game
+        and blocks that got restored are listed by their keys and removed from the copy
+    """
+
+    def __init__(self, tick=0, actors=None, blocks=None, gold=None, inputs=None):
+        self.tick = tick
+        '''(is_bot, pid) -> tuple of Level.get_normalized_pos_and_data'''
+        self.actors = actors if actors else {}
+        '''tile id -> time of the removal'''
+        self.blocks = blocks if blocks else {}
+        '''tile ids of the collected gold'''
+        self.gold = gold if gold else set()
+        '''player id -> (sequence number of the last input the server applied, tick of the first snapshot with it)'''
+        self.inputs = inputs if inputs else {}
+
+    @staticmethod
+    def actor_key(record):
+        """players and bots have their own ids"""
+        return bool(record[2]), int(record[0])
+
+    def add_actor(self, record):
+        """add a player or bot"""
+        self.actors[self.actor_key(record)] = tuple(record)
+
+    def delta(self, base):
+        """message data with everything that changed since the base snapshot"""
+        return {'tick': self.tick, 'base': base.tick,
+                'actors': [record for key, record in self.actors.items() if base.actors.get(key) != record],
+                'blocks': [(tile_id, removed) for tile_id, removed in self.blocks.items()
+                           if base.blocks.get(tile_id) != removed],
+                'gold': [tile_id for tile_id in self.gold if tile_id not in base.gold],
+                'inputs': [(player_id, seq, tick) for player_id, (seq, tick) in self.inputs.items()
+                           if base.inputs.get(player_id) != (seq, tick)],
+                'removed_actors': [key for key in base.actors if key not in self.actors],
+                'restored_blocks': [tile_id for tile_id in base.blocks if tile_id not in self.blocks]}
+
+    @staticmethod
+    def is_empty(delta):
+        """True if a delta contains no changes"""
+        return not (delta['actors'] or delta['blocks'] or delta['gold'] or delta['inputs'] or
+                    delta['removed_actors'] or delta['restored_blocks'])
+
+    def apply(self, delta):
+        """returns the snapshot a delta against this one describes"""
+        snapshot = Snapshot(delta['tick'], dict(self.actors), dict(self.blocks), set(self.gold), dict(self.inputs))
+        for record in delta['actors']:
+            snapshot.add_actor(record)
+        for tile_id, removed in delta['blocks']:
+            snapshot.blocks[tuple(tile_id)] = removed
+        snapshot.gold.update(tuple(tile_id) for tile_id in delta['gold'])
+        for player_id, seq, tick in delta['inputs']:
+            snapshot.inputs[int(player_id)] = (seq, tick)
+        for is_bot, pid in delta['removed_actors']:
+            snapshot.actors.pop((bool(is_bot), int(pid)), None)
+        for tile_id in delta['restored_blocks']:
+            snapshot.blocks.pop(tuple(tile_id), None)
+        return snapshot
+
+
+class ProtocolError(ValueError):
+    """a message that could not be encoded or decoded"""
+    pass
+
+
+class JsonCodec(object):
+    """the readable text protocol, every message is a json object with its type and data"""
+
+    name = "json"
+
+    @staticmethod
+    def encode(message_type, data=None):
+        """turn a message into the bytes that get sent"""
+        try:
+            return json.dumps({'type': message_type, 'data': data}).encode("utf-8")
+        except (TypeError, ValueError) as error:
+            raise ProtocolError("can't encode %s: %s" % (message_type, error))
+
+    @staticmethod
+    def decode(payload):
+        """returns the type and the data of a received message"""
+        try:
+            message = json.loads(payload if isinstance(payload, str) else bytes(payload).decode("utf-8"))
+            return message['type'], message.get('data')
+        except (TypeError, ValueError, KeyError, AttributeError) as error:
+            raise ProtocolError("can't decode message: %s" % error)
+
+
+class BinaryCodec(object):
+    """
+        compact protocol with a struct header and fixed records for the frequent messages
+
+        a message is the protocol version and the type id followed by the data of its type, messages without
+        data have an empty body. the rare init message with its free form level info stays json inside
+    """
+
+    name = "binary"
+    VERSION = 2
+
+    HEADER = struct.Struct("!BB")
+    '''pid, flags, x, y, pixel diff, change x, change y, direction'''
+    PLAYER = struct.Struct("!HBhhhffB")
+    '''tile x, tile y, timestamp of the removal'''
+    BLOCK = struct.Struct("!hhd")
+    '''tick, base tick, number of actors, blocks, gold, inputs, removed actors and restored blocks'''
+    SNAPSHOT = struct.Struct("!IIHHHHHH")
+    '''is bot, player or bot id'''
+    ACTOR_KEY = struct.Struct("!?H")
+    '''player id, sequence number of the last applied input, tick of the first snapshot with it'''
+    INPUT = struct.Struct("!HII")
+    TICK = struct.Struct("!I")
+    '''action, player or bot id'''
+    ACTION = struct.Struct("!BH")
+    '''action, player id, input sequence number'''
+    KEY = struct.Struct("!BHI")
+    '''first step, random seed, number of players and world hash of a lockstep game followed by the level path'''
+    LOCKSTEP_START = struct.Struct("!IIHI")
+    '''step, player id, world hash after the step INPUT_DELAY steps before and the number of actions that follow'''
+    LOCKSTEP_INPUT = struct.Struct("!IHIB")
+    '''step and the number of ACTION records that follow'''
+    LOCKSTEP_TICK = struct.Struct("!IH")
+    ID = struct.Struct("!H")
+    TILE = struct.Struct("!hh")
+    COUNT = struct.Struct("!H")
+
+    NO_ID = 0xFFFF
+    '''player flags'''
+    IS_BOT, HAS_POS, ON_GROUND, ON_LADDER, ON_ROPE, KILLED = 1, 2, 4, 8, 16, 32
+    '''wire ids of the player directions, only append new ones'''
+    DIRECTIONS = ("Stop", "L", "R", "RL", "RR", "UD", "SL", "SR", "DL", "DR", "Falling", "Trapped")
+
+    def __init__(self):
+        self.type_ids = dict((message_type, type_id) for type_id, message_type in enumerate(Message.ALL))
+        self.action_ids = dict((action, action_id) for action_id, action in enumerate(Action.ALL))
+        self.direction_ids = dict((direction, direction_id) for direction_id, direction in enumerate(self.DIRECTIONS))
+
+        self.encoders = {
+            Message.type_client_dc: lambda data: self.ID.pack(int(data['client_id'])),
+            Message.type_key_update: self.encode_key,
+            Message.type_bot_update: lambda data: self.encode_action(data['key'], data['bot_id']),
+            Message.type_init: lambda data: self.ID.pack(int(data['player_id'])),
+            Message.type_init_data: lambda data: json.dumps(data).encode("utf-8"),
+            Message.type_comp_update: self.encode_update,
+            Message.type_comp_update_set: self.encode_update,
+            Message.type_level_changed: lambda data: data[Message.field_level_name].encode("utf-8"),
+            Message.type_gold_removed: lambda data: self.TILE.pack(*data),
+            Message.type_player_killed: lambda data: self.ID.pack(int(data)),
+            Message.type_snapshot: self.encode_snapshot,
+            Message.type_snapshot_ack: lambda data: self.TICK.pack(data),
+            Message.type_lockstep_start: self.encode_lockstep_start,
+            Message.type_lockstep_input: self.encode_lockstep_input,
+            Message.type_lockstep_tick: self.encode_lockstep_tick,
+            Message.type_lockstep_desync: lambda data: self.TICK.pack(data),
+        }
+        self.decoders = {
+            Message.type_client_dc: lambda body: {'client_id': self.ID.unpack(body)[0]},
+            Message.type_key_update: self.decode_key,
+            Message.type_bot_update: lambda body: self.decode_action(body, 'bot_id'),
+            Message.type_init: lambda body: {'player_id': self.ID.unpack(body)[0]},
+            Message.type_init_data: lambda body: json.loads(bytes(body).decode("utf-8")),
+            Message.type_comp_update: self.decode_update,
+            Message.type_comp_update_set: self.decode_update,
+            Message.type_level_changed: lambda body: {Message.field_level_name: bytes(body).decode("utf-8")},
+            Message.type_gold_removed: lambda body: self.TILE.unpack(body),
+            Message.type_player_killed: lambda body: self.ID.unpack(body)[0],
+            Message.type_snapshot: self.decode_snapshot,
+            Message.type_snapshot_ack: lambda body: self.TICK.unpack(body)[0],
+            Message.type_lockstep_start: self.decode_lockstep_start,
+            Message.type_lockstep_input: self.decode_lockstep_input,
+            Message.type_lockstep_tick: self.decode_lockstep_tick,
+            Message.type_lockstep_desync: lambda body: self.TICK.unpack(body)[0],
+        }
+
+    def encode(self, message_type, data=None):
+        """turn a message into the bytes that get sent"""
+        try:
+            header = self.HEADER.pack(self.VERSION, self.type_ids[message_type])
+            if data is None:
+                return header
+            return header + self.encoders[message_type](data)
+        except (struct.error, TypeError, ValueError, KeyError, IndexError) as error:
+            raise ProtocolError("can't encode %s: %s" % (message_type, error))
+
+    def decode(self, payload):
+        """returns the type and the data of a received message"""
+        try:
+            version, type_id = self.HEADER.unpack_from(payload)
+            if version != self.VERSION:
+                raise ProtocolError("protocol version %s is not supported" % version)
+            message_type = Message.ALL[type_id]
+            body = memoryview(payload)[self.HEADER.size:]
+            if not len(body):
+                return message_type, None
+            return message_type, self.decoders[message_type](body)
+        except (struct.error, TypeError, ValueError, KeyError, IndexError) as error:
+            raise ProtocolError("can't decode message: %s" % error)
+
+    def encode_action(self, action, actor_id):
+        """an action of a player or bot"""
+        return self.ACTION.pack(self.action_ids[action], self.NO_ID if actor_id is None else int(actor_id))
+
+    def decode_action(self, body, id_field):
+        """the action and the id of the actor in the field the message type uses"""
+        action_id, actor_id = self.ACTION.unpack(body)
+        return {'key': Action.ALL[action_id], id_field: None if actor_id == self.NO_ID else actor_id}
+
+    def encode_key(self, data):
+        """a key of a player with the sequence number its client gave it"""
+        player_id = data['player_id']
+        return self.KEY.pack(self.action_ids[data['key']], self.NO_ID if player_id is None else int(player_id),
+                             int(data.get('seq', 0)))
+
+    def decode_key(self, body):
+        """the key, the player id and the input sequence number"""
+        action_id, player_id, seq = self.KEY.unpack(body)
+        return {'key': Action.ALL[action_id], 'player_id': None if player_id == self.NO_ID else player_id, 'seq': seq}
+
+    def encode_player(self, player_info):
+        """the tuple of Level.get_normalized_pos_and_data as fixed record"""
+        pid, pos, is_bot, states = player_info
+        on_ground, on_ladder, on_rope, killed, change_x, change_y, direction = states
+        flags = (self.IS_BOT if is_bot else 0) | (self.HAS_POS if pos else 0) | \
+                (self.ON_GROUND if on_ground else 0) | (self.ON_LADDER if on_ladder else 0) | \
+                (self.ON_ROPE if on_rope else 0) | (self.KILLED if killed else 0)
+        x, y, diff = pos if pos else (0, 0, 0)
+        return self.PLAYER.pack(int(pid), flags, int(x), int(y), int(diff), change_x, change_y,
+                                self.direction_ids[direction])
+
+    def decode_player(self, body, offset=0):
+        """the fixed record back in the form Level.set_player_data takes"""
+        pid, flags, x, y, diff, change_x, change_y, direction_id = self.PLAYER.unpack_from(body, offset)
+        pos = (x, y, diff) if flags & self.HAS_POS else False
+        states = (bool(flags & self.ON_GROUND), bool(flags & self.ON_LADDER), bool(flags & self.ON_ROPE),
+                  bool(flags & self.KILLED), change_x, change_y, self.DIRECTIONS[direction_id])
+        return pid, pos, bool(flags & self.IS_BOT), states
+
+    def encode_block(self, tile_id, removed):
+        """a removed block with the time of its removal"""
+        return self.BLOCK.pack(tile_id[0], tile_id[1], dateutil.parser.parse(removed).timestamp())
+
+    def decode_blocks(self, body, offset, count):
+        """count removed blocks starting at offset"""
+        blocks = []
+        for _ in range(count):
+            x, y, timestamp = self.BLOCK.unpack_from(body, offset)
+            offset += self.BLOCK.size
+            blocks.append(((x, y), datetime.fromtimestamp(timestamp).isoformat()))
+        return blocks
+
+    def encode_update(self, data):
+        """a player record followed by the blocks its client removed"""
+        blocks = data['block_info']
+        body = [self.encode_player(data['player_info']), self.COUNT.pack(len(blocks))]
+        body.extend(self.encode_block(tile_id, removed) for tile_id, removed in blocks)
+        return b"".join(body)
+
+    def decode_update(self, body):
+        """player and block info of a position update"""
+        player_info = self.decode_player(body)
+        count, = self.COUNT.unpack_from(body, self.PLAYER.size)
+        return {'player_info': player_info,
+                'block_info': self.decode_blocks(body, self.PLAYER.size + self.COUNT.size, count)}
+
+    def encode_snapshot(self, data):
+        """the counts followed by the actor records, the removed blocks, the collected gold and the removals"""
+        body = [self.SNAPSHOT.pack(data['tick'], data['base'], len(data['actors']), len(data['blocks']),
+                                   len(data['gold']), len(data['inputs']), len(data['removed_actors']),
+                                   len(data['restored_blocks']))]
+        body.extend(self.encode_player(record) for record in data['actors'])
+        body.extend(self.encode_block(tile_id, removed) for tile_id, removed in data['blocks'])
+        body.extend(self.TILE.pack(*tile_id) for tile_id in data['gold'])
+        body.extend(self.INPUT.pack(*player_input) for player_input in data['inputs'])
+        body.extend(self.ACTOR_KEY.pack(is_bot, pid) for is_bot, pid in data['removed_actors'])
+        body.extend(self.TILE.pack(*tile_id) for tile_id in data['restored_blocks'])
+        return b"".join(body)
+
+    def decode_snapshot(self, body):
+        """the delta of a snapshot"""
+        tick, base, actor_count, block_count, gold_count, input_count, removed_count, restored_count = \
+            self.SNAPSHOT.unpack_from(body)
+        offset = self.SNAPSHOT.size
+        actors = [self.decode_player(body, offset + self.PLAYER.size * number) for number in range(actor_count)]
+        offset += self.PLAYER.size * actor_count
+        blocks = self.decode_blocks(body, offset, block_count)
+        offset += self.BLOCK.size * block_count
+        gold = [self.TILE.unpack_from(body, offset + self.TILE.size * number) for number in range(gold_count)]
+        offset += self.TILE.size * gold_count
+        inputs = [self.INPUT.unpack_from(body, offset + self.INPUT.size * number) for number in range(input_count)]
+        offset += self.INPUT.size * input_count
+        removed_actors = [self.ACTOR_KEY.unpack_from(body, offset + self.ACTOR_KEY.size * number)
+                          for number in range(removed_count)]
+        offset += self.ACTOR_KEY.size * removed_count
+        restored_blocks = [self.TILE.unpack_from(body, offset + self.TILE.size * number)
+                           for number in range(restored_count)]
+        return {'tick': tick, 'base': base, 'actors': actors, 'blocks': blocks, 'gold': gold, 'inputs': inputs,
+                'removed_actors': removed_actors, 'restored_blocks': restored_blocks}
+
+    def encode_lockstep_start(self, data):
+        """the start of a lockstep game"""
+        return self.LOCKSTEP_START.pack(data['tick'], data['seed'], data['players'], data['hash']) + \
+            data['level'].encode("utf-8")
+
+    def decode_lockstep_start(self, body):
+        """the first step, the seed, the number of players, the world hash and the level of a lockstep game"""
+        tick, seed, players, world_hash = self.LOCKSTEP_START.unpack_from(body)
+        return {'tick': tick, 'seed': seed, 'players': players, 'hash': world_hash,
+                'level': bytes(body[self.LOCKSTEP_START.size:]).decode("utf-8")}
+
+    def encode_lockstep_input(self, data):
+        """the keys of a player for one step with one byte per key"""
+        player_id, keys = data['player_id'], data['keys']
+        return self.LOCKSTEP_INPUT.pack(data['tick'], self.NO_ID if player_id is None else int(player_id),
+                                        data['hash'], len(keys)) + bytes(self.action_ids[key] for key in keys)
+
+    def decode_lockstep_input(self, body):
+        """the step, the player, the world hash and the keys"""
+        tick, player_id, world_hash, count = self.LOCKSTEP_INPUT.unpack_from(body)
+        offset = self.LOCKSTEP_INPUT.size
+        return {'tick': tick, 'player_id': None if player_id == self.NO_ID else player_id, 'hash': world_hash,
+                'keys': [Action.ALL[action_id] for action_id in body[offset:offset + count]]}
+
+    def encode_lockstep_tick(self, data):
+        """the keys of all players for one step"""
+        body = [self.LOCKSTEP_TICK.pack(data['tick'], len(data['inputs']))]
+        body.extend(self.encode_action(key, player_id) for key, player_id in data['inputs'])
+        return b"".join(body)
+
+    def decode_lockstep_tick(self, body):
+        """the step and the (key, player id) pairs in the order they get applied"""
+        tick, count = self.LOCKSTEP_TICK.unpack_from(body)
+        offset = self.LOCKSTEP_TICK.size
+        inputs = [self.ACTION.unpack_from(body, offset + self.ACTION.size * number) for number in range(count)]
+        return {'tick': tick, 'inputs': [(Action.ALL[action_id], None if player_id == self.NO_ID else player_id)
+                                         for action_id, player_id in inputs]}
+
+
+'''the codecs by the name the --protocol option takes'''
+CODECS = {JsonCodec.name: JsonCodec, BinaryCodec.name: BinaryCodec}
@@ -5,6 +5,8 @@
 from pyrunner_classes.npc_state_machine import StateMachine
 from pyrunner_classes.npc_states import *
 from pyrunner_classes.network_shared import *
+from pyrunner_classes.level_objecs import WorldObject
+from pyrunner_classes.game_clock import GameClock
 
 SPRITE_SHEET_PATH = "./resources/sprites/"
 log = logging.getLogger("Bots")
@@ -13,6 +15,8 @@ log = logging.getLogger("Bots")
 class Bots(Player):
     """the next generation AI"""
 
+    sfx_bot_kill = None
+
     def __init__(self, bid, pos, sheet, level):
         Player.__init__(self, pos, sheet, bid, 32, level, 25, True)
         # POSITIONAL RELATED
@@ -32,11 +36,12 @@ class Bots(Player):
         self.update_counter = 0
         self.update_refresh = 5 + self.brain_refresh * (self.pid + 1)
         # give humans a chance
-        self.speed -= self.size / 30
+        self.speed -= self.size // 30 if GameClock.deterministic else self.size / 30
         self.spawning = True
         self.spawn_frame = 0
-        # Sound
-        self.sfx_bot_kill = pygame.mixer.Sound(self.level.sound_thread.get_full_path_sfx('bot_kill.wav'))
+        # Sound, loaded once and shared by all bots
+        if not Bots.sfx_bot_kill:
+            Bots.sfx_bot_kill = self.level.sound_thread.load_sound('bot_kill.wav')
 
         Player.bots.add(self)
 
@@ -57,7 +62,7 @@ class Bots(Player):
         # Load all the left facing images into a list (x, y, height, width)
         self.walking_frames_l = self.sprite_sheet.add_animation(0, 3, 4)
         # Load all the left facing images into a list and flip them to make them face right
-        self.walking_frames_r = self.sprite_sheet.flip_frames(self.walking_frames_l)
+        self.walking_frames_r = self.sprite_sheet.add_animation(0, 3, 4, flipped=True)
         # Load all the up / down facing images into a list
         self.walking_frames_ud = self.sprite_sheet.add_animation(0, 4, 4)
         # Load all falling down frames
@@ -65,14 +70,14 @@ class Bots(Player):
         # Load the left hanging images into a list
         self.hanging_frames_l = self.sprite_sheet.add_animation(4, 4, 4)
         # Load the left hanging images into a list and flip them to face right
-        self.hanging_frames_r = self.sprite_sheet.flip_frames(self.hanging_frames_l)
+        self.hanging_frames_r = self.sprite_sheet.add_animation(4, 4, 4, flipped=True)
         # death animation
         self.death_frames = self.sprite_sheet.reverse_frame_list(self.spawn_frames)
 
         # Stop Frame: Sprite when player is not moving on ground
         self.stop_frame = self.sprite_sheet.add_animation(5, 3)
         self.stand_left = self.sprite_sheet.add_animation(3, 3)
-        self.stand_right = self.sprite_sheet.flip_frames(self.stand_left)
+        self.stand_right = self.sprite_sheet.add_animation(3, 3, flipped=True)
         self.trapped = self.sprite_sheet.add_animation(4, 3)
 
         self.direction = "Stop"  # direction the player is facing at the beginning of the game
@@ -87,17 +92,34 @@ class Bots(Player):
     def network_movements(self, action):
         """handle all the bot movements"""
         try:
-            if self.level.network_connector.master:
+            if GameClock.deterministic or self.level.network_connector.master:
                 if self.update_counter >= self.update_refresh or (self.previous_action != action and
                                                                   self.update_counter > self.update_refresh // 2):
                     self.update_counter = 0
                     self.previous_action = action
-                    self.level.network_connector.server.send_bot_movement(action, self.pid)
+                    if GameClock.deterministic:
+                        '''every client of a lockstep game moves its bots itself'''
+                        self.do_action(action)
+                    else:
+                        self.level.network_connector.server.send_bot_movement(action, self.pid)
                 else:
                     self.update_counter += 1
         except (MastermindErrorServer, AttributeError):
             pass
 
+    def do_action(self, action):
+        """move right away instead of waiting for the server"""
+        if action == Action.LEFT:
+            self.move_left()
+        elif action == Action.RIGHT:
+            self.move_right()
+        elif action == Action.UP:
+            self.move_up()
+        elif action == Action.DOWN:
+            self.move_down()
+        elif action == Action.STOP:
+            self.stop_on_ground = True
+
     def go_left(self):
         """add network connector to movement"""
         if self.change_x >= 0:
@@ -148,6 +170,8 @@ class Bots(Player):
         self.robbed_gold = sprite
         '''hide the sprite from the screen'''
         self.robbed_gold.rect.topleft = (-1000, -1000)
+        WorldObject.grid.move(self.robbed_gold)
+        self.robbed_gold.update_cell()
         self.robbed_gold.dirty = 1
 
     def restore_gold(self):
@@ -155,6 +179,8 @@ class Bots(Player):
         if self.robbed_gold:
             '''restore robbed gold'''
             self.robbed_gold.rect.bottomleft = self.rect.topleft
+            WorldObject.grid.move(self.robbed_gold)
+            self.robbed_gold.update_cell()
             self.robbed_gold.got_dropped = True
             self.robbed_gold.dirty = 1
 
@@ -181,8 +207,8 @@ class Bots(Player):
 
     def update(self):
         """add some bot only behaviour"""
-        if self.level.network_connector.server:
-            '''only the server bots get a brain'''
+        if self.level.network_connector.server or GameClock.deterministic:
+            '''only the server bots get a brain, in a lockstep game every client thinks for all bots'''
             self.process()
             log.debug("bot (" + str(self.pid) + ") thinks")
 
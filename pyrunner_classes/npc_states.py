@@ -3,9 +3,10 @@
 """States for the State Machine"""
 
 import math
-from ast import literal_eval as make_tuple
-from pyrunner_classes import logging, datetime, pygame
+from pyrunner_classes import logging, pygame
+from pyrunner_classes.game_clock import GameClock
 from pyrunner_classes.player import Player
+from pyrunner_classes.tile_map import WALKABLE
 
 log = logging.getLogger("Npc States")
 
@@ -25,7 +26,8 @@ class State(object):
         self.closest_player = None
         self.cp_distance = 0
         self.cp_last_tile = None
-        self.path = None
+        '''the tile of the player a ShortestPath state hunts while there's a way to it'''
+        self.target = None
         self.next_pos = None
         self.old_pos = None
         self.last_direction = 0
@@ -33,7 +35,7 @@ class State(object):
         self.search_ladder = False
         self.climbed_ladder = False
         self.detection_range = 10
-        self.last_movement = datetime.now()
+        self.last_movement = GameClock.now()
 
     def do_actions(self):
         """
@@ -58,20 +60,9 @@ class State(object):
         """actions the player should do when exiting this state"""
         pass
 
-    def get_next_position(self):
-        """return the next tile to walk to"""
-        if self.path:
-            length, pos_list = self.path
-        else:
-            pos_list = False
-
-        return make_tuple(pos_list.pop(0)) if pos_list else False
-
-    def get_path_length(self, own_path=None):
-        """return the length of the path"""
-        check_path = own_path if own_path else self.path
-        length, pos_list = check_path
-        return length if self.path else 0
+    def forget_path(self, tile_index):
+        """a tile got closed, states that keep a way across it forget it"""
+        pass
 
     def walk_the_line(self, x, y, bx, by):
         """Walk according to directions"""
@@ -119,13 +110,8 @@ class State(object):
 
             if self.bot.change_x:
                 '''check if there's nothing in the way to the player'''
-                for tile in self.bot.level.walkable_list:
-                    tx, ty = tile
-                    if bx == tx:
-                        if by < ty < y:
-                            jump_down = False
-                        elif ty >= y:
-                            break
+                if self.bot.level.tile_map.any_in_column(bx, by + 1, y, WALKABLE):
+                    jump_down = False
             '''then jump down'''
             if jump_down:
                 self.bot.change_x = 0
@@ -141,44 +127,12 @@ class State(object):
 
         self.check_world_borders()
 
-    def calc_shortest_paths(self, own_tile, target_tile):
-        """check all players for who's closest"""
-        try:
-            return self.bot.level.graph.shortest_path(own_tile, target_tile)
-        except KeyError:
-            log.info("Error: " + str(own_tile) + " " + str(target_tile))
-            return False
-
-    def shortest_path(self):
-        """get the shortest path to a target"""
-        if self.bot.on_tile:
-            '''calculate which player is the closest'''
-            own_tile = self.bot.on_tile
-
-            player = None
-            path = None
-            length = 0
-            for p in Player.group:
-                if p.is_human and p.on_tile:
-                    target_tile = p.on_tile
-
-                    new_path = self.calc_shortest_paths(own_tile, target_tile)
-                    if new_path:
-                        new_len = self.get_path_length(new_path)
-                        length = new_len if not length else length
-
-                        if new_len < length:
-                            player = p
-                            path = new_path
-                            length = new_len
-
-            return path if player else False
-
     def check_player_in_range(self):
         """find the closest player in a circle ratio"""
         collide_rect = pygame.sprite.collide_rect_ratio(self.detection_range)
 
-        players_in_range = pygame.sprite.spritecollide(self.bot, Player.humans, False, collided=collide_rect)
+        players_in_range = pygame.sprite.spritecollide(self.bot, GameClock.ordered(Player.humans), False,
+                                                       collided=collide_rect)
 
         if len(players_in_range) > 1:
             self.check_closest_player(players_in_range)
@@ -202,7 +156,7 @@ class State(object):
         last_tile = None
 
         if not players:
-            players = Player.humans
+            players = GameClock.ordered(Player.humans)
 
         for p in players:
             if p.on_tile:
@@ -230,7 +184,7 @@ class State(object):
 
             if self.bot.last_tile != self.bot.on_tile:
                 self.bot.last_tile = self.bot.on_tile
-                self.last_movement = datetime.now()
+                self.last_movement = GameClock.now()
 
             '''
                 check for collisions with other sprites:
@@ -300,12 +254,12 @@ class Exploring(State):
         if self.check_player_in_range():
             log.info("player found")
             return "shortest path"
-        elif (datetime.now() - self.last_movement).seconds >= 1:
+        elif (GameClock.now() - self.last_movement).seconds >= 1:
             return "hunting"
 
     def entry_actions(self):
         """check these conditions when entering this state"""
-        self.last_movement = datetime.now()
+        self.last_movement = GameClock.now()
 
     def exit_actions(self):
         """perform these actions when switching state"""
@@ -313,25 +267,15 @@ class Exploring(State):
 
 
 class ShortestPath(State):
-    """Hunt a player using Dijkstra's shortest path algorithm"""
+    """Hunt a player along the path table or the flow field of the tile he stands on, which all his hunters share"""
 
     def __init__(self, bot):
         State.__init__(self, "shortest path", bot)
 
     def do_actions(self):
-        """walk along the path"""
+        """walk along the shortest open way"""
         if not self.next_pos:
-            '''1. get the next position'''
-            if self.path:
-                self.next_pos = self.get_next_position()
-
-                if not self.next_pos:
-                    '''if the position is invalid go on to step 2'''
-                    self.path = self.next_pos = None
-
-        if not self.path and self.closest_player and self.closest_player.on_tile and self.bot.on_tile:
-            '''2. recreate a path if step 1 failed'''
-            self.path = self.calc_shortest_paths(self.bot.on_tile, self.closest_player.on_tile)
+            '''get the next position, it's None if the player can't be reached from here'''
             self.next_pos = self.get_next_position()
 
         if self.next_pos:
@@ -346,32 +290,49 @@ class ShortestPath(State):
 
             if x == bx or y == by or (not self.bot.change_x and not self.bot.change_y):
                 self.old_pos = self.next_pos
-                '''get the next valid position / empty the path to create a new one'''
+                '''get the next valid position / start over from the current tile'''
                 self.next_pos = self.get_next_position()
 
                 # log.info("trying to get a new position: ", str(self.next_pos), " old: ", str(self.old_pos))
                 if self.next_pos == self.old_pos:
                     self.next_pos = self.old_pos = None
 
+    def get_next_position(self):
+        """return the next tile to walk to, the path table or the flow field of the closest player knows it"""
+        target = self.closest_player.on_tile if self.closest_player else None
+        tile = self.next_pos if self.next_pos else self.bot.on_tile
+        next_pos = self.bot.level.next_tile(tile, target) if target and tile else None
+        '''without a next tile there's no way to the player, the bot goes hunting'''
+        self.target = target if next_pos else None
+
+        return next_pos if next_pos else False
+
+    def forget_path(self, tile_index):
+        """the next tiles avoid a closed tile, only the step to the current one may pass it"""
+        if not self.next_pos or not self.bot.on_tile:
+            return
+        try:
+            if tile_index not in self.bot.level.graph.path_tiles([self.bot.on_tile, self.next_pos]):
+                return
+        except KeyError:
+            pass
+        self.next_pos = None
+
     def check_conditions(self):
         """
-            if there's no path switch to exploring mode
+            if there's no way to the player switch to hunting mode
         """
-        if not self.path and not self.next_pos:
+        if not self.target and not self.next_pos:
             return "hunting"
-        elif (datetime.now() - self.last_movement).seconds >= 1:
+        elif (GameClock.now() - self.last_movement).seconds >= 1:
             return "exploring"
 
     def entry_actions(self):
-        """look up a shortest path if entering this state"""
+        """look up the way to the closest player if entering this state"""
         self.closest_player = self.check_player_in_range()
 
-        self.last_movement = datetime.now()
-
-        if not self.path:
-            if self.bot.on_tile and self.closest_player.on_tile:
-                self.path = self.calc_shortest_paths(self.bot.on_tile, self.closest_player.on_tile)
-                self.next_pos = self.get_next_position()
+        self.last_movement = GameClock.now()
+        self.next_pos = self.get_next_position()
 
     def exit_actions(self):
         """perform these when leaving this state"""
@@ -418,14 +379,14 @@ class Hunting(Exploring):
 
     def check_conditions(self):
         """if there's no path switch to exploring mode"""
-        if (datetime.now() - self.last_movement).seconds >= 1:
+        if (GameClock.now() - self.last_movement).seconds >= 1:
             if self.bot.on_rope or self.bot.direction.startswith("R"):
                 '''fix stuck on rope bug'''
                 self.bot.on_rope = False
                 self.bot.go_down()
             else:
                 return "exploring"
-        elif self.check_sp and (datetime.now() - self.switch_time).seconds >= 1:
+        elif self.check_sp and (GameClock.now() - self.switch_time).seconds >= 1:
             '''check if there's a shortest path to the target'''
             return "shortest path"
         elif not self.closest_player:
@@ -436,7 +397,7 @@ class Hunting(Exploring):
     def entry_actions(self):
         """look up the closest player when entering this state"""
         self.closest_player = self.check_player_in_range()
-        self.switch_time = self.last_movement = datetime.now()
+        self.switch_time = self.last_movement = GameClock.now()
 
     def exit_actions(self):
         """perform these when leaving this state"""
@@ -0,0 +1,200 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""precomputed next hop and distance table for all pairs of walkable tiles in a level"""
+import os
+import sys
+import struct
+import hashlib
+from array import array
+from heapq import heappush, heappop
+from pyrunner_classes import logging
+
+log = logging.getLogger("Path Table")
+TABLE_EXT = ".paths"
+TABLE_MAGIC = b"PRPT"
+TABLE_VERSION = 1
+TABLE_HEADER = struct.Struct("<4sH20sHHH")
+UNREACHABLE = 0xffff
+'''the tile indices, node numbers and distances are unsigned shorts with UNREACHABLE reserved'''
+MAX_TILES = UNREACHABLE
+'''the table takes 4 bytes for every pair of nodes, 64 MB at this limit'''
+MAX_NODES = 4096
+
+
+class PathTable(object):
+    """
+        stores the next hop and the distance for every pair of graph nodes in compact arrays
+
+        a path query only follows the next hops from the origin to the destination,
+        which is O(path length) instead of a full graph search
+
+        memory and build time grow with the square of the nodes, levels with more than MAX_TILES tiles,
+        MAX_NODES walkable tiles or paths longer than UNREACHABLE steps get no table
+    """
+
+    def __init__(self, graph, digest=None):
+        self.graph = graph
+        self.digest = digest if digest else self.graph_digest(graph)
+        '''compact node number -> tile index in the graph'''
+        self.node_ids = array('H', [index for index in range(graph.size) if graph.nodes[index]])
+        self.count = len(self.node_ids)
+        '''tile index in the graph -> compact node number'''
+        self.compact = dict((index, number) for number, index in enumerate(self.node_ids))
+        '''row major tables: entry [origin * count + destination]'''
+        self.next_hop = None
+        self.distance = None
+
+    @staticmethod
+    def graph_digest(graph):
+        """hash the graph content, the table is only valid for exactly this graph"""
+        offsets, targets, weights = graph.packed()
+        digest = hashlib.sha1()
+        digest.update(struct.pack("<HHH", TABLE_VERSION, graph.cols, graph.rows))
+        for values in (offsets, targets, weights):
+            digest.update(values.tobytes())
+        return digest.digest()
+
+    @staticmethod
+    def fits(graph):
+        """True if the tiles and the nodes of the graph are few enough for a table"""
+        return graph.size <= MAX_TILES and sum(graph.nodes) <= MAX_NODES
+
+    @classmethod
+    def load_or_build(cls, graph, level_path):
+        """load the cached table next to the tmx file or create (and cache) a new one
+
+        Returns: the table or None if the level is too big for one, the paths are searched in the graph then
+        """
+        if not cls.fits(graph):
+            log.info("%s has too many tiles for a path table, searching the graph instead" % level_path)
+            return None
+
+        table = cls(graph)
+        cache_path = os.path.splitext(level_path)[0] + TABLE_EXT
+
+        if not table.load(cache_path):
+            if not table.build():
+                log.info("%s has paths too long for a path table, searching the graph instead" % level_path)
+                return None
+            table.save(cache_path)
+
+        return table
+
+    def build(self):
+        """calculate the table with one dijkstra run per destination on the reversed graph
+
+        Returns: False if a distance doesn't fit into the table
+        """
+        count = self.count
+        compact = self.compact
+        '''reversed edges in compact numbers: target -> [(source, weight), ...]'''
+        reverse = [[] for _ in range(count)]
+        for number, index in enumerate(self.node_ids):
+            for target, weight in self.graph.neighbours(index):
+                reverse[compact[target]].append((number, weight))
+
+        self.next_hop = array('H', [UNREACHABLE]) * (count * count)
+        self.distance = array('H', [UNREACHABLE]) * (count * count)
+        next_hop, distance = self.next_hop, self.distance
+
+        for destination in range(count):
+            '''distance from every node to the destination'''
+            weights = [UNREACHABLE] * count
+            weights[destination] = 0
+            next_hop[destination * count + destination] = destination
+            distance[destination * count + destination] = 0
+            heap = [(0, destination)]
+
+            while heap:
+                weight, node = heappop(heap)
+                if weight > weights[node]:
+                    continue
+                for source, edge_weight in reverse[node]:
+                    new_weight = weight + edge_weight
+                    if new_weight >= UNREACHABLE:
+                        self.next_hop = self.distance = None
+                        return False
+                    if new_weight < weights[source]:
+                        weights[source] = new_weight
+                        '''the first step on the way from source to the destination'''
+                        next_hop[source * count + destination] = node
+                        distance[source * count + destination] = new_weight
+                        heappush(heap, (new_weight, source))
+
+        log.info("built path table for %s nodes" % count)
+        return True
+
+    def load(self, cache_path):
+        """load a cached table, returns False if there's none or it belongs to another graph"""
+        try:
+            with open(cache_path, "rb") as cache:
+                magic, version, digest, cols, rows, count = TABLE_HEADER.unpack(cache.read(TABLE_HEADER.size))
+                if magic != TABLE_MAGIC or version != TABLE_VERSION or digest != self.digest \
+                        or count != self.count:
+                    log.info("outdated path table %s" % cache_path)
+                    return False
+                node_ids = array('H')
+                node_ids.fromfile(cache, count)
+                next_hop = array('H')
+                next_hop.fromfile(cache, count * count)
+                distance = array('H')
+                distance.fromfile(cache, count * count)
+        except (OSError, EOFError, struct.error):
+            return False
+
+        if sys.byteorder == "big":
+            for values in (node_ids, next_hop, distance):
+                values.byteswap()
+        if node_ids != self.node_ids:
+            return False
+
+        self.next_hop, self.distance = next_hop, distance
+        log.info("loaded path table %s" % cache_path)
+        return True
+
+    def save(self, cache_path):
+        """store the table next to the level file"""
+        header = TABLE_HEADER.pack(TABLE_MAGIC, TABLE_VERSION, self.digest,
+                                   self.graph.cols, self.graph.rows, self.count)
+        try:
+            with open(cache_path, "wb") as cache:
+                cache.write(header)
+                for values in (self.node_ids, self.next_hop, self.distance):
+                    if sys.byteorder == "big":
+                        values = array('H', values)
+                        values.byteswap()
+                    values.tofile(cache)
+        except OSError:
+            log.info("could not write the path table %s" % cache_path)
+
+    def next_tile(self, origin, destination):
+        """the next tile id (x, y) on the way from a to b, b itself once it's reached or None if there's no way"""
+        graph = self.graph
+        try:
+            start = self.compact[graph.index(origin)]
+            stop = self.compact[graph.index(destination)]
+        except KeyError:
+            return None
+        hop = self.next_hop[start * self.count + stop]
+        return graph.tile(self.node_ids[hop]) if hop != UNREACHABLE else None
+
+    def shortest_path(self, origin, destination):
+        """follow the next hops from a to b
+
+        Returns: (distance, [(x, y), ...]) or raises a KeyError if one of the tiles is no node or unreachable
+        """
+        graph = self.graph
+        start = self.compact[graph.index(origin)]
+        stop = self.compact[graph.index(destination)]
+        count = self.count
+        length = self.distance[start * count + stop]
+        if length == UNREACHABLE:
+            raise KeyError(destination)
+
+        full_path = [graph.tile(self.node_ids[start])]
+        node = start
+        while node != stop:
+            node = self.next_hop[node * count + stop]
+            full_path.append(graph.tile(self.node_ids[node]))
+
+        return length, full_path
@@ -12,7 +12,7 @@ from __future__ import division
 
 import pygame
 
-from pyrunner_classes import datetime
+from pyrunner_classes.game_clock import GameClock
 from .spritesheet_handling import SpriteSheet
 from .player_objects import GoldScore
 
@@ -42,6 +42,8 @@ class Player(pygame.sprite.DirtySprite):
         self.previous_direction = self.direction
         # positional attributes
         self.x, self.y = pos
+        '''position before the last simulation step, used to interpolate the drawing'''
+        self.last_pos = pos
         self.on_tile = None
         self.on_ground = False
         self.on_ladder = False
@@ -52,7 +54,10 @@ class Player(pygame.sprite.DirtySprite):
         # movement related
         self.change_x = 0
         self.change_y = 0
-        self.speed = (self.size / 10) * 2
+        '''a lockstep game moves in whole pixels so every client ends up on the same ones'''
+        self.speed = self.size * 2 // 10 if GameClock.deterministic else (self.size / 10) * 2
+        '''hundredths of a pixel the fall speed gained in a lockstep game that don't make a whole pixel yet'''
+        self.fall_fraction = 0
         # lists holding the image for movement. Up and down movement uses the same sprites.
         self.spawn_frames = []
         self.walking_frames_l = []
@@ -74,7 +79,9 @@ class Player(pygame.sprite.DirtySprite):
         self.stop_at_y = 0
         self.is_human = False if bot else True
         self.reached_exit = False
-        self.last_sync = datetime.now()
+        self.last_sync = GameClock.now()
+        '''set while the client replays its own inputs after a misprediction'''
+        self.replaying = False
 
         if self.is_human:
             Player.humans.add(self)
@@ -101,7 +108,7 @@ class Player(pygame.sprite.DirtySprite):
             # Load all the left facing images into a list (x, y, height, width)
             self.walking_frames_l = self.sprite_sheet.add_animation(0, 0, 4)
             # Load all the left facing images into a list and flip them to make them face right
-            self.walking_frames_r = self.sprite_sheet.flip_frames(self.walking_frames_l)
+            self.walking_frames_r = self.sprite_sheet.add_animation(0, 0, 4, flipped=True)
             # Load all the up / down facing images into a list
             self.walking_frames_ud = self.sprite_sheet.add_animation(0, 1, 4)
             # Load all falling down frames
@@ -109,11 +116,11 @@ class Player(pygame.sprite.DirtySprite):
             # Load all the digging left images
             self.digging_frames_l = self.sprite_sheet.add_animation(0, 2, 3)
             # Load all the digging left images and flip them do digging right
-            self.digging_frames_r = self.sprite_sheet.flip_frames(self.digging_frames_l)
+            self.digging_frames_r = self.sprite_sheet.add_animation(0, 2, 3, flipped=True)
             # Load the left hanging images into a list
             self.hanging_frames_l = self.sprite_sheet.add_animation(4, 1, 4)
             # Load the left hanging images into a list and flip them to face right
-            self.hanging_frames_r = self.sprite_sheet.flip_frames(self.hanging_frames_l)
+            self.hanging_frames_r = self.sprite_sheet.add_animation(4, 1, 4, flipped=True)
             # death animation
             self.death_frames = self.sprite_sheet.add_animation(5, 2, 8)
             # Stop Frame: Sprite when player is not moving on ground
@@ -128,6 +135,37 @@ class Player(pygame.sprite.DirtySprite):
             # spawn the player at the desired location
             self.rect.topleft = pos
 
+    @staticmethod
+    def store_positions():
+        """remember the position of all players before the next simulation step"""
+        for player in Player.group:
+            player.last_pos = player.rect.topleft
+
+    @staticmethod
+    def draw_interpolated(surface, alpha):
+        """draw all players between their last and current position
+
+        Args:
+            surface (pygame.Surface): surface to draw to
+            alpha (float): progress between the last (0) and the current (1) simulation step
+
+        Returns: list(pygame.Rect) with all changed rects
+        """
+        positions = []
+        for player in Player.group:
+            last_x, last_y = player.last_pos
+            x, y = player.rect.topleft
+            '''don't interpolate jumps like respawns'''
+            if abs(x - last_x) <= player.size and abs(y - last_y) <= player.size:
+                positions.append((player, x, y))
+                player.rect.topleft = (round(last_x + (x - last_x) * alpha), round(last_y + (y - last_y) * alpha))
+
+        rects = Player.group.draw(surface)
+
+        for player, x, y in positions:
+            player.rect.topleft = x, y
+        return rects
+
     # Player-controlled movement:
     def go_left(self):
         """" Called when the user hits the left arrow. Checks if player is on Rope to change animation """
@@ -273,7 +311,7 @@ class Player(pygame.sprite.DirtySprite):
                 elif self.direction.startswith("S") and self.previous_direction.startswith("S"):
                     self.previous_direction = self.direction
                 else:
-                    time = datetime.now()
+                    time = GameClock.now()
                     if (time - self.last_sync).microseconds >= 500000:
                         '''completely sync players each time they stop at one point'''
                         self.last_sync = time
@@ -292,20 +330,29 @@ class Player(pygame.sprite.DirtySprite):
                 pygame.sprite.DirtySprite.kill(self)
 
     def send_network_update(self):
-        """send all relevant data to the server"""
-        if self.is_human:
+        """send all relevant data to the server, the bots get to the clients with the snapshots of the server
+
+        the clients of a lockstep game simulate everything themselves and only send their keys
+        """
+        if self.is_human and not self.replaying and not GameClock.deterministic and \
+                self.level.network_connector.client:
             self.level.network_connector.client.send_current_pos_and_data()
-        if not self.is_human and self.level.network_connector.master:
-            self.level.network_connector.server.send_bot_pos_and_data(self)
 
     def calc_gravity(self):
         """ Calculate effect of gravity. """
         # See if we are on the ground and not on a ladder or rope
         if not self.on_ground and not self.on_ladder and not self.on_rope and self.direction is not "Trapped":
             if self.speed <= self.change_y <= self.speed * 2.5:
-                self.change_y += .35
+                if GameClock.deterministic:
+                    '''the same acceleration in integer steps'''
+                    self.fall_fraction += 35
+                    self.change_y += self.fall_fraction // 100
+                    self.fall_fraction %= 100
+                else:
+                    self.change_y += .35
             else:
                 self.change_y = self.speed
+                self.fall_fraction = 0
 
         if self.stop_on_ground:
             if self.change_x is not 0:
@@ -30,6 +30,7 @@ class RenderThread(threading.Thread):
         fullscreen (Optional[bool]): run in fullscreen or windowed mode
         switch_resolution (Optional[bool]): don't switch screen resolution but render on smaller surface
         daemon (Optional[bool]): quit this thread if main program quits
+        full_update_ratio (Optional[float]): update the whole screen if the changed rects cover more of it
 
     Attributes:
         thread_is_running (bool): status of this thread
@@ -42,6 +43,7 @@ class RenderThread(threading.Thread):
         daemon (bool): True if this thread should be stopped with the main program
         clock (pygame.time.Clock): used to time loops
         _rects_to_update (list(Rect)): list containing all Rects which should be redrawn/updated
+        full_update_ratio (float): share of the screen above which one full update is cheaper than the rects
         _screen (pygame.Surface): surface this Menu is drawn to
         _display_modes(list((x, y))): list containing all valid fullscreen resolutions
 
@@ -53,7 +55,8 @@ class RenderThread(threading.Thread):
     """
     lock = threading.Lock()
 
-    def __init__(self, caption, width, height, fps=25, fullscreen=False, switch_resolution=False, daemon=True):
+    def __init__(self, caption, width, height, fps=25, fullscreen=False, switch_resolution=False, daemon=True,
+                 full_update_ratio=0.5):
         threading.Thread.__init__(self)
         self.thread_is_running = True
         self._caption = None
@@ -67,6 +70,7 @@ class RenderThread(threading.Thread):
         self.clock = pygame.time.Clock()
         # dirty rects list to only partially update the screen
         self._rects_to_update = []
+        self.full_update_ratio = full_update_ratio
         # initialize the screen
         self._screen = None
         self._force_refresh = False
@@ -187,16 +191,18 @@ class RenderThread(threading.Thread):
                     if not self._updating_screen:
                         # only one function call is allowed to update the screen at once
                         self._updating_screen = True
+                        rects = self._take_rects_to_update()
                         '''force refresh has priority to avoid flickering
                            by not allowing multiple display updates ot once'''
-                        while self.rects_to_update and not self._force_refresh:
-                            pygame.display.update(self.rects_to_update.pop())
+                        if rects and not self._force_refresh:
+                            self._update_rects(rects)
                         self._updating_screen = False
                 except (IndexError, ValueError, pygame.error):
                     '''completely refresh the screen'''
                     print("Error occurred parsing %s" % self._rects_to_update)
                     self._rects_to_update = []
-                    self.refresh_screen()
+                    self._updating_screen = False
+                    self.refresh_screen(True)
         except pygame.error:
             # OpenGL can only redraw the whole screen
             try:
@@ -204,6 +210,46 @@ class RenderThread(threading.Thread):
             except pygame.error:
                 self.refresh_screen(True)
 
+    def _take_rects_to_update(self):
+        """swap the list of rects to update with an empty one, so nothing added meanwhile gets lost"""
+        with self.lock:
+            rects, self._rects_to_update = self._rects_to_update, []
+        return rects
+
+    def _update_rects(self, rects):
+        """update the merged rects with one display call or the whole screen if they cover most of it"""
+        rects = self.merge_rects(rects)
+        screen_rect = self._screen.get_rect()
+        covered = 0
+        for rect in rects:
+            clipped = rect.clip(screen_rect)
+            covered += clipped.width * clipped.height
+        if covered > screen_rect.width * screen_rect.height * self.full_update_ratio:
+            pygame.display.update()
+        else:
+            pygame.display.update(rects)
+
+    @staticmethod
+    def merge_rects(rects):
+        """merge overlapping or adjacent rects into their union
+
+        Args:
+            rects (list(pygame.Rect)): rects to merge, they aren't altered
+
+        Returns: list(pygame.Rect) without any overlapping or touching rects
+        """
+        merged = []
+        '''sorted from left to right most rects touch the last merged one'''
+        for rect in sorted(rects, key=lambda r: r.x):
+            rect = rect.copy()
+            '''one pixel wider in each direction to catch touching rects too'''
+            index = rect.inflate(2, 2).collidelist(merged)
+            while index != -1:
+                rect.union_ip(merged.pop(index))
+                index = rect.inflate(2, 2).collidelist(merged)
+            merged.append(rect)
+        return merged
+
     def set_resolution(self, width, height):
         """change the screen/window resolution
 
@@ -273,6 +319,16 @@ class RenderThread(threading.Thread):
             # update the dirty rect area because it's a little bit bigger
             self.add_rect_to_update(self._fps_dirty_rect.get_rect(), surf, pos, False)
 
+    @property
+    def fps_rect(self):
+        """the area of the frame rate display on the bg_surface
+
+        Returns: pygame.Rect or None if the frame rate isn't shown
+        """
+        if self.show_framerate and self._fps_dirty_rect and self._fps_pos:
+            return pygame.Rect(self._fps_pos, self._fps_margin)
+        return None
+
     @property
     def caption(self):
         """ Title of the pygame window
@@ -306,9 +362,8 @@ class RenderThread(threading.Thread):
         return self._rects_to_update
 
     def add_rect_to_update(self, rects, surface=None, pos=None, centered=None):
-        """Add a rect or list of rects at the beginning of the rects_to_update list.
-           This is to ensure the FIFO principle because the rendering function always
-           pops the last item out of the list.
+        """Add a rect or (nested) list of rects to the rects_to_update list.
+           All rects are merged and updated with one display call on the next refresh.
 
            This function automatically corrects offsets between the drawing surface
            and the screen if a surface is provided.
@@ -324,23 +379,25 @@ class RenderThread(threading.Thread):
 
         def add_rect(single_rect):
             """make sure not to add something wrong because pygame.display.update is very sensible"""
+            if isinstance(single_rect, list):
+                '''pygame.display.update() doesn't allow multi dimensional lists'''
+                for item in single_rect:
+                    add_rect(item)
+                return
             try:
-                self._rects_to_update.insert(0, single_rect)
+                rect = pygame.Rect(single_rect)
             except TypeError:
                 print("%s is no valid pygame.Rect" % single_rect)
+                return
+            with self.lock:
+                self._rects_to_update.append(rect)
 
         if surface:
             if not pos and not centered:
                 raise ValueError('Either a position (int, int) or centered bool is required if a surface is provided')
             rects = self._fix_update_rects(rects, surface, pos, centered)
 
-        if isinstance(rects, list):
-            for item in rects:
-                # add the list one by one because pygame.display.update()
-                # doesn't allow multi dimensional lists
-                add_rect(item)
-        else:
-            add_rect(rects)
+        add_rect(rects)
 
     def get_screen_offset(self):
         """get the screen offset for hard coded positions"""
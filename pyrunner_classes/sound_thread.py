@@ -107,6 +107,17 @@ class MusicMixer(threading.Thread):
                 self.play_sound(pygame.mixer.Sound(self.get_full_path_sfx(file)), loop)
                 # TODO: when this exception is called the game breaks
 
+    @staticmethod
+    def load_sound(file):
+        """helper function to load a sound file located in SOUND_PATH
+
+        Args:
+            file (str): the filename of the requested file
+
+        Returns: pygame.mixer.Sound
+        """
+        return pygame.mixer.Sound(MusicMixer.get_full_path_sfx(file))
+
     @staticmethod
     def get_full_path_music(file):
         """helper function to get a full path for a music file in MUSIC_PATH
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""tile indexed spatial hash for fast sprite lookups"""
+
+
+class SpatialGrid(object):
+    """
+        stores sprites in all tile cells their rect covers
+
+        point and rect queries only have to check the few sprites of the affected cells
+        instead of iterating the whole sprite group. sprites keep their insertion order
+        (serial) so queries return them in the same order as the sprite group would.
+    """
+
+    def __init__(self, cell_width=32, cell_height=32, offset_x=0, offset_y=0):
+        self.cells = {}
+        self.serial = 0
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self.offset_x = offset_x
+        self.offset_y = offset_y
+
+    def configure(self, cell_width, cell_height, offset_x=0, offset_y=0):
+        """set the tile size and the offset of the level on the surface, removes all sprites"""
+        self.clear()
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self.offset_x = offset_x
+        self.offset_y = offset_y
+
+    def clear(self):
+        """remove all sprites from the grid"""
+        self.cells = {}
+        self.serial = 0
+
+    def cell_at(self, x, y):
+        """returns the cell (column, row) containing the pixel x/y"""
+        return (x - self.offset_x) // self.cell_width, (y - self.offset_y) // self.cell_height
+
+    def covered_cells(self, rect):
+        """returns all cells a rect overlaps, rects without a size belong to the cell of their top left corner"""
+        left, top = self.cell_at(rect.left, rect.top)
+        right = (rect.right - 1 - self.offset_x) // self.cell_width if rect.width > 0 else left
+        bottom = (rect.bottom - 1 - self.offset_y) // self.cell_height if rect.height > 0 else top
+
+        return [(x, y) for y in range(top, bottom + 1) for x in range(left, right + 1)]
+
+    def add(self, sprite):
+        """add a sprite to all cells its rect covers"""
+        sprite.grid_serial = self.serial
+        self.serial += 1
+        self._insert(sprite, self.covered_cells(sprite.rect))
+
+    def _insert(self, sprite, cells):
+        """store the sprite in the cells"""
+        sprite.grid_cells = cells
+        for cell in cells:
+            sprites = self.cells.get(cell)
+            if sprites is None:
+                self.cells[cell] = [sprite]
+            else:
+                sprites.append(sprite)
+                if sprites[-2].grid_serial > sprite.grid_serial:
+                    '''keep the group order if a sprite moved into a cell'''
+                    sprites.sort(key=lambda item: item.grid_serial)
+
+    def remove(self, sprite):
+        """remove a sprite from the grid"""
+        for cell in getattr(sprite, "grid_cells", ()):
+            sprites = self.cells.get(cell)
+            if sprites and sprite in sprites:
+                sprites.remove(sprite)
+                if not sprites:
+                    del self.cells[cell]
+        sprite.grid_cells = []
+
+    def move(self, sprite):
+        """update the cells of a sprite after its rect changed"""
+        cells = self.covered_cells(sprite.rect)
+        if cells != getattr(sprite, "grid_cells", None):
+            self.remove(sprite)
+            self._insert(sprite, cells)
+
+    def sprite_at(self, x, y):
+        """returns the first sprite containing the point x/y or None"""
+        return self.sprite_in_cell(self.cell_at(x, y), x, y)
+
+    def sprite_in_cell(self, cell, x, y):
+        """same as sprite_at if the cell of the point is already known"""
+        for sprite in self.cells.get(cell, ()):
+            if sprite.rect.collidepoint(x, y):
+                return sprite
+        return None
+
+    def sprites_at_tile(self, tile_id):
+        """returns all sprites in a cell"""
+        return list(self.cells.get(tile_id, ()))
+
+    def candidates(self, rect):
+        """returns all sprites in the cells a rect covers, without checking for collisions"""
+        cells = self.covered_cells(rect)
+        if len(cells) == 1:
+            return list(self.cells.get(cells[0], ()))
+
+        found = {}
+        for cell in cells:
+            for sprite in self.cells.get(cell, ()):
+                found[sprite.grid_serial] = sprite
+        return [found[serial] for serial in sorted(found)]
+
+    def sprites_in_rect(self, rect):
+        """returns all sprites colliding with a rect in group order (like pygame.sprite.spritecollide)"""
+        return [sprite for sprite in self.candidates(rect) if sprite.rect.colliderect(rect)]
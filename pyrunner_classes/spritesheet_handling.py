@@ -3,6 +3,7 @@ This module is used to pull individual sprites from sprite sheets.
 """
 from pyrunner_classes import *
 from pygame.locals import *
+from pyrunner_classes.headless import HeadlessImage
 
 SPRITE_SHEET_PATH = "./resources/sprites/"
 
@@ -10,10 +11,20 @@ SPRITE_SHEET_PATH = "./resources/sprites/"
 class SpriteSheet(object):
     """ Class used to grab images out of a sprite sheet. """
 
+    # loaded sheets and animation frames are shared by all instances (e.g. every respawned bot)
+    sheets = {}
+    frames = {}
+
     def __init__(self, file_name, tilesize, pixel_diff=0, fps=25, use_colorkey=True):
         """ Constructor. Pass in the file name of the sprite sheet. """
         # Load the sprite sheet.
-        self.sprite_sheet = pygame.image.load(SPRITE_SHEET_PATH + file_name).convert_alpha()
+        self.file_name = file_name
+        if HeadlessImage.enabled:
+            # the headless server only needs the size of the frames
+            SpriteSheet.sheets.setdefault(file_name, None)
+        elif file_name not in SpriteSheet.sheets:
+            SpriteSheet.sheets[file_name] = pygame.image.load(SPRITE_SHEET_PATH + file_name).convert_alpha()
+        self.sprite_sheet = SpriteSheet.sheets[file_name]
         self.tile_size = tilesize
         self.pixel_diff = pixel_diff
         self.fps = fps
@@ -23,6 +34,8 @@ class SpriteSheet(object):
         """ Grab a single image out of a larger spritesheet
             Pass in the x, y location of the sprite
             and the width and height of the sprite. """
+        if HeadlessImage.enabled:
+            return HeadlessImage((width + self.pixel_diff, height + self.pixel_diff))
 
         # Create a new blank image
         image = pygame.Surface([width, height], SRCALPHA)
@@ -44,8 +57,22 @@ class SpriteSheet(object):
         # Return the image
         return image
 
-    def add_animation(self, pos_x, pos_y, frames=1):
-        """define which images on a sprite sheet to use for an animation"""
+    def add_animation(self, pos_x, pos_y, frames=1, flipped=False):
+        """define which images on a sprite sheet to use for an animation, the frames are cached for all instances"""
+        key = self.file_name, self.tile_size, self.pixel_diff, self.use_colorkey, pos_x, pos_y, frames, flipped
+        if key not in SpriteSheet.frames:
+            animation = self.load_animation(pos_x, pos_y, frames)
+            # placeholders of the headless server look the same in both directions
+            if flipped and not HeadlessImage.enabled:
+                animation = self.flip_frames(animation)
+            SpriteSheet.frames[key] = animation
+
+        animation = SpriteSheet.frames[key]
+        # hand out a copy of frame lists, the surfaces are shared
+        return list(animation) if isinstance(animation, list) else animation
+
+    def load_animation(self, pos_x, pos_y, frames=1):
+        """cut the images of an animation out of the sprite sheet"""
         ts = self.tile_size
         pos_y *= ts
         pos_x *= ts
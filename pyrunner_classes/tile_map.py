@@ -0,0 +1,127 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""dense matrix of tile flags for the complete level"""
+import numpy
+
+'''tile flags, a tile can have several of them'''
+SOLID = 1
+CLIMBABLE = 2
+ROPE = 4
+REMOVABLE = 8
+COLLECTIBLE = 16
+EXIT = 32
+'''tiles that are part of the walking paths of the bots'''
+WALKABLE = 64
+
+
+def sprite_flags(sprite):
+    """returns the flags of a world object"""
+    flags = 0
+    if sprite.solid:
+        flags |= SOLID
+    if sprite.climbable:
+        flags |= CLIMBABLE
+    if sprite.is_rope:
+        flags |= ROPE
+    if sprite.removable:
+        flags |= REMOVABLE
+    if sprite.collectible:
+        flags |= COLLECTIBLE
+    if sprite.exit:
+        flags |= EXIT
+    return flags
+
+
+class TileMap(object):
+    """
+        uint8 matrix (rows, cols) with the flags of every tile in the level
+
+        it's kept up to date when blocks are dug, restored or gold gets collected
+        so the state of the level can be read without asking thousands of sprites,
+        the listeners get notified whenever a block gets dug or restored
+    """
+
+    def __init__(self, cols=0, rows=0):
+        self.cols = cols
+        self.rows = rows
+        self.flags = numpy.zeros((rows, cols), numpy.uint8)
+        '''flags of the level as it was loaded, used to restore dug blocks'''
+        self.base = numpy.zeros((rows, cols), numpy.uint8)
+        '''callables that get (tile_id, removed) when a block got dug or restored'''
+        self.listeners = []
+
+    def configure(self, cols, rows):
+        """resize the map for a new level, removes all flags and listeners"""
+        self.__init__(cols, rows)
+
+    def subscribe(self, listener):
+        """call listener(tile_id, removed) after a block got dug (removed is True) or restored"""
+        self.listeners.append(listener)
+
+    def notify(self, tile_id, removed):
+        """let all listeners know that a block changed"""
+        for listener in self.listeners:
+            listener(tile_id, removed)
+
+    def valid(self, tile_id):
+        """check if the tile is inside of the level"""
+        try:
+            x, y = tile_id
+        except TypeError:
+            return False
+        return 0 <= x < self.cols and 0 <= y < self.rows
+
+    def add(self, tile_id, flags):
+        """add flags of the loaded level"""
+        if self.valid(tile_id):
+            x, y = tile_id
+            self.flags[y, x] |= flags
+            self.base[y, x] |= flags
+
+    def get(self, tile_id):
+        """returns all flags of a tile, tiles outside of the level have none"""
+        if self.valid(tile_id):
+            x, y = tile_id
+            return int(self.flags[y, x])
+        return 0
+
+    def has(self, tile_id, flag):
+        """check if a tile has one of the flags"""
+        return bool(self.get(tile_id) & flag)
+
+    def set(self, tile_id, flags):
+        """add flags to a tile"""
+        if self.valid(tile_id):
+            x, y = tile_id
+            self.flags[y, x] |= flags
+
+    def clear(self, tile_id, flags):
+        """remove flags of a tile"""
+        if self.valid(tile_id):
+            x, y = tile_id
+            self.flags[y, x] &= ~flags & 0xff
+
+    def remove(self, tile_id):
+        """the sprite of the tile got removed (e.g. dug), only the walking path stays"""
+        if self.valid(tile_id):
+            self.clear(tile_id, ~WALKABLE & 0xff)
+            self.notify(tile_id, True)
+
+    def restore(self, tile_id):
+        """reset a tile to the flags of the loaded level"""
+        if self.valid(tile_id):
+            x, y = tile_id
+            self.flags[y, x] = self.base[y, x]
+            self.notify(tile_id, False)
+
+    def mask(self, flag):
+        """returns a boolean matrix of all tiles with one of the flags"""
+        return (self.flags & flag) != 0
+
+    def any_in_column(self, x, top, bottom, flag):
+        """check if any tile in column x between the rows top and bottom (exclusive) has one of the flags"""
+        top = max(top, 0)
+        bottom = min(bottom, self.rows)
+        if not 0 <= x < self.cols or top >= bottom:
+            return False
+        return bool(numpy.any(self.flags[top:bottom, x] & flag))
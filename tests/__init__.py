@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""unit tests of the pure data classes, run them with python3 -m unittest discover tests"""
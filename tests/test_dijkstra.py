@@ -0,0 +1,102 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""tests of the packed A* graph"""
+import random
+import unittest
+from heapq import heappush, heappop
+
+from pyrunner_classes.dijkstra import Graph
+
+
+def random_graph(cols, rows, seed):
+    """a grid with short edges between neighbours and some long edges along rows and columns"""
+    generator = random.Random(seed)
+    graph = Graph(cols, rows)
+    edges = {}
+    for y in range(rows):
+        for x in range(cols):
+            if generator.random() < 0.3:
+                continue
+            for target in ((x + 1, y), (x, y + 1)):
+                if target[0] < cols and target[1] < rows and generator.random() < 0.7:
+                    edges[(x, y), target] = edges[target, (x, y)] = 1
+    for _ in range(cols):
+        x, y = generator.randrange(cols), generator.randrange(rows)
+        target = (generator.randrange(cols), y) if generator.random() < 0.5 else (x, generator.randrange(rows))
+        if target != (x, y):
+            edges[(x, y), target] = abs(target[0] - x) + abs(target[1] - y)
+    for (origin, target), weight in edges.items():
+        graph.add_edge(origin, target, weight)
+    return graph, edges
+
+
+def plain_dijkstra(edges, origin):
+    """distances of all reachable tiles from origin"""
+    neighbours = {}
+    for (source, target), weight in edges.items():
+        neighbours.setdefault(source, []).append((target, weight))
+    distance = {origin: 0}
+    heap = [(0, origin)]
+    while heap:
+        weight, node = heappop(heap)
+        if weight > distance[node]:
+            continue
+        for target, edge_weight in neighbours.get(node, ()):
+            if weight + edge_weight < distance.get(target, weight + edge_weight + 1):
+                distance[target] = weight + edge_weight
+                heappush(heap, (weight + edge_weight, target))
+    return distance
+
+
+class GraphTest(unittest.TestCase):
+    """the searches against a plain dijkstra on the same edges"""
+
+    def test_search_finds_the_shortest_paths(self):
+        for seed in range(5):
+            graph, edges = random_graph(12, 9, seed)
+            nodes = sorted(set(origin for origin, target in edges) | set(target for origin, target in edges))
+            for origin in nodes[::5]:
+                expected = plain_dijkstra(edges, origin)
+                for destination in nodes:
+                    if destination not in expected:
+                        self.assertRaises(KeyError, graph.shortest_path, origin, destination)
+                        continue
+                    length, path = graph.shortest_path(origin, destination)
+                    self.assertEqual(length, expected[destination])
+                    self.assertEqual((path[0], path[-1]), (origin, destination))
+                    self.assertEqual(sum(edges[step] for step in zip(path, path[1:])), length)
+
+    def test_closed_tiles_are_avoided(self):
+        graph, edges = random_graph(12, 9, 7)
+        nodes = sorted(set(origin for origin, target in edges))
+        closed = set(graph.index(tile) for tile in nodes[3::7])
+        for index in closed:
+            self.assertTrue(graph.close_tile(index))
+        open_edges = dict((edge, weight) for edge, weight in edges.items()
+                          if not closed.intersection(graph.passed(graph.index(edge[0]), graph.index(edge[1]))))
+        open_nodes = [tile for tile in nodes if graph.index(tile) not in closed]
+        for origin in open_nodes[::4]:
+            expected = plain_dijkstra(open_edges, origin)
+            for destination in open_nodes:
+                if destination not in expected:
+                    self.assertRaises(KeyError, graph.shortest_path, origin, destination)
+                    continue
+                length, path = graph.shortest_path(origin, destination)
+                self.assertEqual(length, expected[destination])
+                self.assertTrue(graph.is_open(path))
+
+        for index in closed:
+            self.assertTrue(graph.open_tile(index))
+        self.assertFalse(graph.open_tile(min(closed)))
+        self.assertEqual(graph.closed_count, 0)
+        self.assertFalse(any(graph._blocked))
+
+    def test_invalid_tiles(self):
+        graph, edges = random_graph(5, 5, 1)
+        self.assertRaises(KeyError, graph.shortest_path, (0, 0), (5, 0))
+        self.assertRaises(KeyError, graph.shortest_path, None, (0, 0))
+        self.assertEqual(graph.tile(graph.index((3, 4))), (3, 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
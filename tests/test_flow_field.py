@@ -0,0 +1,128 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""tests of the distance maps the bots share"""
+import unittest
+
+from pyrunner_classes.flow_field import FlowField, FlowFields
+from pyrunner_classes.path_table import PathTable
+from tests.test_dijkstra import random_graph
+
+
+class FlowFieldTest(unittest.TestCase):
+    """a flow field has to give the same distances as a search from every tile"""
+
+    def assert_same_as_search(self, graph, nodes, target):
+        field = FlowField(graph, target)
+        for tile in nodes:
+            try:
+                expected, expected_path = graph.shortest_path(tile, target)
+            except KeyError:
+                self.assertIsNone(field.length(tile))
+                self.assertRaises(KeyError, field.shortest_path, tile)
+                continue
+            length, path = field.shortest_path(tile)
+            self.assertEqual(length, expected)
+            self.assertEqual((path[0], path[-1]), (tile, target))
+            self.assertTrue(graph.is_open(path))
+
+    def test_same_distances_as_search(self):
+        for seed in range(3):
+            graph, edges = random_graph(12, 9, seed)
+            nodes = sorted(set(origin for origin, target in edges))
+            for target in nodes[::9]:
+                self.assert_same_as_search(graph, nodes, target)
+
+    def test_closed_tiles(self):
+        graph, edges = random_graph(12, 9, 7)
+        nodes = sorted(set(origin for origin, target in edges))
+        for tile in nodes[3::7]:
+            graph.close_tile(graph.index(tile))
+        open_nodes = [tile for tile in nodes if not graph.closed[graph.index(tile)]]
+        for target in open_nodes[::9]:
+            self.assert_same_as_search(graph, open_nodes, target)
+
+    def test_unknown_tiles(self):
+        graph, edges = random_graph(5, 5, 1)
+        field = FlowField(graph, sorted(edges)[0][0])
+        self.assertIsNone(field.length((5, 0)))
+        self.assertIsNone(field.next_tile(None))
+        self.assertRaises(KeyError, field.shortest_path, (5, 0))
+
+
+
+class FlowFieldsTest(unittest.TestCase):
+    """the next tiles the bots walk along, from the path table while its path is open or the flow fields"""
+
+    def setUp(self):
+        self.graph, self.edges = random_graph(12, 9, 7)
+        self.nodes = sorted(set(origin for origin, target in self.edges))
+        self.table = PathTable(self.graph)
+        self.assertTrue(self.table.build())
+
+    def assert_shortest_walks(self, fields, targets):
+        """following the next tiles from every node has to take a shortest open way"""
+        graph = self.graph
+        for target in targets:
+            for origin in self.nodes:
+                if graph.closed[graph.index(origin)]:
+                    continue
+                try:
+                    expected = graph.shortest_path(origin, target)[0]
+                except KeyError:
+                    self.assertIsNone(fields.next_tile(origin, target))
+                    continue
+                tile, length = origin, 0
+                while tile != target:
+                    next_tile = fields.next_tile(tile, target)
+                    self.assertTrue(graph.is_open([tile, next_tile]))
+                    length += self.edges[tile, next_tile]
+                    tile = next_tile
+                self.assertEqual(length, expected)
+                self.assertEqual(fields.next_tile(target, target), target)
+
+    def test_with_and_without_table(self):
+        targets = self.nodes[::11]
+        for table in (None, self.table):
+            fields = FlowFields(self.graph, table)
+            self.assert_shortest_walks(fields, targets)
+            self.assertEqual(len(fields.fields), 0 if table else len(targets))
+
+    def test_closed_tiles(self):
+        for tile in self.nodes[3::7]:
+            self.graph.close_tile(self.graph.index(tile))
+        targets = [tile for tile in self.nodes[::11] if not self.graph.closed[self.graph.index(tile)]]
+        for table in (None, self.table):
+            self.assert_shortest_walks(FlowFields(self.graph, table), targets)
+
+    def test_dug_tiles_only_drop_the_fields_they_change(self):
+        graph = self.graph
+        fields = FlowFields(graph)
+        targets = self.nodes[::11]
+        kept = dropped = 0
+        for number, tile in enumerate(self.nodes[3::5] + self.nodes[3::10]):
+            index = graph.index(tile)
+            closed = not graph.closed[index]
+            for target in targets:
+                fields.field(target)
+            self.assertTrue(graph.close_tile(index) if closed else graph.open_tile(index))
+            fields.tile_changed(index, closed)
+            for target_index, field in fields.fields.items():
+                self.assertEqual(field.distance, FlowField(graph, graph.tile(target_index)).distance)
+            kept += len(fields.fields)
+            dropped += len(targets) - len(fields.fields)
+            open_targets = [target for target in targets if not graph.closed[graph.index(target)]]
+            self.assert_shortest_walks(fields, open_targets)
+        self.assertTrue(kept and dropped)
+
+    def test_prune(self):
+        fields = FlowFields(self.graph)
+        for target in self.nodes[:3]:
+            fields.field(target)
+        fields.prune([self.nodes[1], None, True, (99, 99)])
+        self.assertEqual(list(fields.fields), [self.graph.index(self.nodes[1])])
+        self.assertIsNone(fields.next_tile(True, self.nodes[1]))
+        self.assertIsNone(fields.field(True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""tests of the packet framing of the tcp transport"""
+import unittest
+
+from libs.Mastermind._mm_netutil import FrameReader, packet_encode
+
+
+class Stream(object):
+    """a socket that hands out the received bytes in the given chunks"""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def recv_into(self, view):
+        if not self.chunks:
+            return 0
+        chunk = self.chunks.pop(0)
+        size = min(len(chunk), len(view))
+        view[:size] = chunk[:size]
+        if size < len(chunk):
+            self.chunks.insert(0, chunk[size:])
+        return size
+
+
+def read_all(reader, stream):
+    """all frames the reader gets out of the stream, copied before the next read"""
+    frames = []
+    while reader.read(stream):
+        frame = reader.next_frame()
+        while frame is not None:
+            frames.append(bytes(frame) if not isinstance(frame, str) else frame)
+            frame = reader.next_frame()
+    return frames
+
+
+class FrameReaderTest(unittest.TestCase):
+    """packets split over reads, several packets in one read and packets larger than the buffer"""
+
+    def test_split_packets(self):
+        payloads = [b"a" * 10, b"", b"b" * 100, b"c" * 3]
+        data = b"".join(packet_encode(payload, None) for payload in payloads)
+        for chunk_size in (1, 3, 7, 50, len(data)):
+            stream = Stream(data[start:start + chunk_size] for start in range(0, len(data), chunk_size))
+            self.assertEqual(read_all(FrameReader(size=32), stream), payloads, "chunks of %s" % chunk_size)
+
+    def test_text_and_compressed_packets(self):
+        data = packet_encode("text", None) + packet_encode(b"x" * 1000, True)
+        self.assertEqual(read_all(FrameReader(size=64), Stream([data])), ["text", b"x" * 1000])
+
+    def test_packets_larger_than_the_buffer(self):
+        payloads = [b"small", bytes(range(256)) * 40, b"after"]
+        data = b"".join(packet_encode(payload, None) for payload in payloads)
+        stream = Stream(data[start:start + 1000] for start in range(0, len(data), 1000))
+        self.assertEqual(read_all(FrameReader(size=64), stream), payloads)
+
+    def test_oversized_packets_are_refused(self):
+        reader = FrameReader(size=64, max_packet_size=100)
+        reader.read(Stream([packet_encode(b"y" * 101, None)]))
+        self.assertRaises(ValueError, reader.next_frame)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""tests of the network codecs and the snapshots"""
+import unittest
+
+from pyrunner_classes.network_shared import Action, Message, Snapshot, JsonCodec, BinaryCodec, ProtocolError
+
+STATES = (True, False, False, False, 0.5, -1.0, "R")
+PLAYER = (1, (128, 96, 2), False, STATES)
+BOT = (3, False, True, (False, True, False, True, 0.0, 0.0, "Trapped"))
+
+'''message type -> data, every codec has to return the same data'''
+MESSAGES = {
+    Message.type_client_dc: {'client_id': 2},
+    Message.type_key_update: {'key': Action.DIG_LEFT, 'player_id': 1, 'seq': 70000},
+    Message.type_bot_update: {'key': Action.UP, 'bot_id': 4},
+    Message.type_init: {'player_id': 1},
+    Message.type_init_data: {'level': './resources/levels/level1.tmx', 'players': [], 'player_id': 0,
+                             Message.field_removed_sprites: [[3, 4]]},
+    Message.type_comp_update: {'player_info': PLAYER, 'block_info': [((5, 7), "2020-01-01T10:00:01.500000")]},
+    Message.type_comp_update_set: {'player_info': BOT, 'block_info': []},
+    Message.type_level_changed: {Message.field_level_name: './resources/levels/level2.tmx'},
+    Message.type_gold_removed: (12, 3),
+    Message.type_player_killed: 1,
+    Message.type_snapshot_ack: 123456,
+    Message.type_keep_alive: None,
+    Message.type_lockstep_start: {'tick': 1, 'seed': 4242, 'players': 2, 'hash': 3735928559,
+                                  'level': './resources/levels/level1.tmx'},
+    Message.type_lockstep_input: {'tick': 9, 'player_id': 1, 'hash': 123, 'keys': [Action.LEFT, Action.DIG_RIGHT]},
+    Message.type_lockstep_tick: {'tick': 7, 'inputs': [(Action.LEFT, None), (Action.UP, 1)]},
+    Message.type_lockstep_desync: 7,
+}
+
+
+def plain(data):
+    """the data with lists instead of tuples, json only knows lists"""
+    if isinstance(data, (list, tuple)):
+        return [plain(item) for item in data]
+    if isinstance(data, dict):
+        return dict((key, plain(value)) for key, value in data.items())
+    return data
+
+
+def round_trip(message_type, data):
+    """encode and decode with every codec, yields the codec and the decoded type and data"""
+    for codec in (BinaryCodec(), JsonCodec()):
+        decoded_type, decoded = codec.decode(codec.encode(message_type, data))
+        yield codec, decoded_type, decoded
+
+
+class CodecTest(unittest.TestCase):
+    """every message has to arrive as it was sent"""
+
+    def test_round_trips(self):
+        for message_type, data in MESSAGES.items():
+            for codec, decoded_type, decoded in round_trip(message_type, data):
+                self.assertEqual(decoded_type, message_type)
+                self.assertEqual(plain(decoded), plain(data), "%s with %s" % (message_type, codec.name))
+
+    def test_binary_messages_are_compact(self):
+        codec = BinaryCodec()
+        self.assertEqual(len(codec.encode(Message.type_key_update, MESSAGES[Message.type_key_update])), 9)
+        self.assertEqual(len(codec.encode(Message.type_keep_alive)), 2)
+
+    def test_broken_messages(self):
+        codec = BinaryCodec()
+        encoded = codec.encode(Message.type_key_update, MESSAGES[Message.type_key_update])
+        self.assertRaises(ProtocolError, codec.decode, encoded[:-1])
+        self.assertRaises(ProtocolError, codec.decode, bytes([codec.VERSION + 1]) + encoded[1:])
+        self.assertRaises(ProtocolError, codec.decode, bytes([codec.VERSION, 250]))
+        self.assertRaises(ProtocolError, codec.encode, Message.type_key_update, {'key': "jump", 'player_id': 1})
+        self.assertRaises(ProtocolError, JsonCodec.decode, b"{not json")
+
+
+class SnapshotTest(unittest.TestCase):
+    """a delta applied to its base has to give the snapshot again, also after it went through a codec"""
+
+    def setUp(self):
+        self.base = Snapshot(10)
+        self.base.add_actor(PLAYER)
+        self.base.add_actor((2, (300, 96, 2), False, STATES))
+        self.base.add_actor(BOT)
+        self.base.blocks[(5, 7)] = "2020-01-01T10:00:01"
+        self.base.blocks[(6, 7)] = "2020-01-01T10:00:02"
+        self.base.gold.add((12, 3))
+        self.base.inputs[1] = (4, 9)
+
+        self.snapshot = Snapshot(11, dict(self.base.actors), dict(self.base.blocks), set(self.base.gold),
+                                 dict(self.base.inputs))
+        self.snapshot.add_actor((1, (132, 96, 2), False, STATES))
+        '''player 2 left and the block 6/7 got restored'''
+        del self.snapshot.actors[(False, 2)]
+        del self.snapshot.blocks[(6, 7)]
+        self.snapshot.blocks[(8, 7)] = "2020-01-01T10:00:03"
+        self.snapshot.gold.add((1, 1))
+        self.snapshot.inputs[1] = (5, 11)
+
+    def assert_same(self, snapshot, expected):
+        """the same actors, blocks, gold and inputs"""
+        self.assertEqual(snapshot.tick, expected.tick)
+        self.assertEqual(plain(snapshot.actors), plain(expected.actors))
+        self.assertEqual(sorted(snapshot.blocks), sorted(expected.blocks))
+        self.assertEqual(snapshot.gold, expected.gold)
+        self.assertEqual(snapshot.inputs, expected.inputs)
+
+    def test_delta_and_apply(self):
+        delta = self.snapshot.delta(self.base)
+        self.assertEqual(delta['removed_actors'], [(False, 2)])
+        self.assertEqual(delta['restored_blocks'], [(6, 7)])
+        self.assertEqual(len(delta['actors']), 1)
+        for codec, decoded_type, decoded in round_trip(Message.type_snapshot, delta):
+            self.assert_same(self.base.apply(decoded), self.snapshot)
+
+    def test_full_snapshot(self):
+        delta = self.snapshot.delta(Snapshot())
+        for codec, decoded_type, decoded in round_trip(Message.type_snapshot, delta):
+            self.assert_same(Snapshot().apply(decoded), self.snapshot)
+
+    def test_unchanged_snapshot(self):
+        self.assertTrue(Snapshot.is_empty(self.base.delta(self.base)))
+        self.assertFalse(Snapshot.is_empty(self.snapshot.delta(self.base)))
+        self.assertFalse(Snapshot.is_empty(Snapshot(12).delta(self.base)))
+
+
+if __name__ == '__main__':
+    unittest.main()
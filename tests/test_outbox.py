@@ -0,0 +1,36 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""tests of the message queues the server keeps for every client"""
+import unittest
+
+from pyrunner_classes.network_server import Outbox, Server
+from pyrunner_classes.network_shared import Message
+
+
+class OutboxTest(unittest.TestCase):
+    """superseded messages and the policies for clients that can't keep up"""
+
+    def test_newer_snapshots_replace_waiting_ones(self):
+        outbox = Outbox(10, Server.POLICY_DISCONNECT)
+        outbox.put(Message.type_snapshot, b"snapshot 1")
+        outbox.put(Message.type_key_update, b"key")
+        outbox.put(Message.type_snapshot, b"snapshot 2")
+        self.assertEqual(list(outbox.messages), [(Message.type_key_update, b"key"),
+                                                 (Message.type_snapshot, b"snapshot 2")])
+        self.assertEqual(outbox.dropped, 1)
+
+    def test_disconnect_policy(self):
+        outbox = Outbox(3, Server.POLICY_DISCONNECT)
+        self.assertTrue(all(outbox.put(Message.type_key_update, b"key") for _ in range(3)))
+        self.assertFalse(outbox.put(Message.type_key_update, b"key"))
+
+    def test_drop_oldest_policy(self):
+        outbox = Outbox(3, Server.POLICY_DROP_OLDEST)
+        for number in range(5):
+            self.assertTrue(outbox.put(Message.type_key_update, number))
+        self.assertEqual([encoded for message_type, encoded in outbox.messages], [2, 3, 4])
+        self.assertEqual(outbox.dropped, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""tests of the precomputed path table and its cache"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyrunner_classes.dijkstra import Graph
+from pyrunner_classes.path_table import PathTable, TABLE_EXT
+from tests.test_dijkstra import random_graph
+
+
+class PathTableTest(unittest.TestCase):
+    """the table against the graph search and the cache next to the level file"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.level_path = os.path.join(self.directory, "level.tmx")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assert_same_paths(self, table, graph, nodes):
+        """every path of the table is as long as the one the graph finds"""
+        for origin in nodes:
+            for destination in nodes:
+                try:
+                    expected = graph.shortest_path(origin, destination)[0]
+                except KeyError:
+                    self.assertRaises(KeyError, table.shortest_path, origin, destination)
+                    continue
+                length, path = table.shortest_path(origin, destination)
+                self.assertEqual(length, expected)
+                self.assertEqual((path[0], path[-1]), (origin, destination))
+
+    def test_build_save_and_load(self):
+        graph, edges = random_graph(8, 6, 2)
+        nodes = [graph.tile(index) for index in range(graph.size) if graph.nodes[index]]
+        built = PathTable.load_or_build(graph, self.level_path)
+        self.assert_same_paths(built, graph, nodes)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, "level" + TABLE_EXT)))
+
+        loaded = PathTable(graph)
+        self.assertTrue(loaded.load(os.path.join(self.directory, "level" + TABLE_EXT)))
+        self.assertEqual(loaded.next_hop, built.next_hop)
+        self.assertEqual(loaded.distance, built.distance)
+
+    def test_cache_of_another_graph_is_ignored(self):
+        graph, edges = random_graph(8, 6, 3)
+        PathTable.load_or_build(graph, self.level_path)
+        other, edges = random_graph(8, 6, 4)
+        self.assertFalse(PathTable(other).load(os.path.join(self.directory, "level" + TABLE_EXT)))
+
+    def test_too_big_levels_get_no_table(self):
+        graph = Graph(300, 300)
+        graph.add_edge((0, 0), (1, 0), 1)
+        self.assertIsNone(PathTable.load_or_build(graph, self.level_path))
+
+        graph = Graph(100, 1)
+        for x in range(99):
+            graph.add_edge((x, 0), (x + 1, 0), 1000)
+        self.assertIsNone(PathTable.load_or_build(graph, self.level_path))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "level" + TABLE_EXT)))
+
+
+if __name__ == '__main__':
+    unittest.main()
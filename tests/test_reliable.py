@@ -0,0 +1,59 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""tests of the reliability layer of the udp transport"""
+import random
+import time
+import unittest
+
+from libs.Mastermind._mm_reliable import MastermindReliableChannel
+
+
+class ReliableChannelTest(unittest.TestCase):
+    """two channels that talk over a network losing, duplicating and reordering datagrams"""
+
+    def setUp(self):
+        self.sender = MastermindReliableChannel(resend_time=0.1)
+        self.receiver = MastermindReliableChannel(resend_time=0.1)
+        self.random = random.Random(11)
+
+    def deliver(self, packets, channel, loss=0.3):
+        """unwrap what the network lets through, returns the payloads for the application"""
+        packets = [packet for packet in packets if self.random.random() >= loss]
+        packets += [packet for packet in packets if self.random.random() < 0.1]
+        self.random.shuffle(packets)
+        payloads = []
+        for packet in packets:
+            payloads.extend(channel.unwrap(packet)[0])
+        return payloads
+
+    def test_reliable_messages_arrive_once_and_in_order(self):
+        messages = [("message %s" % number).encode() for number in range(40)]
+        packets = [self.sender.wrap(message, True) for message in messages]
+        received = self.deliver(packets, self.receiver)
+
+        '''the channels take the send times from the clock, the test runs its own clock ahead of it'''
+        now = start = time.time()
+        while self.sender.unacked:
+            now += 1.0
+            '''the acknowledgements can get lost as well, the sender resends until it got one'''
+            self.deliver(self.receiver.due(now), self.sender)
+            received += self.deliver(self.sender.due(now), self.receiver)
+            self.assertLess(now - start, 200, "the messages never got acknowledged")
+
+        self.assertEqual(received, messages)
+
+    def test_sequenced_messages_drop_older_ones(self):
+        first = self.sender.wrap(b"position 1")
+        second = self.sender.wrap(b"position 2")
+        self.assertEqual(self.receiver.unwrap(second)[0], [b"position 2"])
+        self.assertEqual(self.receiver.unwrap(first)[0], [])
+        self.assertEqual(self.receiver.unwrap(second)[0], [])
+
+    def test_close(self):
+        payloads, closed = self.receiver.unwrap(self.sender.close_packet())
+        self.assertEqual(payloads, [])
+        self.assertTrue(closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
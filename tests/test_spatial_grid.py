@@ -0,0 +1,58 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""tests of the tile indexed spatial grid"""
+import random
+import unittest
+
+from pygame import Rect
+
+from pyrunner_classes.spatial_grid import SpatialGrid
+
+
+class Sprite(object):
+    """just a rect, like the world objects the grid stores"""
+
+    def __init__(self, x, y, width=32, height=32):
+        self.rect = Rect(x, y, width, height)
+
+
+class SpatialGridTest(unittest.TestCase):
+    """the queries against checking every sprite"""
+
+    def setUp(self):
+        generator = random.Random(7)
+        self.grid = SpatialGrid(32, 32, 10, 20)
+        self.sprites = [Sprite(generator.randrange(0, 640), generator.randrange(0, 480),
+                               generator.choice((32, 16, 48)), generator.choice((32, 8, 64))) for _ in range(80)]
+        for sprite in self.sprites:
+            self.grid.add(sprite)
+
+    def expected(self, rect):
+        """what spritecollide would find"""
+        return [sprite for sprite in self.sprites if sprite.rect.colliderect(rect)]
+
+    def test_rect_and_point_queries(self):
+        generator = random.Random(8)
+        for _ in range(200):
+            rect = Rect(generator.randrange(0, 640), generator.randrange(0, 480),
+                        generator.randrange(1, 80), generator.randrange(1, 80))
+            self.assertEqual(self.grid.sprites_in_rect(rect), self.expected(rect))
+            x, y = rect.topleft
+            found = [sprite for sprite in self.sprites if sprite.rect.collidepoint(x, y)]
+            self.assertEqual(self.grid.sprite_at(x, y), found[0] if found else None)
+
+    def test_moved_and_removed_sprites(self):
+        for sprite in self.sprites[::3]:
+            sprite.rect.move_ip(37, -21)
+            self.grid.move(sprite)
+        removed = self.sprites[1::4]
+        for sprite in removed:
+            self.grid.remove(sprite)
+        self.sprites = [sprite for sprite in self.sprites if sprite not in removed]
+        everything = Rect(-100, -100, 1000, 1000)
+        self.assertEqual(self.grid.sprites_in_rect(everything), self.expected(everything))
+        self.assertFalse(any(not sprites for sprites in self.grid.cells.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""tests of the tile flag matrix"""
+import unittest
+
+from pyrunner_classes.tile_map import TileMap, SOLID, REMOVABLE, COLLECTIBLE, WALKABLE
+
+
+class TileMapTest(unittest.TestCase):
+    """digging, restoring and the listeners"""
+
+    def setUp(self):
+        self.tile_map = TileMap(6, 4)
+        for x in range(6):
+            self.tile_map.add((x, 3), SOLID | REMOVABLE | WALKABLE)
+        self.tile_map.add((2, 1), COLLECTIBLE)
+        self.changes = []
+        self.tile_map.subscribe(lambda tile_id, removed: self.changes.append((tile_id, removed)))
+
+    def test_remove_and_restore(self):
+        self.tile_map.remove((3, 3))
+        self.assertEqual(self.tile_map.get((3, 3)), WALKABLE)
+        self.assertFalse(self.tile_map.has((3, 3), SOLID))
+        self.tile_map.restore((3, 3))
+        self.assertEqual(self.tile_map.get((3, 3)), SOLID | REMOVABLE | WALKABLE)
+        self.assertEqual(self.changes, [((3, 3), True), ((3, 3), False)])
+
+    def test_tiles_outside_of_the_level(self):
+        self.tile_map.remove((6, 3))
+        self.tile_map.set((-1, 0), SOLID)
+        self.assertEqual(self.tile_map.get((6, 3)), 0)
+        self.assertEqual(self.tile_map.get(None), 0)
+        self.assertEqual(self.changes, [])
+
+    def test_column_queries(self):
+        self.assertTrue(self.tile_map.any_in_column(2, 0, 4, COLLECTIBLE))
+        self.assertFalse(self.tile_map.any_in_column(2, 2, 4, COLLECTIBLE))
+        self.assertFalse(self.tile_map.any_in_column(2, 3, 3, SOLID))
+        self.assertFalse(self.tile_map.any_in_column(9, 0, 4, SOLID))
+        self.tile_map.clear((2, 1), COLLECTIBLE)
+        self.assertEqual(int(self.tile_map.mask(COLLECTIBLE).sum()), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()